@@ -87,11 +87,12 @@ def _create_first_db_data():
 
     from MyLists.models.user_models import User
     from datetime import datetime
-    from MyLists.scheduled_tasks.scheduled_tasks import compute_media_time_spent
     from MyLists.models.utils_models import Badges, Ranks
+    from MyLists.classes.Search_index import SearchIndex
 
     # Create all DB tables - does not update existing tables
     db.create_all()
+    SearchIndex.create_tables(db.session.connection())
 
     # Create an <admin>, a <manager> and a <user> if <admin> does not exist
     if User.query.filter_by(id="1").first() is None:
@@ -130,10 +131,9 @@ def _create_first_db_data():
         Badges.add_badges_to_db()
         Ranks.add_ranks_to_db()
 
-    # Refresh badges, ranks and compute time spent for each user
+    # Refresh badges and ranks (the time spent is kept up to date by the time spent ledger)
     Badges.refresh_db_badges()
     Ranks.refresh_db_ranks()
-    compute_media_time_spent()
 
     # Commit changes
     db.session.commit()
@@ -102,6 +102,8 @@ def delete_account():
     from MyLists.models.user_models import followers
     from MyLists.models.user_models import UserLastUpdate
     from MyLists.models.user_models import Notifications
+    from MyLists.models.user_models import TimeSpentLedger
+    from MyLists.classes.Global_stats import GlobalStats
     from MyLists.utils.utils import get_models_type
 
     admin_token = request.cookies.get("admin_token")
@@ -128,11 +130,15 @@ def delete_account():
         # Delete all user's notifications
         Notifications.query.filter_by(user_id=user_id).delete()
 
+        # Delete user's time spent ledger
+        TimeSpentLedger.query.filter_by(user_id=user_id).delete()
+
         # Get models using <media_type>
         models_list = get_models_type("List")
 
-        # Delete all media entries associated with user
+        # Delete all media entries associated with user (and remove them from the global stats)
         for model in models_list:
+            GlobalStats().track_entries(model.GROUP, -1, model.user_id == user_id)
             model.query.filter_by(user_id=user_id).delete()
 
         db.session.commit()
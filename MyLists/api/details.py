@@ -1,20 +1,42 @@
-import secrets
-from pathlib import Path
-from urllib.request import urlretrieve
-from PIL import Image
-from PIL.Image import Resampling
 from flask import current_app
 from flask import request, jsonify, Blueprint, abort
+from sqlalchemy.exc import IntegrityError
 from MyLists import db
 from MyLists.api.auth import token_auth, current_user
 from MyLists.classes.API_data import ApiData
+from MyLists.classes.Cover_pipeline import cover_pipeline
+from MyLists.classes.Search_index import SearchIndex
+from MyLists.classes.Global_stats import GlobalStats
 from MyLists.scheduled_tasks.media_refresher import refresh_element_data
 from MyLists.utils.decorators import validate_media_type
 from MyLists.utils.enums import MediaType, RoleType
+from MyLists.utils.rate_limiter import RateLimitExceeded
+from MyLists.utils.single_flight import SingleFlight
 from MyLists.utils.utils import get_models_group
 
 details_bp = Blueprint("api_details", __name__)
 
+# Coalesce the concurrent first-time imports of the same media
+media_imports = SingleFlight()
+
+
+def _import_media(media_type: MediaType, api_id: int) -> int:
+    """ Import a new media from its API and return its ID. If another worker imported it in the meantime, the unique
+    <api_id> constraint fails and the existing media is used instead """
+
+    media_class = get_models_group(media_type)[0]
+
+    try:
+        media = ApiData.get_API_class(media_type)(API_id=api_id).save_media_to_db()
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        media = media_class.query.filter_by(api_id=api_id).first()
+        if not media:
+            raise
+
+    return media.id
+
 
 @details_bp.route("/details/<media_type>/<media_id>", methods=["GET"])
 @token_auth.login_required
@@ -28,10 +50,11 @@ def media_details(media_type: MediaType, media_id: int):
     if is_search:
         media = media_class.query.filter_by(api_id=media_id).first()
         if not media:
-            API_class = ApiData.get_API_class(media_type)
             try:
-                media = API_class(API_id=media_id).save_media_to_db()
-                db.session.commit()
+                new_media_id = media_imports.do((media_type, media_id), _import_media, media_type, media_id)
+                media = media_class.query.filter_by(id=new_media_id).first()
+            except RateLimitExceeded:
+                raise
             except Exception as e:
                 current_app.logger.error(f"Error trying to add ({media_type.value}) ID [{media_id}] to DB: {e}")
                 return {"message": "Sorry, an error occurred loading the media info. Please try again later."}, 400
@@ -62,7 +85,7 @@ def media_details_form(media_type: MediaType, media_id: int):
         return abort(403)
 
     # Get models using <media_type>
-    media_class, _, media_genre, *_ = get_models_group(media_type)
+    media_class, media_list, media_genre, *_ = get_models_group(media_type)
 
     # Get <media> and check if exists
     media = media_class.query.filter_by(id=media_id).first()
@@ -90,10 +113,6 @@ def media_details_form(media_type: MediaType, media_id: int):
     except:
         return abort(400)
 
-    # Add genres if BOOKS
-    if media_type == MediaType.BOOKS and (len(data.get("genres", []) or [])) != 0:
-        media_genre.replace_genres(data["genres"], media.id)
-
     # Suppress all non-allowed fields
     try:
         updates = {k: v for (k, v) in data.items() if k in forms_fields}
@@ -101,30 +120,36 @@ def media_details_form(media_type: MediaType, media_id: int):
     except:
         return abort(400)
 
-    # Check media cover update
-    if updates["image_cover"] == "":
-        picture_fn = media.image_cover
-    else:
-        picture_fn = secrets.token_hex(8) + ".jpg"
-        picture_path = Path(current_app.root_path, f"static/covers/{media_type.value}_covers", picture_fn)
-        try:
-            urlretrieve(f"{updates['image_cover']}", f"{picture_path}")
-            img = Image.open(f"{picture_path}")
-            img = img.resize((300, 450), Resampling.LANCZOS)
-            img.save(f"{picture_path}", quality=90)
-        except Exception as e:
-            current_app.logger.error(f"[ERROR] - occurred when updating the media cover with ID [{media.id}]: {e}")
-            picture_fn = media.image_cover
+    # The current cover is kept until the new one is processed
+    cover_url = updates.pop("image_cover")
+
+    # The edited fields may be counted in the global stats (director, genres): count the media entries again
+    stats = GlobalStats()
+    stats.track_entries(media_type, -1, media_list.media_id == media.id)
 
-    updates["image_cover"] = picture_fn
+    # Add genres if BOOKS
+    if media_type == MediaType.BOOKS and (len(data.get("genres", []) or [])) != 0:
+        media_genre.replace_genres(data["genres"], media.id)
 
     # Set new attributes
     for name, value in updates.items():
         setattr(media, name, value)
 
+    # Index the edited names again
+    SearchIndex.index_media(media_type, [media.id])
+
+    stats.track_entries(media_type, 1, media_list.media_id == media.id)
+
     # Commit changes
     db.session.commit()
 
+    # Check media cover update
+    if cover_url != "":
+        try:
+            cover_pipeline.submit(media_type, media.id, [cover_url])
+        except Exception as e:
+            current_app.logger.error(f"[ERROR] - occurred when updating the media cover with ID [{media.id}]: {e}")
+
     return jsonify(data={"message": "Media data successfully updated."})
 
 
@@ -1,6 +1,8 @@
-from flask import Blueprint
+import math
+from flask import Blueprint, current_app
 from sqlalchemy.exc import IntegrityError, SQLAlchemyError
-from werkzeug.exceptions import HTTPException, InternalServerError
+from werkzeug.exceptions import HTTPException, InternalServerError, TooManyRequests
+from MyLists.utils.rate_limiter import RateLimitExceeded
 
 errors = Blueprint("errors_api", __name__)
 
@@ -43,3 +45,18 @@ def sqlalchemy_error(error):
     )
 
     return data, 500
+
+
+@errors.app_errorhandler(RateLimitExceeded)
+def rate_limit_error(error):
+    """ Catch the exhausted rate budgets of the third-party APIs """
+
+    current_app.logger.warning(f"[WARNING] - {error}")
+
+    data = dict(
+        code=TooManyRequests.code,
+        message=TooManyRequests().name,
+        description="Too many requests to the media providers for now, please retry in a moment.",
+    )
+
+    return data, 429, {"Retry-After": str(math.ceil(error.retry_after))}
@@ -1,12 +1,14 @@
 from flask import Blueprint, jsonify, request, url_for, current_app
-from sqlalchemy import desc, select
+from sqlalchemy import desc, select, asc, func
 from MyLists import cache, db
 from MyLists.classes.API_data import ApiSeries, ApiMovies
+from MyLists.classes.Global_stats import GlobalStats
 from MyLists.api.auth import token_auth
-from MyLists.models.user_models import User
-from MyLists.models.utils_models import Ranks, MyListsStats, Frames
-from MyLists.utils.utils import get_models_type, get_media_level_and_time, display_time
+from MyLists.models.user_models import User, followers
+from MyLists.models.utils_models import Ranks, Frames
+from MyLists.utils.utils import get_models_type, display_time
 from MyLists.utils.enums import  RoleType
+from MyLists.utils.pagination import paginate
 
 general = Blueprint("api_general", __name__)
 
@@ -41,40 +43,39 @@ def current_trends():
 @token_auth.login_required
 def hall_of_fame():
     """ Hall of Fame information for all users """
-    # TODO: One day, find a better way because: ca dégoute.
 
-    # Fetch page in "GET"
+    # Fetch search in "GET"
     search = request.args.get("search", type=str)
-    page = request.args.get("page", 1, type=int)
 
-    # Rank users according to <profile_level>
+    # Rank all the users according to <profile_level> (before the search)
     # noinspection PyTypeChecker
-    users_ranked = (db.session.scalars(
-        select(User.username).where(User.active, User.role != RoleType.ADMIN)
-        .order_by(desc(User.profile_level))).all()
-    )
+    ranked = (select(User.id, func.rank().over(order_by=desc(User.profile_level)).label("rank"))
+              .where(User.active, User.role != RoleType.ADMIN).subquery())
 
-    # Query users
-    # noinspection PyTypeChecker
-    users = User.query.filter(User.active, User.role != RoleType.ADMIN, User.username.ilike(f"%{search}%"))\
-        .order_by(desc(User.profile_level)).paginate(page=page, per_page=10, error_out=True)
+    # Count the followers of the users
+    followers_count = (select(followers.c.followed_id, func.count().label("count"))
+                       .group_by(followers.c.followed_id).subquery())
+
+    # Query users with their rank and followers count (one query per page)
+    query = (db.session.query(User, ranked.c.rank, func.coalesce(followers_count.c.count, 0))
+             .join(ranked, ranked.c.id == User.id)
+             .outerjoin(followers_count, followers_count.c.followed_id == User.id)
+             .filter(User.username.ilike(f"%{search}%")))
+    users = paginate(query, [asc(ranked.c.rank), asc(User.id)], per_page=10, cache_key=f"hall_of_fame:{search}")
 
     # Get SQL models
     models_type = get_models_type("List")
 
     all_levels, users_serialized = [], []
-    for user in users.items:
-        user_dict = user.to_dict()
-        user_dict["rank"] = users_ranked.index(user.username) + 1
-        for model in models_type:
-            media_level = get_media_level_and_time(user, model.GROUP.value, only_level=True)
-            user_dict[f"{model.GROUP.value}_level"] = media_level
-            all_levels.append(media_level)
+    for user, rank, user_followers in users.items:
+        user_dict = user.to_dict(followers_count=user_followers)
+        user_dict["rank"] = rank
+        all_levels += [user_dict[f"{model.GROUP.value}_level"] for model in models_type]
         users_serialized.append(user_dict)
 
-    # Query media levels
-    ranks = Ranks.query.filter(Ranks.level.in_(all_levels), Ranks.type == "media_rank\n").all()
-    last_rank = Ranks.query.filter_by(level=149, type="media_rank\n").first()
+    # Query media levels (and the last one)
+    ranks = Ranks.query.filter(Ranks.level.in_(all_levels + [149]), Ranks.type == "media_rank\n").all()
+    last_rank = next((rank for rank in ranks if rank.level == 149), None)
 
     # For each user (serialized) again add <media_level> as attribute to <user> object
     for user in users_serialized:
@@ -93,6 +94,7 @@ def hall_of_fame():
         page=users.page,
         pages=users.pages,
         total=users.total,
+        next_cursor=users.next_cursor,
     )
 
     return jsonify(data=data)
@@ -100,11 +102,12 @@ def hall_of_fame():
 
 @general.route("/mylists_stats", methods=["GET"])
 @token_auth.login_required
+@cache.cached(timeout=300)
 def mylists_stats():
-    """ Get global MyLists stats. Actualized every day at 3:00 AM UTC+1 """
+    """ Get global MyLists stats. Read from the stats counters (kept up to date), cached 5 minutes """
 
-    # Get dict with all data from model
-    data = MyListsStats.get_all_stats()
+    # Get dict with all the stats
+    data = GlobalStats().get_all_stats()
 
     # Change total time to formatted string for display
     data["total_time"]["total"] = display_time(data["total_time"]["total"])
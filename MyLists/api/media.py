@@ -3,6 +3,7 @@ from flask import current_app
 from flask import jsonify, Blueprint, abort
 from MyLists import db
 from MyLists.api.auth import token_auth, current_user
+from MyLists.classes.Global_stats import GlobalStats
 from MyLists.models.user_models import UserLastUpdate, get_coming_next
 from MyLists.utils.decorators import media_endpoint_decorator
 from MyLists.utils.enums import MediaType, RoleType, Status
@@ -65,6 +66,9 @@ def add_media(media_id: int, media_type: MediaType, payload: Any, models: List[d
     in_list = models[1].query.filter_by(user_id=current_user.id, media_id=media_id).first()
     in_list.update_time_spent(new_value=new_watched)
 
+    # Add the new entry to the global stats
+    GlobalStats().track_entries(media_type, 1, models[1].id == in_list.id)
+
     # Commit changes
     db.session.commit()
 
@@ -94,6 +98,9 @@ def delete_media(media_id: int, media_type: MediaType, payload: Any, models: Lis
     # Add new time spent
     media.update_time_spent(old_value=old_total, new_value=0)
 
+    # Remove the entry from the global stats
+    GlobalStats().track_entries(media_type, -1, models[1].id == media.id)
+
     # Delete media from user list
     db.session.delete(media)
 
@@ -164,6 +171,9 @@ def update_status(media_id: int, media_type: MediaType, payload: Any, models: Li
     # Compute new time spent
     media.update_time_spent(old_value=old_total, new_value=new_total)
 
+    # Update the global stats
+    GlobalStats().track_status(media_type, media_id, old_status, new_status)
+
     # Commit changes
     db.session.commit()
     current_app.logger.info(f"[User {current_user.id}] {media_type}'s category [ID {media_id}] changed to {new_status}")
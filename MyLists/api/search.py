@@ -2,6 +2,7 @@ from flask import Blueprint, request, jsonify, abort, current_app
 from MyLists.classes.API_data import ApiTMDB, ApiGames, ApiBooks
 from MyLists.api.auth import token_auth
 from MyLists.models.user_models import User
+from MyLists.utils.rate_limiter import RateLimitExceeded
 
 search_bp = Blueprint("api_search", __name__)
 
@@ -35,6 +36,8 @@ def autocomplete():
     try:
         Api_data.search(search, page)
         results = Api_data.create_search_results()
+    except RateLimitExceeded:
+        raise
     except Exception as e:
         current_app.logger.error(f"[ERROR] - Requesting the API: {e}")
         return abort(400)
@@ -7,8 +7,10 @@ from flask_bcrypt import generate_password_hash
 from MyLists import db
 from MyLists.api.auth import token_auth, current_user
 from MyLists.api.email import send_email
-from MyLists.models.user_models import (Notifications, UserLastUpdate, User, Token, followers)
+from MyLists.classes.Global_stats import GlobalStats
+from MyLists.models.user_models import (Notifications, UserLastUpdate, User, Token, followers, TimeSpentLedger)
 from MyLists.utils.enums import RoleType
+from MyLists.utils.pagination import paginate
 from MyLists.utils.utils import save_picture, get_models_type
 
 users = Blueprint("api_users", __name__)
@@ -159,17 +161,18 @@ def history(username: str):
 
     # Fetch request args
     search = request.args.get("search")
-    page = request.args.get("page", 1, type=int)
 
-    # Paginate query
-    history_query = (user.last_updates.filter(UserLastUpdate.media_name.ilike(f"%{search}%"))
-                     .paginate(page=page, per_page=25, error_out=True))
+    # Paginate query (offset with <page>, keyset with <cursor>)
+    history_query = paginate(user.last_updates.filter(UserLastUpdate.media_name.ilike(f"%{search}%")),
+                             [UserLastUpdate.date.desc(), UserLastUpdate.id.desc()], per_page=25,
+                             cache_key=f"history:{user.id}:{search}")
 
     data = dict(
         history=[hist_item.to_dict() for hist_item in history_query.items],
         active_page=history_query.page,
         pages=history_query.pages,
         total=history_query.total,
+        next_cursor=history_query.next_cursor,
     )
 
     return jsonify(data=data)
@@ -354,11 +357,15 @@ def delete_account():
         # Delete all user's notifications
         Notifications.query.filter_by(user_id=current_user.id).delete()
 
+        # Delete user's time spent ledger
+        TimeSpentLedger.query.filter_by(user_id=current_user.id).delete()
+
         # Get models using <media_type>
         models_list = get_models_type("List")
 
-        # Delete all media entries associated with user
+        # Delete all media entries associated with user (and remove them from the global stats)
         for model in models_list:
+            GlobalStats().track_entries(model.GROUP, -1, model.user_id == current_user.id)
             model.query.filter_by(user_id=current_user.id).delete()
 
         db.session.commit()
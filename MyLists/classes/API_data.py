@@ -1,24 +1,18 @@
 import json
-import os.path
-import secrets
-from datetime import datetime
-from pathlib import Path
-from typing import Dict, List
-from urllib import request
-from urllib.request import urlretrieve, Request
-import requests
-from PIL import Image
-from PIL.Image import Resampling
+from datetime import datetime, timedelta
+from typing import Dict, List, Set
 from flask import url_for, current_app, abort
 from howlongtobeatpy import HowLongToBeat
-from ratelimit import sleep_and_retry, limits
 from MyLists import db
+from MyLists.classes.Cover_pipeline import cover_pipeline
+from MyLists.classes.Search_index import SearchIndex
 from MyLists.models.books_models import Books, BooksGenre, BooksAuthors
 from MyLists.models.games_models import Games, GamesCompanies, GamesPlatforms, GamesGenre
 from MyLists.models.movies_models import Movies, MoviesGenre, MoviesActors
 from MyLists.models.tv_models import (Series, SeriesGenre, SeriesActors, SeriesNetwork, SeriesEpisodesPerSeason,
                                       Anime, AnimeGenre, AnimeNetwork, AnimeEpisodesPerSeason, AnimeActors)
 from MyLists.utils.enums import MediaType
+from MyLists.utils.http_client import http_client
 from MyLists.utils.utils import get_subclasses, change_air_format, is_latin, clean_html_text
 
 
@@ -30,7 +24,6 @@ class ApiData:
     DURATION: int = 0
     GROUP: MediaType = None
     POSTER_BASE_URL: str = ""
-    LOCAL_COVER_PATH: str = ""
     API_KEY: str = ""
 
     def __init__(self, API_id: int = None):
@@ -41,6 +34,10 @@ class ApiData:
         self.media: db.Model = None
         self.media_details = {}
         self.all_data = {}
+        self.cover_job: Dict = None
+
+        # A refresh must not reuse the cached details (e.g. filled by the details page)
+        self.revalidate = False
 
     @classmethod
     def get_API_class(cls, media_type: MediaType):
@@ -58,16 +55,31 @@ class ApiData:
         self._from_API_to_dict()
         self._add_data_to_db()
 
+        # Add the media to the search index
+        SearchIndex.index_media(self.GROUP, [self.media.id])
+
+        # The media is saved with the placeholder, the cover is swapped once processed (after the caller's commit)
+        if self.cover_job:
+            cover_pipeline.submit_after_commit(self.GROUP, self.media.id, **self.cover_job)
+
         return self.media
 
     def update_media_data(self) -> Dict:
         """ Update the media data and return a dict containing the data """
 
+        self.revalidate = True
         self._get_details_and_credits_data()
         self._from_API_to_dict(updating=True)
+        self._keep_cover_until_processed()
 
         return self.all_data
 
+    def _keep_cover_until_processed(self):
+        """ A refreshed media keeps its current cover, the new one is queued by the caller with the <cover_job> """
+
+        self.all_data["media_data"].pop("image_cover", None)
+        self.all_data["cover_job"] = self.cover_job
+
     def _get_details_and_credits_data(self):
         """ Overwritten in inherited class """
         raise NotImplementedError("Subclasses must implement this method.")
@@ -89,18 +101,47 @@ class ApiTMDB(ApiData):
     MAX_RESULTS = 20
     RESULTS_PER_PAGE = 7
     MAX_ACTORS = 5
+    CHANGES_MAX_DAYS = 14
 
     def __init__(self, API_id: int = None):
         super().__init__(API_id)
 
         self.API_id = API_id
 
+    def _get_changed_ids(self, media: str, start_date: datetime, end_date: datetime) -> Set[int]:
+        """ Walk all the pages of the TMDB change feed of <media> ("tv" or "movie") between <start_date> and
+        <end_date>. The TMDB API only accepts windows of <CHANGES_MAX_DAYS> days, so longer ranges are split """
+
+        changed_ids = set()
+        window_start = start_date
+        while True:
+            window_end = min(window_start + timedelta(days=self.CHANGES_MAX_DAYS), end_date)
+
+            page, total_pages = 1, 1
+            while page <= total_pages:
+                params = dict(api_key=self.API_KEY, page=page, start_date=window_start.strftime("%Y-%m-%d"),
+                              end_date=window_end.strftime("%Y-%m-%d"))
+                response = http_client.get(f"https://api.themoviedb.org/3/{media}/changes", params=params,
+                                           rate_limit="tmdb")
+                response.raise_for_status()
+
+                data = response.json()
+                changed_ids.update(result["id"] for result in data.get("results", []))
+                total_pages = data.get("total_pages") or 1
+                page += 1
+
+            if window_end >= end_date:
+                break
+            window_start = window_end
+
+        return changed_ids
+
     def search(self, query: str, page: int = 1):
         """ Search in the TMDB API (series, anime, and movies) """
 
         # Make API call
         url = f"https://api.themoviedb.org/3/search/multi?api_key={self.API_KEY}&query={query}&page={page}"
-        self.API_data = requests.get(url, timeout=10).json()
+        self.API_data = http_client.get(url, cache="search", rate_limit="tmdb").json()
 
     def create_search_results(self) -> Dict:
         """ Create the search results dict from the search """
@@ -190,31 +231,14 @@ class ApiTMDB(ApiData):
 
         return actors_list
 
-    def _save_api_cover(self, cover_path: str, cover_name: str):
-        """ Save the media (Series, Anime or Movies) cover to the local server disk """
-
-        # Get cover from url
-        urlretrieve(f"{self.POSTER_BASE_URL}{cover_path}", f"{self.LOCAL_COVER_PATH}/{cover_name}")
-
-        # Resize and save using PIL
-        with Image.open(f"{self.LOCAL_COVER_PATH}/{cover_name}") as img:
-            img = img.resize((300, 450), Resampling.LANCZOS)
-            img.save(f"{self.LOCAL_COVER_PATH}/{cover_name}", quality=90)
-
     def _get_media_cover(self) -> str:
-        """ Create a name for the media image cover or fallback on the default.jpg """
+        """ Prepare the cover job of the media and return the placeholder (the default.jpg is kept without poster) """
 
-        cover_name = "default.jpg"
         cover_path = self.API_data.get("poster_path") or None
         if cover_path:
-            cover_name = f"{secrets.token_hex(8)}.jpg"
-            try:
-                self._save_api_cover(cover_path, cover_name)
-            except Exception as e:
-                current_app.logger.error(f"[ERROR] - Trying to recover the cover: {e}")
-                cover_name = "default.jpg"
+            self.cover_job = dict(urls=[f"{self.POSTER_BASE_URL}{cover_path}"])
 
-        return cover_name
+        return cover_pipeline.PLACEHOLDER
 
 
 class ApiTV(ApiTMDB):
@@ -222,20 +246,17 @@ class ApiTV(ApiTMDB):
 
     MAX_NETWORK = 4
 
-    def get_changed_data(self) -> Dict:
-        """ Fetch the IDs that changed in the last 24h from the TMDB API for Series and Anime """
-
-        # Make API call and return results
-        url = f"https://api.themoviedb.org/3/tv/changes?api_key={self.API_KEY}"
-
-        return requests.get(url, timeout=10).json()
+    def get_changed_ids(self, start_date: datetime, end_date: datetime) -> Set[int]:
+        """ Fetch the IDs that changed between <start_date> and <end_date> from the TMDB API for Series and Anime """
+        return self._get_changed_ids("tv", start_date, end_date)
 
     def _get_details_and_credits_data(self):
         """ Get the details and credits for a Series or an Anime from the TMDB API """
 
         # API call
-        response = requests.get(f"https://api.themoviedb.org/3/tv/{self.API_id}?api_key={self.API_KEY}"
-                                f"&append_to_response=credits", timeout=15)
+        response = http_client.get(f"https://api.themoviedb.org/3/tv/{self.API_id}?api_key={self.API_KEY}"
+                                   f"&append_to_response=credits", cache="details", rate_limit="tmdb",
+                                   revalidate=self.revalidate)
 
         if not response.ok:
             resp_json = response.json()
@@ -343,7 +364,6 @@ class ApiSeries(ApiTV):
 
     DURATION = 40
     GROUP = MediaType.SERIES
-    LOCAL_COVER_PATH = Path(current_app.root_path, "static/covers/series_covers/")
     MAX_TRENDING = 12
 
     def get_and_format_trending(self) -> List[Dict]:
@@ -351,7 +371,7 @@ class ApiSeries(ApiTV):
 
         # Make API call
         url = f"https://api.themoviedb.org/3/trending/tv/week?api_key={self.API_KEY}"
-        API_data = requests.get(url, timeout=10).json()
+        API_data = http_client.get(url).json()
         results = API_data.get("results", [])
 
         tv_results = []
@@ -414,17 +434,15 @@ class ApiAnime(ApiTV):
 
     DURATION = 24
     GROUP = MediaType.ANIME
-    LOCAL_COVER_PATH = Path(current_app.root_path, "static/covers/anime_covers/")
 
     @staticmethod
-    @sleep_and_retry
-    @limits(calls=1, period=4)
     def api_anime_search(anime_name: str):
         """ Fetch the anime name from the TMDB API to the Jikan API. Then use the Jikan API to get more accurate
         genres with the <get_anime_genres> method """
 
         # Api call
-        response = requests.get(f"https://api.jikan.moe/v4/anime?q={anime_name}", timeout=10)
+        response = http_client.get(f"https://api.jikan.moe/v4/anime?q={anime_name}", cache="jikan",
+                                   rate_limit="jikan")
 
         # Raise for status
         response.raise_for_status()
@@ -493,27 +511,18 @@ class ApiMovies(ApiTMDB):
     """ TMDB API class specifically for the Movies """
 
     GROUP = MediaType.MOVIES
-    LOCAL_COVER_PATH = Path(current_app.root_path, "static/covers/movies_covers")
     MAX_TRENDING = 12
 
-    def get_changed_data(self) -> Dict:
-        """ Get the movies changed ID from TMDB to update the database. Used in scheduled-tasks. """
-
-        # API call
-        response = requests.get(f"https://api.themoviedb.org/3/movie/changes?api_key={self.API_KEY}", timeout=15)
-
-        # Raise for status
-        response.raise_for_status()
-
-        # Return text as json
-        return json.loads(response.text)
+    def get_changed_ids(self, start_date: datetime, end_date: datetime) -> Set[int]:
+        """ Get the movies changed IDs between <start_date> and <end_date> from TMDB. Used in scheduled-tasks. """
+        return self._get_changed_ids("movie", start_date, end_date)
 
     def get_and_format_trending(self) -> List[Dict]:
         """ Fetch and format <MAX_TRENDING> trending Series obtained from the TMDB API """
 
         # Make API call
         url = f"https://api.themoviedb.org/3/trending/movie/week?api_key={self.API_KEY}"
-        API_data = requests.get(url, timeout=10).json()
+        API_data = http_client.get(url).json()
         results = API_data.get("results", [])
 
         movies_results = []
@@ -544,8 +553,9 @@ class ApiMovies(ApiTMDB):
         """ Get the details and credits data for a Movie from TMDB API """
 
         # API call
-        response = requests.get(f"https://api.themoviedb.org/3/movie/{self.API_id}?api_key={self.API_KEY}"
-                                f"&append_to_response=credits", timeout=15)
+        response = http_client.get(f"https://api.themoviedb.org/3/movie/{self.API_id}?api_key={self.API_KEY}"
+                                   f"&append_to_response=credits", cache="details", rate_limit="tmdb",
+                                   revalidate=self.revalidate)
 
         if not response.ok:
             resp_json = response.json()
@@ -621,8 +631,12 @@ class ApiGames(ApiData):
     """ IGDB API class specifically for the Games """
 
     GROUP = MediaType.GAMES
-    LOCAL_COVER_PATH = Path(current_app.root_path, "static/covers/games_covers/")
     POSTER_BASE_URL = "https://images.igdb.com/igdb/image/upload/t_1080p/"
+    BULK_LIMIT = 500
+    DETAILS_FIELDS = ("name, cover.image_id, collection.name, game_engines.name, game_modes.name, platforms.name, "
+                      "genres.name, player_perspectives.name, total_rating, total_rating_count, first_release_date, "
+                      "involved_companies.company.name, involved_companies.developer, involved_companies.publisher, "
+                      "storyline, summary, themes.name, url, external_games.uid, external_games.category")
 
     def __init__(self, API_id: int = None):
         super().__init__(API_id)
@@ -636,8 +650,6 @@ class ApiGames(ApiData):
             "Authorization": f"Bearer {current_app.config['IGDB_API_KEY']}"
         }
 
-    @sleep_and_retry
-    @limits(calls=4, period=1)
     def search(self, query: str, page: int = 1):
         """ Search game using the IGDB API. <page> attribute unused, here for consistency """
 
@@ -647,7 +659,8 @@ class ApiGames(ApiData):
                 f'search "{query}";')
 
         # API call
-        response = requests.post("https://api.igdb.com/v4/games", data=data, headers=self.headers, timeout=10)
+        response = http_client.post("https://api.igdb.com/v4/games", data=data, headers=self.headers, cache="search",
+                                    rate_limit="igdb")
 
         # Raise for status
         response.raise_for_status()
@@ -687,7 +700,12 @@ class ApiGames(ApiData):
 
     @staticmethod
     def _get_HLTB_time(game_name: str) -> Dict:
-        """ Fetch the HLTB time using the HowLongToBeat scraping API """
+        """ Fetch the HLTB time using the HowLongToBeat scraping API (cached on disk) """
+        return http_client.cached_call("hltb", ApiGames._search_HLTB_time, game_name.lower())
+
+    @staticmethod
+    def _search_HLTB_time(game_name: str) -> Dict:
+        """ Search the HLTB time using the HowLongToBeat scraping API """
 
         # Get matching games in list
         games_list = HowLongToBeat().search(game_name.lower(), similarity_case_sensitive=False)
@@ -711,24 +729,54 @@ class ApiGames(ApiData):
 
         return data
 
-    def _get_details_and_credits_data(self):
-        """ Get details and credits data from IGDB API """
+    def _post_details_query(self, where: str, limit: int = 1) -> List[Dict]:
+        """ Post a details query to the IGDB API for the games matching the <where> clause """
 
         # Create body query for IGDB API
-        body = f"fields name, cover.image_id, collection.name, game_engines.name, game_modes.name, " \
-               f"platforms.name, genres.name, player_perspectives.name, total_rating, total_rating_count, " \
-               f"first_release_date, involved_companies.company.name, involved_companies.developer, " \
-               f"involved_companies.publisher, storyline, summary, themes.name, url, external_games.uid, " \
-               f"external_games.category; where id={self.API_id};"
+        body = f"fields {self.DETAILS_FIELDS}; where {where}; limit {limit};"
 
         # API call
-        response = requests.post("https://api.igdb.com/v4/games", data=body, headers=self.headers, timeout=15)
+        response = http_client.post("https://api.igdb.com/v4/games", data=body, headers=self.headers, cache="details",
+                                    rate_limit="igdb", revalidate=self.revalidate)
 
         # Raise for status
         response.raise_for_status()
 
+        return json.loads(response.text)
+
+    def _get_details_and_credits_data(self):
+        """ Get details and credits data from IGDB API """
+
         # Populate attribute
-        self.API_data = json.loads(response.text)[0]
+        self.API_data = self._post_details_query(f"id={self.API_id}")[0]
+
+    @classmethod
+    def bulk_update_media_data(cls, api_ids: List[int]) -> Dict[int, Dict]:
+        """ Fetch the games of <api_ids> using multi-ID queries of up to <BULK_LIMIT> games and return a dict
+        <api_id>: <all_data> (same format as <update_media_data>). Games not found or failing are left out """
+
+        api_ids = list(api_ids)
+        all_games_data = {}
+        for i in range(0, len(api_ids), cls.BULK_LIMIT):
+            chunk = api_ids[i:i + cls.BULK_LIMIT]
+            api = cls()
+            api.revalidate = True
+            results = api._post_details_query(f"id = ({','.join(str(api_id) for api_id in chunk)})", len(chunk))
+
+            # Split the response back into one <all_data> per game
+            for result in results:
+                game = cls(API_id=result["id"])
+                game.API_data = result
+                try:
+                    game._from_API_to_dict(updating=True)
+                    game._keep_cover_until_processed()
+                except Exception as e:
+                    current_app.logger.error(f"[ERROR] - While formatting the game with API ID = [{result['id']}]: {e}")
+                    continue
+
+                all_games_data[result["id"]] = game.all_data
+
+        return all_games_data
 
     def _from_API_to_dict(self, updating: bool = False):
         """ Transform API data to dict to add to database """
@@ -840,8 +888,8 @@ class ApiGames(ApiData):
         for platform in [{**item, "media_id": self.media.id} for item in self.all_data["platforms_data"]]:
             db.session.add(GamesPlatforms(**platform))
 
-    def _save_api_cover(self, cover_path: str, cover_name: str):
-        """ Save game cover using the IGDB API """
+    def _get_media_cover(self) -> str:
+        """ Prepare the game cover job and return the placeholder """
 
         # Create specific header
         headers = {"User-Agent": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.11 (KHTML, like Gecko) "
@@ -852,43 +900,17 @@ class ApiGames(ApiData):
                    "Accept-Language": "en-US,en;q=0.8",
                    "Connection": "keep-alive"}
 
-        # Create request
-        request_ = Request(url=f"{self.POSTER_BASE_URL}{cover_path}.jpg", headers=headers)
-
-        # Fetch response
-        response = request.urlopen(request_)
-
-        # Write cover to disk
-        f = open(f"{self.LOCAL_COVER_PATH}/{cover_name}", "wb")
-        f.write(response.read())
-        f.close()
-
-        # Resize image using PIL
-        img = Image.open(f"{self.LOCAL_COVER_PATH}/{cover_name}")
-        img = img.resize((300, 450), Resampling.LANCZOS)
-        img.save(f"{self.LOCAL_COVER_PATH}/{cover_name}", quality=90)
-
-    def _get_media_cover(self) -> str:
-        """ Get the game cover """
-
-        cover_name = "default.jpg"
-        cover_path = self.API_data.get("cover")["image_id"] or None
+        cover_path = (self.API_data.get("cover") or {}).get("image_id") or None
         if cover_path:
-            cover_name = f"{secrets.token_hex(8)}.jpg"
-            try:
-                self._save_api_cover(cover_path, cover_name)
-            except Exception as e:
-                current_app.logger.error(f"[ERROR] - Trying to fetch the game poster: {e}")
-                cover_name = "default.jpg"
+            self.cover_job = dict(urls=[f"{self.POSTER_BASE_URL}{cover_path}.jpg"], headers=headers)
 
-        return cover_name
+        return cover_pipeline.PLACEHOLDER
 
 
 class ApiBooks(ApiData):
     """ Google Books API class specifically for the Books """
 
     GROUP = MediaType.BOOKS
-    LOCAL_COVER_PATH = Path(current_app.root_path, "static/covers/books_covers/")
 
     def __init__(self, API_id: int = None):
         super().__init__(API_id)
@@ -897,8 +919,6 @@ class ApiBooks(ApiData):
         self.API_id = API_id
         self.default_path = url_for("static", filename="/covers/default.jpg")
 
-    @sleep_and_retry
-    @limits(calls=2, period=1)
     def search(self, query: str, page: int = 1):
         """ Search a book using the Google Books API. """
 
@@ -906,8 +926,8 @@ class ApiBooks(ApiData):
         offset = (page - 1) * 10
 
         # API call
-        response = requests.get(f"https://www.googleapis.com/books/v1/volumes?q={query}&startIndex={offset}",
-                                timeout=10)
+        response = http_client.get(f"https://www.googleapis.com/books/v1/volumes?q={query}&startIndex={offset}",
+                                   cache="search", rate_limit="google_books")
 
         # Raise for status
         response.raise_for_status()
@@ -950,13 +970,12 @@ class ApiBooks(ApiData):
 
         return data
 
-    @sleep_and_retry
-    @limits(calls=2, period=1)
     def _get_details_and_credits_data(self):
         """ Get details and credits for books """
 
         # API call
-        response = requests.get(f"https://www.googleapis.com/books/v1/volumes/{self.API_id}", timeout=10)
+        response = http_client.get(f"https://www.googleapis.com/books/v1/volumes/{self.API_id}", cache="details",
+                                   rate_limit="google_books", revalidate=self.revalidate)
 
         # Raise for status
         response.raise_for_status()
@@ -1015,52 +1034,16 @@ class ApiBooks(ApiData):
         for author in [{**item, "media_id": self.media.id} for item in self.all_data["authors_data"]]:
             db.session.add(BooksAuthors(**author))
 
-    def _save_api_cover(self, cover_path: str, cover_name: str):
-        """ Save API book cover to the local disk """
-
-        # Retrieve cover
-        urlretrieve(f"{cover_path}", f"{self.LOCAL_COVER_PATH}/{cover_name}")
-
-        # Resize and save with PIL
-        img = Image.open(f"{self.LOCAL_COVER_PATH}/{cover_name}")
-        img = img.resize((300, 450), Resampling.LANCZOS)
-        img.save(f"{self.LOCAL_COVER_PATH}/{cover_name}", quality=90)
-
     def _get_media_cover(self) -> str:
-        """ Get media cover, from Google Books API or using Google Image script in /static """
+        """ Prepare the book cover job (Google Books API, or the Google Image script in /static as fallback) and return
+        the placeholder """
 
-        cover_name = f"{secrets.token_hex(8)}.jpg"
-        try:
-            self._save_api_cover(self.API_data["imageLinks"]["medium"], cover_name)
-        except:
-            try:
-                self._save_api_cover(self.API_data["imageLinks"]["large"], cover_name)
-            except:
-                from MyLists.static.books_img_ddl.books import GoogleImages
-
-                # Get google image class
-                book_image_ddl = GoogleImages()
-
-                # Get arguments
-                arguments = dict(
-                    keywords=f"cover {self.API_data['title']} {self.API_data['authors'][0]}",
-                    output_directory=str(self.LOCAL_COVER_PATH),
-                    size="medium",
-                )
-
-                try:
-                    # Try to download image from arguments
-                    all_paths = book_image_ddl.download(arguments)
-                    path = all_paths[0]["image"][-1]
-
-                    # Resize and save image with PIL
-                    img = Image.open(path)
-                    img = img.resize((300, 450), Resampling.LANCZOS)
-                    img.save(path)
+        image_links = self.API_data.get("imageLinks") or {}
+        authors = self.API_data.get("authors") or [""]
 
-                    # Get cover name
-                    cover_name = os.path.basename(path)
-                except:
-                    cover_name = "default.jpg"
+        self.cover_job = dict(
+            urls=[image_links[size] for size in ("medium", "large") if image_links.get(size)],
+            fallback_keywords=f"cover {self.API_data.get('title', '')} {authors[0]}",
+        )
 
-        return cover_name
+        return cover_pipeline.PLACEHOLDER
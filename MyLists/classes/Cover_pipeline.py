@@ -0,0 +1,244 @@
+import os
+import queue
+import tempfile
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from io import BytesIO
+from pathlib import Path
+from typing import BinaryIO, Dict, List, Optional, Tuple, Union
+from PIL import Image
+from PIL.Image import Resampling
+from flask import current_app
+from sqlalchemy import event
+from MyLists import db
+from MyLists.models.utils_models import CoverStore
+from MyLists.utils.covers import COVER_FORMATS, COVER_SIZES, STORE_DIR, encodable_formats, store_key, variant_name
+from MyLists.utils.enums import MediaType
+from MyLists.utils.http_client import http_client
+from MyLists.utils.utils import get_models_group
+
+
+def _write_atomically(img: Image.Image, path: str, **options):
+    """ Encode <img> to a temp file next to <path> and move it in place """
+
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as fp:
+            img.save(fp, **options)
+        os.replace(tmp_path, path)
+    except Exception:
+        os.remove(tmp_path)
+        raise
+
+
+def _transcode_cover(source: Union[str, BinaryIO], path: str):
+    """ Decode the <source> image once and write all its variants (sizes and formats) next to <path>. The full JPEG
+    (the <image_cover> file) is written last """
+
+    with Image.open(source) as img:
+        # JPEG draft mode: decode directly at the smallest scale still larger than the cover
+        img.draft("RGB", COVER_SIZES["full"])
+        img = img.convert("RGB").resize(COVER_SIZES["full"], Resampling.LANCZOS)
+
+    directory, cover_name = os.path.split(path)
+    for size, dimensions in reversed(COVER_SIZES.items()):
+        resized = img if size == "full" else img.resize(dimensions, Resampling.LANCZOS)
+        for fmt in reversed(encodable_formats()):
+            variant_path = os.path.join(directory, variant_name(cover_name, size, fmt))
+            _write_atomically(resized, variant_path, **COVER_FORMATS[fmt][1])
+
+
+def _variant_formats(path: str) -> str:
+    """ Formats whose variants (all sizes) exist next to the cover <path>, by order of preference (e.g.
+    "avif,webp,jpg"). Checked once when the cover is processed, the media rows keep the result """
+
+    directory, cover_name = os.path.split(path)
+    return ",".join(fmt for fmt in COVER_FORMATS
+                    if all(os.path.exists(os.path.join(directory, variant_name(cover_name, size, fmt)))
+                           for size in COVER_SIZES))
+
+
+def process_cover(urls: List[str], store_dir: str, headers: Dict = None,
+                  fallback_keywords: str = None) -> Tuple[str, str]:
+    """ Get the first available cover of <urls> in the content-addressed store and return its <image_cover> name and
+    the formats of its variants. The download is skipped when the cover of the URL is already stored. Run in a worker
+    process, so only picklable arguments and no app context. If all the <urls> fail, search an image with
+    <fallback_keywords> """
+
+    os.makedirs(store_dir, exist_ok=True)
+
+    for url in urls:
+        name = f"{store_key(url)}.jpg"
+        path = os.path.join(store_dir, name)
+
+        # Already stored: refresh its mtime so the store cleanup does not remove it right away
+        if os.path.exists(path):
+            os.utime(path)
+            return f"{STORE_DIR}/{name}", _variant_formats(path)
+
+        try:
+            response = http_client.get(url, headers=headers)
+            response.raise_for_status()
+            _transcode_cover(BytesIO(response.content), path)
+            return f"{STORE_DIR}/{name}", _variant_formats(path)
+        except Exception:
+            continue
+
+    if not fallback_keywords:
+        raise ValueError(f"No cover could be downloaded from {urls}")
+
+    from MyLists.static.books_img_ddl.books import GoogleImages
+
+    # Download the first image found by Google Images, its key is the hash of its bytes
+    with tempfile.TemporaryDirectory(dir=store_dir) as tmp_dir:
+        arguments = dict(keywords=fallback_keywords, output_directory=tmp_dir, size="medium")
+        all_paths = GoogleImages().download(arguments)
+        image_path = all_paths[0]["image"][-1]
+
+        with open(image_path, "rb") as fp:
+            content = fp.read()
+
+    name = f"{store_key(content)}.jpg"
+    path = os.path.join(store_dir, name)
+    if not os.path.exists(path):
+        _transcode_cover(BytesIO(content), path)
+
+    return f"{STORE_DIR}/{name}", _variant_formats(path)
+
+
+class CoverPipeline:
+    """ Cover processing stage. The media rows are saved with the <default.jpg> placeholder (or keep their old cover
+    when refreshed), then the covers are downloaded and resized in a process pool (PIL work outside the GIL) into the
+    content-addressed store, and <image_cover> is swapped when the job is done. The swaps (DB commits) are made one
+    after the other by a dedicated thread, so a slow commit does not hold up the collection of the other results """
+
+    PLACEHOLDER = "default.jpg"
+
+    def __init__(self):
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._swaps: queue.Queue = queue.Queue()
+        self._swapper: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        """ Lazily create the process pool of the current process """
+
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ProcessPoolExecutor(max_workers=current_app.config["COVER_WORKERS"])
+                self._pid = os.getpid()
+
+        return self._executor
+
+    def _start_swapper(self):
+        """ Lazily start the swap thread of the current process (the threads do not survive a fork) """
+
+        with self._lock:
+            if self._swapper is None or not self._swapper.is_alive():
+                self._swaps = queue.Queue()
+                self._swapper = threading.Thread(target=self._swap_worker, name="cover-swapper", daemon=True)
+                self._swapper.start()
+
+    def _swap_worker(self):
+        """ Swap the covers of the finished jobs, in order """
+
+        while True:
+            app, future, media_type, media_id = self._swaps.get()
+            try:
+                self._swap_cover(app, future, media_type, media_id)
+            except Exception as e:
+                app.logger.error(f"[ERROR] - Swapping the cover of the {media_type.value} with ID [{media_id}]: {e}")
+            finally:
+                self._swaps.task_done()
+
+    @staticmethod
+    def store_path() -> Path:
+        """ Local directory of the content-addressed covers store (shared by all the media types) """
+        return Path(current_app.static_folder, "covers", STORE_DIR)
+
+    def submit(self, media_type: MediaType, media_id: int, urls: List[str], headers: Dict = None,
+               fallback_keywords: str = None) -> Future:
+        """ Queue the cover of the media <media_id> and swap its <image_cover> once done """
+
+        app = current_app._get_current_object()
+        self._start_swapper()
+        swaps = self._swaps
+        future = self.executor.submit(process_cover, urls, str(self.store_path()), headers, fallback_keywords)
+        future.add_done_callback(lambda f: swaps.put((app, f, media_type, media_id)))
+
+        return future
+
+    @staticmethod
+    def submit_after_commit(media_type: MediaType, media_id: int, **job):
+        """ Queue the cover of the media <media_id> once the current transaction is committed, so the swap sees the
+        media row. The job is dropped if the transaction is rolled back """
+
+        db.session.info.setdefault("cover_jobs", []).append((media_type, media_id, job))
+
+    def join(self):
+        """ Wait for all the queued covers and their swaps (used by the CLI jobs before exiting) """
+
+        with self._lock:
+            if self._executor is not None and self._pid == os.getpid():
+                self._executor.shutdown(wait=True)
+            self._executor = None
+
+        # The results are all collected once the pool is shut down
+        if self._swapper is not None and self._swapper.is_alive():
+            self._swaps.join()
+
+    @staticmethod
+    def _swap_cover(app, future: Future, media_type: MediaType, media_id: int):
+        """ Set the new <image_cover> and <cover_formats> of the media when its job is done and move the store
+        references (run in the swap thread) """
+
+        with app.app_context():
+            error = future.exception()
+            if error is not None:
+                app.logger.error(f"[ERROR] - Processing the cover of the {media_type.value} with ID [{media_id}]: "
+                                 f"{error}")
+                return
+
+            cover_name, cover_formats = future.result()
+            try:
+                media_class = get_models_group(media_type)[0]
+                old = (db.session.query(media_class.image_cover, media_class.cover_formats)
+                       .filter_by(id=media_id).first())
+                if old is None or (old.image_cover, old.cover_formats) == (cover_name, cover_formats):
+                    return
+
+                (media_class.query.filter_by(id=media_id)
+                 .update({"image_cover": cover_name, "cover_formats": cover_formats}))
+                if old.image_cover != cover_name:
+                    CoverStore.acquire(cover_name)
+                    CoverStore.release(old.image_cover)
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                app.logger.error(f"[ERROR] - Swapping the cover of the {media_type.value} with ID [{media_id}]: {e}")
+            finally:
+                db.session.remove()
+
+
+# Globally accessible cover pipeline
+cover_pipeline = CoverPipeline()
+
+
+@event.listens_for(db.session, "after_commit")
+def _submit_committed_covers(session):
+    """ Queue the cover jobs waiting for the commit of their media (see <CoverPipeline.submit_after_commit>) """
+
+    for media_type, media_id, job in session.info.pop("cover_jobs", []):
+        try:
+            cover_pipeline.submit(media_type, media_id, **job)
+        except Exception as e:
+            current_app.logger.error(f"[ERROR] - Queuing the cover of the {media_type.value} with ID [{media_id}]: "
+                                     f"{e}")
+
+
+@event.listens_for(db.session, "after_rollback")
+def _drop_rolled_back_covers(session):
+    """ Drop the cover jobs of a rolled back transaction """
+    session.info.pop("cover_jobs", None)
@@ -1,5 +1,5 @@
-from typing import Tuple, Dict
-from sqlalchemy import func, text
+from typing import Tuple, Dict, List
+from sqlalchemy import func, Select
 from MyLists import db
 from MyLists.models.books_models import Books, BooksList, BooksGenre, BooksAuthors
 from MyLists.models.games_models import Games, GamesList, GamesGenre, GamesCompanies
@@ -7,6 +7,7 @@ from MyLists.models.movies_models import Movies, MoviesActors, MoviesGenre, Movi
 from MyLists.models.tv_models import (Series, Anime, SeriesList, SeriesGenre, AnimeList, AnimeGenre, AnimeActors,
                                       SeriesActors, SeriesEpisodesPerSeason, AnimeEpisodesPerSeason)
 from MyLists.models.user_models import User
+from MyLists.models.utils_models import GlobalStatsCounter
 from MyLists.utils.enums import MediaType, RoleType, Status
 
 
@@ -78,78 +79,115 @@ class GlobalStats:
             self.media_genre = GamesGenre
             self.media_comp = GamesCompanies
 
-    def get_top_media(self) -> Dict:
-        """ Get the top media in all the users list (Series, Anime, Movies, Games, and Books) """
+    def get_counter_sources(self, media_type: MediaType) -> Dict[str, Select]:
+        """ Queries of the (media_id, key) pairs counted in the stats counters of each kind for <media_type> """
 
-        results = {}
-        for list_type in self.all_list_type:
-            self.get_query_data(list_type)
+        self.get_query_data(media_type)
 
-            # Create query for each <list_type>
-            query = (db.session.query(self.media_list, func.count(self.media_list.media_id).label("count"))
-                     .filter(self.media_list.status != Status.DROPPED)
-                     .group_by(self.media_list.media_id).order_by(text("count desc"))
-                     .limit(5).all())
+        sources = {"genre": (db.select(self.media_genre.media_id, self.media_genre.genre)
+                             .where(self.media_genre.genre != "Unknown"))}
 
-            # Append results
-            results[list_type.value] = [{"info": m.media.name, "quantity": c} for m, c in query]
+        if media_type in self.tmdb_list_type:
+            sources["actor"] = (db.select(self.media_actors.media_id, self.media_actors.name)
+                                .where(self.media_actors.name != "Unknown"))
+        if media_type == MediaType.MOVIES:
+            sources["director"] = (db.select(self.media.id, self.media.director_name)
+                                   .where(self.media.director_name != "Unknown"))
+        if media_type == MediaType.GAMES:
+            sources["developer"] = (db.select(self.media_comp.media_id, self.media_comp.name)
+                                    .where(self.media_comp.name != "Unknown", self.media_comp.developer == True))
+        if media_type == MediaType.BOOKS:
+            sources["author"] = (db.select(self.media_authors.media_id, self.media_authors.name)
+                                 .where(self.media_authors.name != "Unknown"))
 
-        return results
+        return sources
 
-    def get_top_genres(self) -> Dict:
-        """ Get the top genres in all the users list (Series, Anime, Movies, Games, and Books) """
+    def count_entries(self, media_type: MediaType, *filters) -> Dict[Tuple[str, str], int]:
+        """ Count the list entries of <media_type> matching <filters> for each (kind, key) of the stats counters """
 
-        results = {}
-        for list_type in self.all_list_type:
-            self.get_query_data(list_type)
+        sources = self.get_counter_sources(media_type)
+        media_list = self.media_list
 
-            # Create query for each <list_type>
-            query = (db.session.query(self.media_genre.genre, func.count(self.media_genre.genre).label("count"))
-                     .join(self.media_list, self.media_genre.media_id == self.media_list.media_id)
-                     .filter(self.media_genre.genre != "Unknown")
-                     .group_by(self.media_genre.genre)
-                     .order_by(text("count desc")).limit(5).all())
+        counts = {}
+        for kind, source in sources.items():
+            source = source.subquery()
+            media_id, key = source.c
+            query = (db.session.query(key, func.count()).join(media_list, media_list.media_id == media_id)
+                     .filter(*filters).group_by(key))
+            counts.update({(kind, key): count for key, count in query})
 
-            # Append results
-            results[list_type.value] = [{"info": genre, "quantity": count} for genre, count in query]
+        # Media in the lists, dropped apart
+        dropped = (media_list.status == Status.DROPPED).label("dropped")
+        query = (db.session.query(media_list.media_id, dropped, func.count())
+                 .filter(*filters).group_by(media_list.media_id, dropped))
+        counts.update({(self._status_kind(is_dropped), str(media_id)): count for media_id, is_dropped, count in query})
 
-        return results
+        return counts
 
-    def get_top_actors(self) -> Dict:
-        """ Get the top actors in all users list (for Series, Anime, Movies) """
+    def track_entries(self, media_type: MediaType, sign: int, *filters):
+        """ Add (<sign> = 1) or remove (<sign> = -1) the list entries of <media_type> matching <filters> from the stats
+        counters. The caller is in charge of the commit """
 
-        results = {}
-        for list_type in self.tmdb_list_type:
-            self.get_query_data(list_type)
+        counts = self.count_entries(media_type, *filters)
+        GlobalStatsCounter.increment(media_type, {kind_key: sign * count for kind_key, count in counts.items()})
 
-            # Create query for each <list_type>
-            query = (db.session.query(self.media_actors.name, func.count(self.media_actors.name).label("count"))
-                     .join(self.media_list, self.media_actors.media_id == self.media_list.media_id)
-                     .filter(self.media_actors.name != "Unknown")
-                     .group_by(self.media_actors.name)
-                     .order_by(text("count desc")).limit(5).all())
+    def track_status(self, media_type: MediaType, media_id: int, old_status: Status, new_status: Status):
+        """ Move a list entry between the <media> and <dropped> counters when its status changes. The caller is in
+        charge of the commit """
 
-            # Append results
-            results[list_type.value] = [{"info": actor, "quantity": count} for actor, count in query]
+        old_kind = self._status_kind(old_status == Status.DROPPED)
+        new_kind = self._status_kind(new_status == Status.DROPPED)
+        if old_kind != new_kind:
+            GlobalStatsCounter.increment(media_type, {(old_kind, str(media_id)): -1, (new_kind, str(media_id)): 1})
 
-        return results
+    def rebuild_counters(self):
+        """ Recompute all the stats counters from the lists """
 
-    def get_top_dropped(self) -> Dict:
-        """ Get the top dropped media in all users list (for Series and Anime) """
+        GlobalStatsCounter.query.delete()
+        for media_type in self.all_list_type:
+            db.session.add_all([GlobalStatsCounter(media_type=media_type, kind=kind, key=key, count=count)
+                                for (kind, key), count in self.count_entries(media_type).items()])
 
-        results = {}
-        for list_type in self.tv_list_type:
-            self.get_query_data(list_type)
+        db.session.commit()
 
-            query = (db.session.query(self.media.name, func.count(self.media_list.media_id == self.media.id).label("count"))
-                     .join(self.media_list, self.media_list.media_id == self.media.id)
-                     .filter(self.media_list.status == Status.DROPPED)
-                     .group_by(self.media_list.media_id)
-                     .order_by(text("count desc")).limit(5).all())
+    @staticmethod
+    def _status_kind(is_dropped: bool) -> str:
+        """ Kind of the counter of a list entry depending on its status """
+        return "dropped" if is_dropped else "media"
 
-            results[list_type.value] = [{"info": dropped, "quantity": count} for dropped, count in query]
+    def _get_top_media_names(self, media_type: MediaType, kind: str) -> List[Dict]:
+        """ Top media of the <kind> counters with their names """
 
-        return results
+        self.get_query_data(media_type)
+
+        top = GlobalStatsCounter.get_top(media_type, kind)
+        names = dict(db.session.query(self.media.id, self.media.name)
+                     .filter(self.media.id.in_([int(media_id) for media_id, _ in top])).all())
+
+        return [{"info": names[int(media_id)], "quantity": count} for media_id, count in top
+                if int(media_id) in names]
+
+    def get_top_media(self) -> Dict:
+        """ Get the top media in all the users list (Series, Anime, Movies, Games, and Books) """
+        return {list_type.value: self._get_top_media_names(list_type, "media") for list_type in self.all_list_type}
+
+    def get_top_genres(self) -> Dict:
+        """ Get the top genres in all the users list (Series, Anime, Movies, Games, and Books) """
+
+        return {list_type.value: [{"info": genre, "quantity": count}
+                                  for genre, count in GlobalStatsCounter.get_top(list_type, "genre")]
+                for list_type in self.all_list_type}
+
+    def get_top_actors(self) -> Dict:
+        """ Get the top actors in all users list (for Series, Anime, Movies) """
+
+        return {list_type.value: [{"info": actor, "quantity": count}
+                                  for actor, count in GlobalStatsCounter.get_top(list_type, "actor")]
+                for list_type in self.tmdb_list_type}
+
+    def get_top_dropped(self) -> Dict:
+        """ Get the top dropped media in all users list (for Series and Anime) """
+        return {list_type.value: self._get_top_media_names(list_type, "dropped") for list_type in self.tv_list_type}
 
     def get_total_eps_seasons(self) -> Dict:
         """ Get the total episodes in all users list (Series and Anime) """
@@ -164,52 +202,26 @@ class GlobalStats:
 
         return results
 
-    def get_top_directors(self) -> Dict:
+    @staticmethod
+    def get_top_directors() -> Dict:
         """ Get the top directors in all users list for Movies """
 
-        results = {}
-        self.get_query_data(MediaType.MOVIES)
-
-        query = db.session.query(self.media.director_name, func.count(self.media.director_name).label("count")) \
-            .join(self.media_list, self.media.id == self.media_list.media_id) \
-            .group_by(self.media.director_name).filter(self.media.director_name != "Unknown") \
-            .order_by(text("count desc")).limit(5).all()
+        top = GlobalStatsCounter.get_top(MediaType.MOVIES, "director")
+        return {"movies": [{"info": director, "quantity": count} for director, count in top]}
 
-        results["movies"] = [{"info": director, "quantity": count} for director, count in query]
-
-        return results
-
-    def get_top_developers(self) -> Dict:
+    @staticmethod
+    def get_top_developers() -> Dict:
         """ Get the top developers in all users list for Games """
 
-        results = {}
-        self.get_query_data(MediaType.GAMES)
-
-        query = (db.session.query(self.media_comp.name, func.count(self.media_comp.name).label("count"))
-                 .join(self.media_list, self.media_comp.media_id == self.media_list.media_id)
-                 .group_by(self.media_comp.name)
-                 .filter(self.media_comp.name != "Unknown", self.media_comp.developer == True)
-                 .order_by(text("count desc")).limit(5).all())
+        top = GlobalStatsCounter.get_top(MediaType.GAMES, "developer")
+        return {"games": [{"info": dev, "quantity": count} for dev, count in top]}
 
-        results["games"] = [{"info": dev, "quantity": count} for dev, count in query]
-
-        return results
-
-    def get_top_authors(self) -> Dict:
+    @staticmethod
+    def get_top_authors() -> Dict:
         """ Get the top authors for Books in all users list """
 
-        results = {}
-        self.get_query_data(MediaType.BOOKS)
-
-        # Create query for each <list_type>
-        query = (db.session.query(self.media_authors.name, func.count(self.media_authors.name).label("count"))
-                 .join(self.media_list, self.media_authors.media_id == self.media_list.media_id)
-                 .group_by(self.media_authors.name).filter(self.media_authors.name != "Unknown")
-                 .order_by(text("count desc")).limit(5).all())
-
-        results["books"] = [{"info": author, "quantity": count} for author, count in query]
-
-        return results
+        top = GlobalStatsCounter.get_top(MediaType.BOOKS, "author")
+        return {"books": [{"info": author, "quantity": count} for author, count in top]}
 
     def get_total_movies(self) -> Dict:
         """ Get total movies in all users list """
@@ -222,3 +234,26 @@ class GlobalStats:
 
         self.get_query_data(MediaType.BOOKS)
         return db.session.query(func.sum(self.media_list.actual_page)).first()[0] or 0
+
+    def get_all_stats(self) -> Dict:
+        """ Get all the global stats (cheap: the tops are read from the stats counters) """
+
+        media_eps_seas = self.get_total_eps_seasons()
+        nb_users, nb_media = self.get_nb_media_and_users()
+
+        return dict(
+            nb_users=nb_users,
+            nb_media=nb_media,
+            total_time=User.get_total_time_spent(),
+            top_media=self.get_top_media(),
+            top_genres=self.get_top_genres(),
+            top_actors=self.get_top_actors(),
+            top_directors=self.get_top_directors(),
+            top_dropped=self.get_top_dropped(),
+            total_episodes=media_eps_seas,
+            total_seasons=media_eps_seas,
+            total_movies=self.get_total_movies(),
+            top_authors=self.get_top_authors(),
+            top_developers=self.get_top_developers(),
+            total_pages=self.get_total_book_pages(),
+        )
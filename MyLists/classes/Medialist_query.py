@@ -1,10 +1,12 @@
-from typing import Tuple, Dict, Any
+from typing import Tuple, Dict, Any, List
 from flask import abort, request
 from sqlalchemy import asc, or_
 from MyLists import db
 from MyLists.api.auth import current_user
+from MyLists.classes.Search_index import SearchIndex
 from MyLists.models.user_models import User
 from MyLists.utils.enums import Status, MediaType
+from MyLists.utils.pagination import paginate
 from MyLists.utils.utils import get_models_group
 
 
@@ -48,6 +50,7 @@ class BaseMediaQuery:
         self.pages = 0
         self.total = 0
         self.title = None
+        self.next_cursor = None
 
         # Pagination
         self.all_status = self.media_list.Status.to_list(extra=True)
@@ -109,11 +112,43 @@ class BaseMediaQuery:
 
         self.common_ids = [data[0] for data in common_ids]
 
+    def _paginate(self, query: Any, sort_keys: List, cache_key: str) -> List:
+        """ Paginate the <query> (offset or keyset, see <paginate>), set the pagination attributes and return the
+        items """
+
+        results = paginate(query, sort_keys + [asc(self.media.id)], self.PER_PAGE,
+                           cache_key=f"{self.media_type.value}:{self.user.id}:{current_user.id}:{cache_key}")
+
+        self.total = results.total
+        self.pages = results.pages
+        self.next_cursor = results.next_cursor
+
+        return results.items
+
 class SearchMediaQuery(BaseMediaQuery):
     """ Subclass for handling the search query part """
 
     def _search_query(self):
-        """ Execute the search query on a <media_list> for a specified <user> """
+        """ Execute the search query on a <media_list> for a specified <user>: ranked hits of the full-text search
+        index if available, ILIKE filters otherwise """
+
+        self.title = f"Search for: {self.search}"
+
+        hits = SearchIndex.search_query(self.media_type, self.search)
+        if hits is None:
+            return self._ilike_search_query()
+
+        query = (db.session.query(self.media_list)
+                 .join(self.media, self.media.id == self.media_list.media_id)
+                 .join(hits, hits.c.media_id == self.media.id)
+                 .filter(self.media_list.user_id == self.user.id))
+        items = self._paginate(query, [asc(hits.c.rank)], cache_key=f"search:{self.search}")
+
+        # Serialize results
+        self.results = [item.to_dict() for item in items]
+
+    def _ilike_search_query(self):
+        """ Search a <media_list> for a specified <user> with ILIKE filters (no full-text search index) """
 
         # First query part
         query_part = (db.session.query(self.media_list)
@@ -156,17 +191,11 @@ class SearchMediaQuery(BaseMediaQuery):
             return abort(400)
 
         # Create MAIN SUBQUERY
-        paginate_results = (query_part.filter(self.media_list.user_id == self.user.id, search_filter)
-                            .group_by(self.media.id).order_by(asc(self.media.name))
-                            .paginate(page=int(self.page), per_page=self.PER_PAGE, error_out=True))
-
-        # Add instances attributes
-        self.total = paginate_results.total
-        self.pages = paginate_results.pages
-        self.title = f"Search for: {self.search}"
+        query = query_part.filter(self.media_list.user_id == self.user.id, search_filter).group_by(self.media.id)
+        items = self._paginate(query, [asc(self.media.name)], cache_key=f"search:{self.search}")
 
         # Serialize results
-        self.results = [item.to_dict() for item in paginate_results.items]
+        self.results = [item.to_dict() for item in items]
 
 class ItemsMediaQuery(BaseMediaQuery):
     """ Subclass for handling the display items query part """
@@ -190,20 +219,17 @@ class ItemsMediaQuery(BaseMediaQuery):
         common_filter = self._get_common_filter()
 
         # Create MAIN SUBQUERY
-        paginate_results = (db.session.query(self.media_list)
-                            .outerjoin(self.media, self.media.id == self.media_list.media_id)
-                            .outerjoin(self.media_genre, self.media_genre.media_id == self.media.id)
-                            .filter(self.media_list.user_id == self.user.id, status_filter, genre_filter, lang_filter,
-                                    common_filter)
-                            .group_by(self.media.id).order_by(sort_filter, asc(self.media.name))
-                            .paginate(page=int(self.page), per_page=self.PER_PAGE, error_out=True))
-
-        # Add instances attributes
-        self.total = paginate_results.total
-        self.pages = paginate_results.pages
+        query = (db.session.query(self.media_list)
+                 .outerjoin(self.media, self.media.id == self.media_list.media_id)
+                 .outerjoin(self.media_genre, self.media_genre.media_id == self.media.id)
+                 .filter(self.media_list.user_id == self.user.id, status_filter, genre_filter, lang_filter,
+                         common_filter)
+                 .group_by(self.media.id))
+        items = self._paginate(query, [sort_filter, asc(self.media.name)],
+                               cache_key=f"items:{self.status}:{self.genre}:{self.lang}:{self.show_common}")
 
         # Serialize results
-        self.results = [item.to_dict() for item in paginate_results.items]
+        self.results = [item.to_dict() for item in items]
 
 class MediaListQuery(SearchMediaQuery, ItemsMediaQuery):
     """ Main class that handles different query types using inheritance """
@@ -250,6 +276,7 @@ class MediaListQuery(SearchMediaQuery, ItemsMediaQuery):
             page=self.page,
             pages=self.pages,
             total=self.total,
+            next_cursor=self.next_cursor,
             title=self.title,
             all_status=self.all_status,
             all_genres=self.all_genres,
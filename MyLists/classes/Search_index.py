@@ -0,0 +1,169 @@
+from __future__ import annotations
+import re
+from typing import List, Optional
+from sqlalchemy import select, insert, delete, text, func, literal, table, column, Float, Integer
+from sqlalchemy.sql.selectable import Subquery
+from MyLists import db
+from MyLists.models.books_models import BooksAuthors
+from MyLists.models.games_models import GamesPlatforms, GamesCompanies
+from MyLists.models.movies_models import MoviesActors
+from MyLists.models.tv_models import SeriesNetwork, SeriesActors, AnimeNetwork, AnimeActors
+from MyLists.utils.enums import MediaType
+from MyLists.utils.utils import get_models_group
+
+
+class SearchIndex:
+    """ Full-text search index of the media (SQLite FTS5). Each media type has its own FTS table (<media>_search)
+    with one document per media (rowid = media id): its name, original name and people (networks and actors,
+    director and actors, platforms and companies, or authors). The index is kept in sync when a media is added,
+    refreshed, edited or removed. On other databases (or without FTS5) the search falls back to the ILIKE query """
+
+    # bm25 weights of the <name>, <original_name> and <people> columns
+    WEIGHTS = (10.0, 5.0, 1.0)
+
+    # Number of media indexed per statement
+    CHUNK_SIZE = 500
+
+    # Columns of the people of each media type (besides the director of the movies)
+    PEOPLE_COLUMNS = {
+        MediaType.SERIES: (SeriesNetwork.network, SeriesActors.name),
+        MediaType.ANIME: (AnimeNetwork.network, AnimeActors.name),
+        MediaType.MOVIES: (MoviesActors.name,),
+        MediaType.GAMES: (GamesPlatforms.name, GamesCompanies.name),
+        MediaType.BOOKS: (BooksAuthors.name,),
+    }
+
+    @staticmethod
+    def _table_name(media_type: MediaType) -> str:
+        """ Name of the FTS table of the <media_type> """
+        return f"{get_models_group(media_type)[0].__tablename__}_search"
+
+    @classmethod
+    def _table(cls, media_type: MediaType):
+        """ Lightweight table construct of the FTS table of the <media_type> """
+        return table(cls._table_name(media_type), column("rowid"), column("name"), column("original_name"),
+                     column("people"))
+
+    @classmethod
+    def create_tables(cls, connection):
+        """ Create the FTS tables if they do not exist (SQLite only) """
+
+        if connection.dialect.name != "sqlite":
+            return
+
+        for media_type in MediaType:
+            connection.execute(text(f"CREATE VIRTUAL TABLE IF NOT EXISTS {cls._table_name(media_type)} USING "
+                                    f"fts5(name, original_name, people, tokenize='unicode61 remove_diacritics 2')"))
+
+    @classmethod
+    def is_available(cls, media_type: MediaType) -> bool:
+        """ Check if the FTS table of the <media_type> exists """
+
+        if db.engine.dialect.name != "sqlite":
+            return False
+
+        return db.session.execute(text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+                                  {"name": cls._table_name(media_type)}).first() is not None
+
+    @classmethod
+    def _documents_query(cls, media_type: MediaType):
+        """ Select the (rowid, name, original_name, people) documents of the media """
+
+        media = get_models_group(media_type)[0]
+
+        people = [media.director_name] if hasattr(media, "director_name") else []
+        for person in cls.PEOPLE_COLUMNS[media_type]:
+            people.append(select(func.group_concat(person, " "))
+                          .where(person.class_.media_id == media.id).scalar_subquery())
+
+        # Concatenate the people (NULLs ignored)
+        people_doc = literal("")
+        for i, person in enumerate(people):
+            people_doc = people_doc.op("||")(literal(" " if i else "")).op("||")(func.coalesce(person, ""))
+
+        return select(
+            media.id,
+            media.name,
+            media.original_name if hasattr(media, "original_name") else literal(""),
+            people_doc,
+        )
+
+    @classmethod
+    def index_media(cls, media_type: MediaType, media_ids: List[int]):
+        """ (Re)index the <media_ids> of the <media_type>. The caller is in charge of the commit """
+
+        if not media_ids or not cls.is_available(media_type):
+            return
+
+        # The documents are selected from the database: send the pending changes first
+        db.session.flush()
+
+        fts_table, media = cls._table(media_type), get_models_group(media_type)[0]
+        for i in range(0, len(media_ids), cls.CHUNK_SIZE):
+            chunk = media_ids[i:i + cls.CHUNK_SIZE]
+            db.session.execute(delete(fts_table).where(fts_table.c.rowid.in_(chunk)))
+            db.session.execute(insert(fts_table).from_select(
+                ["rowid", "name", "original_name", "people"],
+                cls._documents_query(media_type).where(media.id.in_(chunk)),
+            ))
+
+    @classmethod
+    def prune(cls, media_type: MediaType) -> int:
+        """ Remove the documents of the media no longer in the database and return their number. The caller is in
+        charge of the commit """
+
+        if not cls.is_available(media_type):
+            return 0
+
+        fts_table, media = cls._table(media_type), get_models_group(media_type)[0]
+        result = db.session.execute(delete(fts_table).where(fts_table.c.rowid.not_in(select(media.id))))
+
+        return result.rowcount
+
+    @classmethod
+    def rebuild(cls) -> int:
+        """ Create the missing FTS tables, index again all the media and return the number of documents """
+
+        cls.create_tables(db.session.connection())
+
+        total = 0
+        for media_type in MediaType:
+            if not cls.is_available(media_type):
+                continue
+
+            fts_table = cls._table(media_type)
+            db.session.execute(delete(fts_table))
+            result = db.session.execute(insert(fts_table).from_select(["rowid", "name", "original_name", "people"],
+                                                                       cls._documents_query(media_type)))
+            total += result.rowcount
+        db.session.commit()
+
+        return total
+
+    @staticmethod
+    def _match_expression(search: str) -> Optional[str]:
+        """ Convert a user search into a FTS5 query: all its words, as prefixes """
+
+        words = re.findall(r"\w+", search or "")
+        if not words:
+            return None
+
+        return " ".join(f'"{word}"*' for word in words)
+
+    @classmethod
+    def search_query(cls, media_type: MediaType, search: str) -> Optional[Subquery]:
+        """ Return a subquery of the (media_id, rank) of the media matching the <search> (lower rank is better), or
+        None if the index cannot be used """
+
+        match = cls._match_expression(search)
+        if match is None or not cls.is_available(media_type):
+            return None
+
+        table_name = cls._table_name(media_type)
+        weights = ", ".join(str(weight) for weight in cls.WEIGHTS)
+
+        return (text(f"SELECT rowid AS media_id, bm25({table_name}, {weights}) AS rank FROM {table_name} "
+                     f"WHERE {table_name} MATCH :match")
+                .bindparams(match=match)
+                .columns(media_id=Integer, rank=Float)
+                .subquery())
@@ -2,11 +2,11 @@ from __future__ import annotations
 import datetime
 from enum import Enum
 from typing import List, Dict
-from flask import abort, current_app
+from flask import abort
 from sqlalchemy import func, text
 from MyLists import db
 from MyLists.api.auth import current_user
-from MyLists.models.user_models import User, UserLastUpdate, Notifications
+from MyLists.models.user_models import User, TimeSpentLedger
 from MyLists.models.utils_models import MediaMixin, MediaListMixin, MediaLabelMixin
 from MyLists.utils.utils import change_air_format
 from MyLists.utils.enums import MediaType, Status, ExtendedEnum
@@ -27,7 +27,8 @@ class Books(MediaMixin, db.Model):
     publishers = db.Column(db.String(50))
     synopsis = db.Column(db.Text)
     image_cover = db.Column(db.String(100), nullable=False)
-    api_id = db.Column(db.Integer)
+    cover_formats = db.Column(db.String(30))
+    api_id = db.Column(db.Integer, unique=True, index=True)
     lock_status = db.Column(db.Boolean, default=0)
 
     genres = db.relationship("BooksGenre")
@@ -48,10 +49,12 @@ class Books(MediaMixin, db.Model):
 
         if coming_next:
             media_dict["media_cover"] = self.media_cover
+            media_dict["media_cover_sources"] = self.media_cover_sources
             media_dict["date"] = change_air_format(self.release_date, books=True)
             return media_dict
 
         media_dict["media_cover"] = self.media_cover
+        media_dict["media_cover_sources"] = self.media_cover_sources
         media_dict["formated_date"] = change_air_format(self.release_date, books=True)
         media_dict["authors"] = self.authors_list
         media_dict["genres"] = self.genres_list
@@ -88,35 +91,6 @@ class Books(MediaMixin, db.Model):
 
         return [q.to_dict() for q in query]
 
-    @classmethod
-    def remove_books(cls):
-        """ Remove all books that are not present in a User list from the database and the disk """
-
-        try:
-            # Books remover
-            books_to_delete = (cls.query.outerjoin(BooksList, BooksList.media_id == cls.id)
-                               .filter(BooksList.media_id.is_(None)).all())
-            count_ = 0
-            for book in books_to_delete:
-                # Delete related records
-                BooksAuthors.query.filter_by(media_id=book.id).delete()
-                BooksGenre.query.filter_by(media_id=book.id).delete()
-                UserLastUpdate.query.filter_by(media_type=MediaType.BOOKS, media_id=book.id).delete()
-                Notifications.query.filter_by(media_type="bookslist", media_id=book.id).delete()
-
-                # Delete book
-                Books.query.filter_by(id=book.id).delete()
-
-                count_ += 1
-                current_app.logger.info(f"Removed book with ID: [{book.id}]")
-
-            current_app.logger.info(f"Total books removed: {count_}")
-        except Exception as e:
-            db.session.rollback()
-            current_app.logger.error(f"Error occurred while removing books and related records: {str(e)}")
-        finally:
-            db.session.close()
-
     @staticmethod
     def form_only() -> List[str]:
         """ Return the allowed fields for the edit form """
@@ -136,7 +110,7 @@ class BooksList(MediaListMixin, db.Model):
 
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
-    media_id = db.Column(db.Integer, db.ForeignKey("books.id"), nullable=False)
+    media_id = db.Column(db.Integer, db.ForeignKey("books.id"), nullable=False, index=True)
     status = db.Column(db.Enum(Status), nullable=False)
     rewatched = db.Column(db.Integer, nullable=False, default=0)
     actual_page = db.Column(db.Integer)
@@ -147,6 +121,11 @@ class BooksList(MediaListMixin, db.Model):
     comment = db.Column(db.Text)
     completion_date = db.Column(db.DateTime)
 
+    __table_args__ = (
+        db.Index("ix_books_list_user_id_media_id", "user_id", "media_id"),
+        db.Index("ix_books_list_user_id_status", "user_id", "status"),
+    )
+
     # --- Relationships -----------------------------------------------------------
     media = db.relationship("Books", back_populates="list_info", lazy=False)
 
@@ -166,7 +145,8 @@ class BooksList(MediaListMixin, db.Model):
             media_dict = {c.name: getattr(self, c.name) for c in self.__table__.columns}
 
         # Add more info
-        media_dict["media_cover"] = self.media.media_cover
+        media_dict["media_cover"] = self.media.media_thumb
+        media_dict["media_cover_sources"] = self.media.media_thumb_sources
         media_dict["media_name"] = self.media.name
         media_dict["total_pages"] = self.media.pages
         media_dict["all_status"] = self.Status.to_list()
@@ -208,8 +188,7 @@ class BooksList(MediaListMixin, db.Model):
     def update_time_spent(self, old_value: int = 0, new_value: int = 0):
         """ Update the new time spent reading for the user """
 
-        old_time = current_user.time_spent_books
-        current_user.time_spent_books = old_time + ((new_value - old_value) * self.TIME_PER_PAGE)
+        TimeSpentLedger.record(current_user, self.GROUP, (new_value - old_value) * self.TIME_PER_PAGE)
 
     @classmethod
     def get_media_stats(cls, user: User) -> List[Dict]:
@@ -275,9 +254,11 @@ class BooksGenre(db.Model):
     media_id = db.Column(db.Integer, db.ForeignKey('books.id'), nullable=False)
     genre = db.Column(db.String(100), nullable=False)
 
+    __table_args__ = (db.Index("ix_books_genre_media_id_genre", "media_id", "genre"),)
+
     @classmethod
     def replace_genres(cls, genres: List, media_id: int):
-        """ Replace the old genres by the new ones """
+        """ Replace the old genres by the new ones. The caller is in charge of the commit """
 
         # Remove actual genres
         cls.query.filter_by(media_id=media_id).delete()
@@ -285,9 +266,6 @@ class BooksGenre(db.Model):
         # Add new genres
         db.session.add_all([cls(media_id=media_id, genre=genre) for genre in genres])
 
-        # Commit changes
-        db.session.commit()
-
     @staticmethod
     def get_available_genres() -> List:
         """ Return the available genres for the books """
@@ -303,7 +281,7 @@ class BooksAuthors(db.Model):
     GROUP = MediaType.BOOKS
 
     id = db.Column(db.Integer, primary_key=True)
-    media_id = db.Column(db.Integer, db.ForeignKey('books.id'), nullable=False)
+    media_id = db.Column(db.Integer, db.ForeignKey('books.id'), nullable=False, index=True)
     name = db.Column(db.String(150))
 
 
@@ -315,9 +293,11 @@ class BooksLabels(MediaLabelMixin, db.Model):
 
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
-    media_id = db.Column(db.Integer, db.ForeignKey("books.id"), nullable=False)
+    media_id = db.Column(db.Integer, db.ForeignKey("books.id"), nullable=False, index=True)
     label = db.Column(db.String(64), nullable=False)
 
+    __table_args__ = (db.Index("ix_books_labels_user_id_label", "user_id", "label", "media_id"),)
+
     # --- Relationships -----------------------------------------------------------
     media = db.relationship("Books", lazy=False)
 
@@ -329,7 +309,8 @@ class BooksLabels(MediaLabelMixin, db.Model):
             media_dict = {c.name: getattr(self, c.name) for c in self.__table__.columns}
 
         # Add more info
-        media_dict["media_cover"] = self.media.media_cover
+        media_dict["media_cover"] = self.media.media_thumb
+        media_dict["media_cover_sources"] = self.media.media_thumb_sources
         media_dict["media_name"] = self.media.name
 
         return media_dict
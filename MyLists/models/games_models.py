@@ -1,5 +1,4 @@
 from __future__ import annotations
-import json
 from datetime import datetime
 from enum import Enum
 from typing import Dict, List
@@ -7,7 +6,7 @@ from flask import abort, current_app
 from sqlalchemy import text, func
 from MyLists import db
 from MyLists.api.auth import current_user
-from MyLists.models.user_models import User, UserLastUpdate, Notifications
+from MyLists.models.user_models import User, Notifications, TimeSpentLedger
 from MyLists.models.utils_models import MediaMixin, MediaListMixin, MediaLabelMixin
 from MyLists.utils.enums import MediaType, Status, ExtendedEnum
 from MyLists.utils.utils import change_air_format
@@ -23,6 +22,7 @@ class Games(MediaMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(50), nullable=False)
     image_cover = db.Column(db.String(100), nullable=False)
+    cover_formats = db.Column(db.String(30))
     collection_name = db.Column(db.String(50))
     game_engine = db.Column(db.String(50))
     game_modes = db.Column(db.String(200))
@@ -36,7 +36,7 @@ class Games(MediaMixin, db.Model):
     hltb_main_time = db.Column(db.String(20))
     hltb_main_and_extra_time = db.Column(db.String(20))
     hltb_total_complete_time = db.Column(db.String(20))
-    api_id = db.Column(db.Integer, nullable=False)
+    api_id = db.Column(db.Integer, nullable=False, unique=True, index=True)
     lock_status = db.Column(db.Boolean, default=1)
 
     genres = db.relationship("GamesGenre", backref="games", lazy=True)
@@ -74,10 +74,12 @@ class Games(MediaMixin, db.Model):
 
         if coming_next:
             media_dict["media_cover"] = self.media_cover
+            media_dict["media_cover_sources"] = self.media_cover_sources
             media_dict["date"] = change_air_format(self.release_date)
             return media_dict
 
         media_dict["media_cover"] = self.media_cover
+        media_dict["media_cover_sources"] = self.media_cover_sources
         media_dict["formated_date"] = self.formated_date
         media_dict["developers"] = self.developers
         media_dict["platforms"] = self.platforms
@@ -116,38 +118,9 @@ class Games(MediaMixin, db.Model):
         return [q.to_dict(coming_next=True) for q in query]
 
     @classmethod
-    def remove_games(cls):
-        """ Remove all games that are not present in a User list from the database and the disk """
-
-        try:
-            # Games remover
-            games_to_delete = (cls.query.outerjoin(GamesList, GamesList.media_id == cls.id)
-                               .filter(GamesList.media_id.is_(None)).all())
-            count_ = 0
-            for game in games_to_delete:
-                # Delete related records
-                GamesPlatforms.query.filter_by(media_id=game.id).delete()
-                GamesCompanies.query.filter_by(media_id=game.id).delete()
-                GamesGenre.query.filter_by(media_id=game.id).delete()
-                UserLastUpdate.query.filter_by(media_type=MediaType.GAMES, media_id=game.id).delete()
-                Notifications.query.filter_by(media_type="gameslist", media_id=game.id).delete()
-
-                # Delete Game
-                Games.query.filter_by(id=game.id).delete()
-
-                count_ += 1
-                current_app.logger.info(f"Removed game with ID: [{game.id}]")
-
-            current_app.logger.info(f"Total games removed: {count_}")
-        except Exception as e:
-            db.session.rollback()
-            current_app.logger.error(f"Error occurred while removing games and related records: {str(e)}")
-        finally:
-            db.session.close()
-
-    @classmethod
-    def get_new_releasing_games(cls):
-        """ Check for the new releasing games in a week or less from the IGDB API """
+    def get_new_releasing_games(cls) -> int:
+        """ Check for the new releasing games in a week or less from the IGDB API. Return the number of
+        notifications added """
 
         try:
             raw_sql = text(""" SELECT games.id, games_list.user_id, games.release_date, games.name 
@@ -159,25 +132,21 @@ class Games(MediaMixin, db.Model):
 
             query = db.session.execute(raw_sql).all()
 
-            for info in query:
-                notif = Notifications.seek(info[1], "gameslist", info[0])
+            notified = Notifications.get_latest("gameslist", list({info[0] for info in query}))
 
-                if notif is None:
-                    release_date = datetime.utcfromtimestamp(int(info[2])).strftime("%b %d %Y")
-
-                    # noinspection PyArgumentList
-                    new_notification = Notifications(
-                        user_id=info[1],
-                        media_type="gameslist",
-                        media_id=info[0],
-                        payload_json=json.dumps({"name": info[3], "release_date": release_date})
-                    )
-                    db.session.add(new_notification)
+            new_notifications = [dict(user_id=user_id, media_id=media_id, name=name,
+                                      release_date=datetime.utcfromtimestamp(int(release_date)).date())
+                                 for media_id, user_id, release_date, name in query
+                                 if (user_id, media_id) not in notified]
 
+            Notifications.bulk_add("gameslist", new_notifications)
             db.session.commit()
         except Exception as e:
             current_app.logger.error(f"Error occurred while checking for new releasing game: {e}")
             db.session.rollback()
+            raise
+
+        return len(new_notifications)
 
     @staticmethod
     def form_only() -> List[str]:
@@ -198,7 +167,7 @@ class GamesList(MediaListMixin, db.Model):
 
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
-    media_id = db.Column(db.Integer, db.ForeignKey("games.id"), nullable=False)
+    media_id = db.Column(db.Integer, db.ForeignKey("games.id"), nullable=False, index=True)
     status = db.Column(db.Enum(Status), nullable=False)
     completion = db.Column(db.Boolean)
     playtime = db.Column(db.Integer)
@@ -208,6 +177,11 @@ class GamesList(MediaListMixin, db.Model):
     comment = db.Column(db.Text)
     completion_date = db.Column(db.DateTime)
 
+    __table_args__ = (
+        db.Index("ix_games_list_user_id_media_id", "user_id", "media_id"),
+        db.Index("ix_games_list_user_id_status", "user_id", "status"),
+    )
+
     # --- Relationships -----------------------------------------------------------
     media = db.relationship("Games", back_populates="list_info", lazy=False)
 
@@ -229,7 +203,8 @@ class GamesList(MediaListMixin, db.Model):
             media_dict = {c.name: getattr(self, c.name) for c in self.__table__.columns}
 
         # Add more info
-        media_dict["media_cover"] = self.media.media_cover
+        media_dict["media_cover"] = self.media.media_thumb
+        media_dict["media_cover_sources"] = self.media.media_thumb_sources
         media_dict["media_name"] = self.media.name
         media_dict["all_status"] = self.Status.to_list()
 
@@ -298,12 +273,11 @@ class GamesList(MediaListMixin, db.Model):
 
         return stats
 
-    @staticmethod
-    def update_time_spent(old_value: int = 0, new_value: int = 0):
+    @classmethod
+    def update_time_spent(cls, old_value: int = 0, new_value: int = 0):
         """ Computed new time for the user """
 
-        old_time = current_user.time_spent_games
-        current_user.time_spent_games = old_time + (new_value - old_value)
+        TimeSpentLedger.record(current_user, cls.GROUP, new_value - old_value)
 
     @classmethod
     def get_available_sorting(cls, is_feeling: bool) -> Dict:
@@ -335,6 +309,8 @@ class GamesGenre(db.Model):
     media_id = db.Column(db.Integer, db.ForeignKey("games.id"), nullable=False)
     genre = db.Column(db.String(100), nullable=False)
 
+    __table_args__ = (db.Index("ix_games_genre_media_id_genre", "media_id", "genre"),)
+
     @staticmethod
     def get_available_genres() -> List:
         """ Return the available genres for the games """
@@ -352,7 +328,7 @@ class GamesPlatforms(db.Model):
     GROUP = MediaType.GAMES
 
     id = db.Column(db.Integer, primary_key=True)
-    media_id = db.Column(db.Integer, db.ForeignKey('games.id'), nullable=False)
+    media_id = db.Column(db.Integer, db.ForeignKey('games.id'), nullable=False, index=True)
     name = db.Column(db.String(150))
 
 
@@ -362,7 +338,7 @@ class GamesCompanies(db.Model):
     GROUP = MediaType.GAMES
 
     id = db.Column(db.Integer, primary_key=True)
-    media_id = db.Column(db.Integer, db.ForeignKey("games.id"), nullable=False)
+    media_id = db.Column(db.Integer, db.ForeignKey("games.id"), nullable=False, index=True)
     name = db.Column(db.String(100))
     publisher = db.Column(db.Boolean)
     developer = db.Column(db.Boolean)
@@ -376,9 +352,11 @@ class GamesLabels(MediaLabelMixin, db.Model):
 
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
-    media_id = db.Column(db.Integer, db.ForeignKey("games.id"), nullable=False)
+    media_id = db.Column(db.Integer, db.ForeignKey("games.id"), nullable=False, index=True)
     label = db.Column(db.String(64), nullable=False)
 
+    __table_args__ = (db.Index("ix_games_labels_user_id_label", "user_id", "label", "media_id"),)
+
     # --- Relationships -----------------------------------------------------------
     media = db.relationship("Games", lazy=False)
 
@@ -390,7 +368,8 @@ class GamesLabels(MediaLabelMixin, db.Model):
             media_dict = {c.name: getattr(self, c.name) for c in self.__table__.columns}
 
         # Add more info
-        media_dict["media_cover"] = self.media.media_cover
+        media_dict["media_cover"] = self.media.media_thumb
+        media_dict["media_cover_sources"] = self.media.media_thumb_sources
         media_dict["media_name"] = self.media.name
 
         return media_dict
\ No newline at end of file
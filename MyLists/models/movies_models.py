@@ -1,5 +1,4 @@
 from __future__ import annotations
-import json
 from datetime import datetime, timedelta
 from enum import Enum
 from typing import List, Dict
@@ -7,7 +6,7 @@ from flask import current_app, abort
 from sqlalchemy import func, text, and_
 from MyLists import db
 from MyLists.api.auth import current_user
-from MyLists.models.user_models import User, UserLastUpdate, Notifications
+from MyLists.models.user_models import User, Notifications, TimeSpentLedger
 from MyLists.models.utils_models import MediaMixin, MediaListMixin, MediaLabelMixin
 from MyLists.utils.enums import MediaType, Status, ExtendedEnum
 from MyLists.utils.utils import change_air_format
@@ -37,7 +36,8 @@ class Movies(MediaMixin, db.Model):
     revenue = db.Column(db.Float)
     tagline = db.Column(db.String(30))
     image_cover = db.Column(db.String(100), nullable=False)
-    api_id = db.Column(db.Integer, nullable=False)
+    cover_formats = db.Column(db.String(30))
+    api_id = db.Column(db.Integer, nullable=False, unique=True, index=True)
     lock_status = db.Column(db.Boolean, default=0)
 
     genres = db.relationship("MoviesGenre", backref="movies", lazy=True)
@@ -54,10 +54,12 @@ class Movies(MediaMixin, db.Model):
 
         if coming_next:
             media_dict["media_cover"] = self.media_cover
+            media_dict["media_cover_sources"] = self.media_cover_sources
             media_dict["date"] = change_air_format(self.release_date)
             return media_dict
 
         media_dict["media_cover"] = self.media_cover
+        media_dict["media_cover_sources"] = self.media_cover_sources
         media_dict["formated_date"] = change_air_format(self.release_date)
         media_dict["actors"] = self.actors_list
         media_dict["genres"] = self.genres_list
@@ -97,37 +99,9 @@ class Movies(MediaMixin, db.Model):
         return [q.to_dict(coming_next=True) for q in query]
 
     @classmethod
-    def remove_movies(cls):
-        """ Remove all movies that are not present in a User list from the database and the disk """
-
-        try:
-            # Movies remover
-            movies_to_delete = (cls.query.outerjoin(MoviesList, MoviesList.media_id == cls.id)
-                                .filter(MoviesList.media_id.is_(None)).all())
-            count = 0
-            for movie in movies_to_delete:
-                # Delete related records
-                MoviesActors.query.filter_by(media_id=movie.id).delete()
-                MoviesGenre.query.filter_by(media_id=movie.id).delete()
-                UserLastUpdate.query.filter_by(media_type=MediaType.MOVIES, media_id=movie.id).delete()
-                Notifications.query.filter_by(media_type="movieslist", media_id=movie.id).delete()
-
-                # Delete movie
-                Movies.query.filter_by(id=movie.id).delete()
-
-                count += 1
-                current_app.logger.info(f"Removed movie with ID: [{movie.id}]")
-
-            current_app.logger.info(f"Total movies removed: {count}")
-        except Exception as e:
-            db.session.rollback()
-            current_app.logger.error(f"Error occurred while removing movies and related records: {str(e)}")
-        finally:
-            db.session.close()
-
-    @classmethod
-    def get_new_releasing_movies(cls):
-        """ Check for the new releasing movies in a week or less from the TMDB API """
+    def get_new_releasing_movies(cls) -> int:
+        """ Check for the new releasing movies in a week or less from the TMDB API. Return the number of
+        notifications added """
 
         try:
             # noinspection PyComparisonWithNone
@@ -140,27 +114,21 @@ class Movies(MediaMixin, db.Model):
                 MoviesList.status != Status.PLAN_TO_WATCH,
                 ))).all()
 
-            for info in query:
-                notif = Notifications.seek(info[1], "movieslist", info[0])
-
-                if notif is None:
-                    release_date = datetime.strptime(info[2], "%Y-%m-%d").strftime("%b %d %Y")
-                    payload = {"name": info[3].name,
-                               "release_date": release_date}
+            notified = Notifications.get_latest("movieslist", list({info[0] for info in query}))
 
-                    # noinspection PyArgumentList
-                    new_notification = Notifications(
-                        user_id=info[1],
-                        media_type="movieslist",
-                        media_id=info[0],
-                        payload_json=json.dumps(payload)
-                    )
-                    db.session.add(new_notification)
+            new_notifications = [dict(user_id=user_id, media_id=media_id, name=name,
+                                      release_date=datetime.strptime(release_date, "%Y-%m-%d").date())
+                                 for media_id, user_id, release_date, name in query
+                                 if (user_id, media_id) not in notified]
 
+            Notifications.bulk_add("movieslist", new_notifications)
             db.session.commit()
         except Exception as e:
-            current_app.logger.error(f"Error occurred while checking for new releasing anime: {e}")
+            current_app.logger.error(f"Error occurred while checking for new releasing movies: {e}")
             db.session.rollback()
+            raise
+
+        return len(new_notifications)
 
     """ --- Static methods -------------------------------------------------------- """
     @staticmethod
@@ -182,7 +150,7 @@ class MoviesList(MediaListMixin, db.Model):
 
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
-    media_id = db.Column(db.Integer, db.ForeignKey("movies.id"), nullable=False)
+    media_id = db.Column(db.Integer, db.ForeignKey("movies.id"), nullable=False, index=True)
     status = db.Column(db.Enum(Status), nullable=False)
     rewatched = db.Column(db.Integer, nullable=False, default=0)
     total = db.Column(db.Integer)
@@ -192,6 +160,11 @@ class MoviesList(MediaListMixin, db.Model):
     comment = db.Column(db.Text)
     completion_date = db.Column(db.DateTime)
 
+    __table_args__ = (
+        db.Index("ix_movies_list_user_id_media_id", "user_id", "media_id"),
+        db.Index("ix_movies_list_user_id_status", "user_id", "status"),
+    )
+
     # --- Relationships -----------------------------------------------------------
     media = db.relationship("Movies", back_populates="list_info", lazy=False)
 
@@ -209,7 +182,8 @@ class MoviesList(MediaListMixin, db.Model):
             media_dict = {c.name: getattr(self, c.name) for c in self.__table__.columns}
 
         # Add more info
-        media_dict["media_cover"] = self.media.media_cover
+        media_dict["media_cover"] = self.media.media_thumb
+        media_dict["media_cover_sources"] = self.media.media_thumb_sources
         media_dict["media_name"] = self.media.name
         media_dict["all_status"] = self.Status.to_list()
 
@@ -248,8 +222,7 @@ class MoviesList(MediaListMixin, db.Model):
     def update_time_spent(self, old_value: int = 0, new_value: int = 0):
         """ Return new computed time for the movies """
 
-        old_time = current_user.time_spent_movies
-        current_user.time_spent_movies = old_time + ((new_value - old_value) * self.media.duration)
+        TimeSpentLedger.record(current_user, self.GROUP, (new_value - old_value) * self.media.duration)
 
     @classmethod
     def get_media_stats(cls, user: User) -> List[Dict]:
@@ -305,6 +278,8 @@ class MoviesGenre(db.Model):
     genre = db.Column(db.String(100), nullable=False)
     genre_id = db.Column(db.Integer, nullable=False)
 
+    __table_args__ = (db.Index("ix_movies_genre_media_id_genre", "media_id", "genre"),)
+
     @staticmethod
     def get_available_genres() -> List:
         """ Return the available genres for the movies """
@@ -319,7 +294,7 @@ class MoviesActors(db.Model):
     GROUP = MediaType.MOVIES
 
     id = db.Column(db.Integer, primary_key=True)
-    media_id = db.Column(db.Integer, db.ForeignKey("movies.id"), nullable=False)
+    media_id = db.Column(db.Integer, db.ForeignKey("movies.id"), nullable=False, index=True)
     name = db.Column(db.String(150))
 
 
@@ -331,9 +306,11 @@ class MoviesLabels(MediaLabelMixin, db.Model):
 
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
-    media_id = db.Column(db.Integer, db.ForeignKey("movies.id"), nullable=False)
+    media_id = db.Column(db.Integer, db.ForeignKey("movies.id"), nullable=False, index=True)
     label = db.Column(db.String(64), nullable=False)
 
+    __table_args__ = (db.Index("ix_movies_labels_user_id_label", "user_id", "label", "media_id"),)
+
     # --- Relationships -----------------------------------------------------------
     media = db.relationship("Movies", lazy=False)
 
@@ -345,7 +322,8 @@ class MoviesLabels(MediaLabelMixin, db.Model):
             media_dict = {c.name: getattr(self, c.name) for c in self.__table__.columns}
 
         # Add more info
-        media_dict["media_cover"] = self.media.media_cover
+        media_dict["media_cover"] = self.media.media_thumb
+        media_dict["media_cover_sources"] = self.media.media_thumb_sources
         media_dict["media_name"] = self.media.name
 
         return media_dict
@@ -1,17 +1,18 @@
 from __future__ import annotations
-import json
+from bisect import bisect_left
 from datetime import datetime, timedelta
 from enum import Enum
-from typing import List, Dict
+from itertools import accumulate
+from typing import List, Dict, Tuple, Iterable
 from flask import current_app, abort
-from sqlalchemy import func, text, extract, and_, not_
+from sqlalchemy import func, text, extract, and_, not_, update
 from sqlalchemy.sql.functions import count
 from MyLists import db
 from MyLists.api.auth import current_user
-from MyLists.models.user_models import User, UserLastUpdate, Notifications
+from MyLists.models.user_models import User, Notifications, TimeSpentLedger
 from MyLists.models.utils_models import MediaMixin, MediaListMixin, MediaLabelMixin
 from MyLists.utils.enums import MediaType, Status, ExtendedEnum
-from MyLists.utils.utils import change_air_format
+from MyLists.utils.utils import change_air_format, get_models_group
 
 
 class TVModel(db.Model):
@@ -40,7 +41,8 @@ class TVModel(db.Model):
     synopsis = db.Column(db.Text)
     popularity = db.Column(db.Float)
     image_cover = db.Column(db.String(100), nullable=False)
-    api_id = db.Column(db.Integer, nullable=False)
+    cover_formats = db.Column(db.String(30))
+    api_id = db.Column(db.Integer, nullable=False, unique=True, index=True)
     last_update = db.Column(db.DateTime, nullable=False)
     lock_status = db.Column(db.Boolean, default=0)
 
@@ -74,10 +76,12 @@ class TVModel(db.Model):
 
         if coming_next:
             media_dict["media_cover"] = self.media_cover
+            media_dict["media_cover_sources"] = self.media_cover_sources
             media_dict["date"] = change_air_format(self.next_episode_to_air)
             return media_dict
 
         media_dict["media_cover"] = self.media_cover
+        media_dict["media_cover_sources"] = self.media_cover_sources
         media_dict["formated_date"] = self.formated_date
         media_dict["actors"] = self.actors_list
         media_dict["genres"] = self.genres_list
@@ -137,6 +141,96 @@ class TVModel(db.Model):
         return [q.to_dict(coming_next=True) for q in query]
 
     """ --- Static methods -------------------------------------------------------- """
+    @staticmethod
+    def get_season_positions(seasons_data: List[Dict], totals: Iterable[int]) -> Dict[int, Tuple[int, int]]:
+        """ Map each number of episodes watched of <totals> to its (season, episode) in <seasons_data>. The
+        cumulative episodes are computed once and each total is bisected into them """
+
+        cumulated = list(accumulate(season["episodes"] for season in seasons_data))
+
+        positions = {}
+        for total in totals:
+            index = bisect_left(cumulated, total)
+            if index == len(cumulated):
+                # More episodes watched than aired: last episode of the last season
+                positions[total] = (seasons_data[-1]["season"], seasons_data[-1]["episodes"])
+            else:
+                positions[total] = (seasons_data[index]["season"], total - (cumulated[index - 1] if index else 0))
+
+        return positions
+
+    @classmethod
+    def remap_list_positions(cls, media_id: int, seasons_data: List[Dict]) -> int:
+        """ Recompute from their <total> the <current_season> and <last_episode_watched> of the users having the
+        media, after its seasons changed. Only the distinct totals are mapped and the positions are written with one
+        UPDATE. Return the number of rows updated """
+
+        if not seasons_data:
+            return 0
+
+        media_list = get_models_group(cls.GROUP)[1]
+        totals = [total for total, in (db.session.query(media_list.total)
+                                       .filter(media_list.media_id == media_id, media_list.total.is_not(None))
+                                       .distinct())]
+        if not totals:
+            return 0
+
+        positions = cls.get_season_positions(seasons_data, totals)
+
+        result = db.session.execute(
+            update(media_list)
+            .where(media_list.media_id == media_id, media_list.total.is_not(None))
+            .values(current_season=db.case({total: season for total, (season, _) in positions.items()},
+                                           value=media_list.total),
+                    last_episode_watched=db.case({total: episode for total, (_, episode) in positions.items()},
+                                                 value=media_list.total))
+            .execution_options(synchronize_session=False)
+        )
+
+        return result.rowcount
+
+    @classmethod
+    def add_new_releasing_notifications(cls) -> int:
+        """ Notify the users of the episodes airing in a week or less. The latest notification of each (user, media)
+        is fetched in one query and the new notifications are inserted in one statement. Return the number of
+        notifications added """
+
+        media_list = get_models_group(cls.GROUP)[1]
+        media_type = f"{cls.GROUP.value}list"
+
+        try:
+            # noinspection PyComparisonWithNone
+            query = (db.session.query(cls.id, cls.episode_to_air, cls.season_to_air, cls.name,
+                                      cls.next_episode_to_air, media_list.user_id)
+            .join(media_list, cls.id == media_list.media_id)
+            .filter(and_(
+                cls.next_episode_to_air != None,
+                cls.next_episode_to_air > datetime.utcnow(),
+                cls.next_episode_to_air <= datetime.utcnow() + timedelta(days=7),
+                not_(media_list.status.in_([Status.RANDOM, Status.DROPPED]))
+            ))).all()
+
+            latest = Notifications.get_latest(media_type, list({info[0] for info in query}))
+
+            new_notifications = []
+            for media_id, episode, season, name, next_episode_to_air, user_id in query:
+                notified = latest.get((user_id, media_id))
+                if notified and None not in notified and notified >= (season, episode):
+                    continue
+
+                new_notifications.append(dict(user_id=user_id, media_id=media_id, name=name, season=season,
+                                              episode=episode,
+                                              release_date=datetime.strptime(next_episode_to_air, "%Y-%m-%d").date()))
+
+            Notifications.bulk_add(media_type, new_notifications)
+            db.session.commit()
+        except Exception as e:
+            current_app.logger.error(f"Error occurred while checking for new releasing {cls.GROUP.value}: {e}")
+            db.session.rollback()
+            raise
+
+        return len(new_notifications)
+
     @staticmethod
     def form_only() -> List[str]:
         """ Return the allowed fields for a form """
@@ -161,83 +255,9 @@ class Series(MediaMixin, TVModel):
     list_info = db.relationship("SeriesList", back_populates="media", lazy="dynamic")
 
     @classmethod
-    def remove_series(cls):
-        """ Remove all the series that are not present in a User list from the database and the disk """
-
-        try:
-            # noinspection PyComparisonWithNone
-            series_to_delete = (cls.query.outerjoin(SeriesList, SeriesList.media_id == cls.id)
-                                .filter(SeriesList.media_id == None).all())
-
-            count_ = 0
-            for series in series_to_delete:
-                # Delete related records
-                SeriesActors.query.filter_by(media_id=series.id).delete()
-                SeriesGenre.query.filter_by(media_id=series.id).delete()
-                SeriesNetwork.query.filter_by(media_id=series.id).delete()
-                SeriesEpisodesPerSeason.query.filter_by(media_id=series.id).delete()
-                UserLastUpdate.query.filter_by(media_type=MediaType.SERIES, media_id=series.id).delete()
-                Notifications.query.filter_by(media_type="serieslist", media_id=series.id).delete()
-
-                # Delete series
-                Series.query.filter_by(id=series.id).delete()
-
-                count_ += 1
-                current_app.logger.info(f"Removed series with ID: [{series.id}]")
-
-            current_app.logger.info(f"Total series removed: {count_}")
-        except Exception as e:
-            db.session.rollback()
-            current_app.logger.error(f"Error occurred while removing series and related records: {str(e)}")
-        finally:
-            db.session.close()
-
-    @classmethod
-    def get_new_releasing_series(cls):
+    def get_new_releasing_series(cls) -> int:
         """ Check for the new releasing series in a week or less from the TMDB API """
-
-        try:
-            # noinspection PyComparisonWithNone
-            query = (db.session.query(cls.id, cls.episode_to_air, cls.season_to_air, cls.name, cls.next_episode_to_air,
-                                      SeriesList.user_id)
-            .join(SeriesList, cls.id == SeriesList.media_id)
-            .filter(and_(
-                cls.next_episode_to_air != None,
-                cls.next_episode_to_air > datetime.utcnow(),
-                cls.next_episode_to_air <= datetime.utcnow() + timedelta(days=7),
-                not_(SeriesList.status.in_([Status.RANDOM, Status.DROPPED]))
-            ))).all()
-
-            for info in query:
-                notif = Notifications.seek(info[5], "serieslist", info[0])
-
-                if notif:
-                    payload = json.loads(notif.payload_json)
-                    if (int(payload["season"]) < int(info[2]) or
-                            (int(payload["season"]) == int(info[2]) and int(payload["episode"]) < int(info[1]))):
-                        pass
-                    else:
-                        continue
-
-                release_date = datetime.strptime(info[4], "%Y-%m-%d").strftime("%b %d %Y")
-                payload = {"name": info[3],
-                           "release_date": release_date,
-                           "season": f"{info[2]:02d}",
-                           "episode": f"{info[1]:02d}"}
-
-                # noinspection PyArgumentList
-                new_notification = Notifications(
-                    user_id=info[5],
-                    media_type="serieslist",
-                    media_id=info[0],
-                    payload_json=json.dumps(payload)
-                )
-                db.session.add(new_notification)
-
-            db.session.commit()
-        except Exception as e:
-            current_app.logger.error(f"Error occurred while checking for new releasing series: {e}")
-            db.session.rollback()
+        return cls.add_new_releasing_notifications()
 
 
 class SeriesList(MediaListMixin, db.Model):
@@ -252,7 +272,7 @@ class SeriesList(MediaListMixin, db.Model):
 
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    media_id = db.Column(db.Integer, db.ForeignKey('series.id'), nullable=False)
+    media_id = db.Column(db.Integer, db.ForeignKey('series.id'), nullable=False, index=True)
     current_season = db.Column(db.Integer, nullable=False)
     last_episode_watched = db.Column(db.Integer, nullable=False)
     status = db.Column(db.Enum(Status), nullable=False)
@@ -264,6 +284,11 @@ class SeriesList(MediaListMixin, db.Model):
     comment = db.Column(db.Text)
     completion_date = db.Column(db.DateTime)
 
+    __table_args__ = (
+        db.Index("ix_series_list_user_id_media_id", "user_id", "media_id"),
+        db.Index("ix_series_list_user_id_status", "user_id", "status"),
+    )
+
     # --- Relationships -----------------------------------------------------------
     media = db.relationship("Series", back_populates="list_info", lazy="joined")
 
@@ -285,7 +310,8 @@ class SeriesList(MediaListMixin, db.Model):
             media_dict = {c.name: getattr(self, c.name) for c in self.__table__.columns}
 
         # Add more info
-        media_dict["media_cover"] = self.media.media_cover
+        media_dict["media_cover"] = self.media.media_thumb
+        media_dict["media_cover_sources"] = self.media.media_thumb_sources
         media_dict["media_name"] = self.media.name
         media_dict["all_status"] = self.Status.to_list()
         media_dict["eps_per_season"] = self.media.eps_per_season_list
@@ -306,8 +332,7 @@ class SeriesList(MediaListMixin, db.Model):
     def update_time_spent(self, old_value: int = 0, new_value: int = 0):
         """ Compute the new time spent for the user """
 
-        old_time = current_user.time_spent_series
-        current_user.time_spent_series = old_time + ((new_value - old_value) * self.media.duration)
+        TimeSpentLedger.record(current_user, self.GROUP, (new_value - old_value) * self.media.duration)
 
     @classmethod
     def get_media_stats(cls, user: User) -> List[Dict]:
@@ -364,6 +389,8 @@ class SeriesGenre(db.Model):
     genre = db.Column(db.String(100), nullable=False)
     genre_id = db.Column(db.Integer, nullable=False)
 
+    __table_args__ = (db.Index("ix_series_genre_media_id_genre", "media_id", "genre"),)
+
     @staticmethod
     def get_available_genres() -> List:
         """ Return the available genres for the series """
@@ -377,7 +404,7 @@ class SeriesEpisodesPerSeason(db.Model):
     GROUP = MediaType.SERIES
 
     id = db.Column(db.Integer, primary_key=True)
-    media_id = db.Column(db.Integer, db.ForeignKey("series.id"), nullable=False)
+    media_id = db.Column(db.Integer, db.ForeignKey("series.id"), nullable=False, index=True)
     season = db.Column(db.Integer, nullable=False)
     episodes = db.Column(db.Integer, nullable=False)
 
@@ -388,7 +415,7 @@ class SeriesNetwork(db.Model):
     GROUP = MediaType.SERIES
 
     id = db.Column(db.Integer, primary_key=True)
-    media_id = db.Column(db.Integer, db.ForeignKey("series.id"), nullable=False)
+    media_id = db.Column(db.Integer, db.ForeignKey("series.id"), nullable=False, index=True)
     network = db.Column(db.String(150), nullable=False)
 
 
@@ -398,7 +425,7 @@ class SeriesActors(db.Model):
     GROUP = MediaType.SERIES
 
     id = db.Column(db.Integer, primary_key=True)
-    media_id = db.Column(db.Integer, db.ForeignKey("series.id"), nullable=False)
+    media_id = db.Column(db.Integer, db.ForeignKey("series.id"), nullable=False, index=True)
     name = db.Column(db.String(150))
 
 
@@ -410,9 +437,11 @@ class SeriesLabels(MediaLabelMixin, db.Model):
 
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
-    media_id = db.Column(db.Integer, db.ForeignKey("series.id"), nullable=False)
+    media_id = db.Column(db.Integer, db.ForeignKey("series.id"), nullable=False, index=True)
     label = db.Column(db.String(64), nullable=False)
 
+    __table_args__ = (db.Index("ix_series_labels_user_id_label", "user_id", "label", "media_id"),)
+
     # --- Relationships -----------------------------------------------------------
     media = db.relationship("Series", lazy=False)
 
@@ -424,7 +453,8 @@ class SeriesLabels(MediaLabelMixin, db.Model):
             media_dict = {c.name: getattr(self, c.name) for c in self.__table__.columns}
 
         # Add more info
-        media_dict["media_cover"] = self.media.media_cover
+        media_dict["media_cover"] = self.media.media_thumb
+        media_dict["media_cover_sources"] = self.media.media_thumb_sources
         media_dict["media_name"] = self.media.name
 
         return media_dict
@@ -447,84 +477,9 @@ class Anime(MediaMixin, TVModel):
     list_info = db.relationship('AnimeList', back_populates='media', lazy='dynamic')
 
     @classmethod
-    def remove_anime(cls):
-        """ Remove all anime that are not present in a User list from the database and the disk """
-
-        try:
-            # Anime remover
-            anime_to_delete = (cls.query.outerjoin(AnimeList, AnimeList.media_id == cls.id)
-                               .filter(AnimeList.media_id.is_(None)).all())
-
-            count_ = 0
-            for anime in anime_to_delete:
-                # Delete related records
-                AnimeActors.query.filter_by(media_id=anime.id).delete()
-                AnimeGenre.query.filter_by(media_id=anime.id).delete()
-                AnimeNetwork.query.filter_by(media_id=anime.id).delete()
-                AnimeEpisodesPerSeason.query.filter_by(media_id=anime.id).delete()
-                UserLastUpdate.query.filter_by(media_type=MediaType.ANIME, media_id=anime.id).delete()
-                Notifications.query.filter_by(media_type="animelist", media_id=anime.id).delete()
-
-                # Delete Anime
-                Anime.query.filter_by(id=anime.id).delete()
-
-                count_ += 1
-                current_app.logger.info(f"Removed anime with ID: [{anime.id}]")
-
-            current_app.logger.info(f"Total anime removed: {count_}")
-        except Exception as e:
-            db.session.rollback()
-            current_app.logger.error(f"Error occurred while removing anime and related records: {str(e)}")
-        finally:
-            db.session.close()
-
-    @classmethod
-    def get_new_releasing_anime(cls):
+    def get_new_releasing_anime(cls) -> int:
         """ Check for the new releasing anime in a week or less from the TMDB API """
-
-        try:
-            # noinspection PyComparisonWithNone
-            query = (db.session.query(cls.id, cls.episode_to_air, cls.season_to_air, cls.name,
-                                      cls.next_episode_to_air, AnimeList.user_id)
-            .join(AnimeList, cls.id == AnimeList.media_id)
-            .filter(and_(
-                cls.next_episode_to_air != None,
-                cls.next_episode_to_air > datetime.utcnow(),
-                cls.next_episode_to_air <= datetime.utcnow() + timedelta(days=7),
-                not_(AnimeList.status.in_(["RANDOM", "DROPPED"]))
-            ))).all()
-
-            for info in query:
-                notif = Notifications.seek(info[5], "animelist", info[0])
-
-                if notif:
-                    payload = json.loads(notif.payload_json)
-                    if (int(payload["season"]) < int(info[2]) or
-                            (int(payload["season"]) == int(info[2])
-                             and int(payload["episode"]) < int(info[1]))):
-                        pass
-                    else:
-                        continue
-
-                release_date = datetime.strptime(info[4], "%Y-%m-%d").strftime("%b %d %Y")
-                payload = {"name": info[3],
-                           "release_date": release_date,
-                           "season": f"{info[2]:02d}",
-                           "episode": f"{info[1]:02d}"}
-
-                # noinspection PyArgumentList
-                new_notification = Notifications(
-                    user_id=info[5],
-                    media_type="animelist",
-                    media_id=info[0],
-                    payload_json=json.dumps(payload)
-                )
-                db.session.add(new_notification)
-
-            db.session.commit()
-        except Exception as e:
-            current_app.logger.error(f"Error occurred while checking for new releasing anime: {e}")
-            db.session.rollback()
+        return cls.add_new_releasing_notifications()
 
 
 class AnimeList(MediaListMixin, db.Model):
@@ -539,7 +494,7 @@ class AnimeList(MediaListMixin, db.Model):
 
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    media_id = db.Column(db.Integer, db.ForeignKey('anime.id'), nullable=False)
+    media_id = db.Column(db.Integer, db.ForeignKey('anime.id'), nullable=False, index=True)
     current_season = db.Column(db.Integer, nullable=False)
     last_episode_watched = db.Column(db.Integer, nullable=False)
     status = db.Column(db.Enum(Status), nullable=False)
@@ -551,6 +506,11 @@ class AnimeList(MediaListMixin, db.Model):
     comment = db.Column(db.Text)
     completion_date = db.Column(db.DateTime)
 
+    __table_args__ = (
+        db.Index("ix_anime_list_user_id_media_id", "user_id", "media_id"),
+        db.Index("ix_anime_list_user_id_status", "user_id", "status"),
+    )
+
     # --- Relationships -------------------------------------------------------------
     media = db.relationship("Anime", back_populates='list_info', lazy=False)
 
@@ -572,7 +532,8 @@ class AnimeList(MediaListMixin, db.Model):
             media_dict = {c.name: getattr(self, c.name) for c in self.__table__.columns}
 
         # Add more info
-        media_dict["media_cover"] = self.media.media_cover
+        media_dict["media_cover"] = self.media.media_thumb
+        media_dict["media_cover_sources"] = self.media.media_thumb_sources
         media_dict["media_name"] = self.media.name
         media_dict["all_status"] = self.Status.to_list()
         media_dict["eps_per_season"] = self.media.eps_per_season_list
@@ -593,8 +554,7 @@ class AnimeList(MediaListMixin, db.Model):
     def update_time_spent(self, old_value: int = 0, new_value: int = 0):
         """ Compute new anime time spent for the current user """
 
-        old_time = current_user.time_spent_anime
-        current_user.time_spent_anime = old_time + ((new_value - old_value) * self.media.duration)
+        TimeSpentLedger.record(current_user, self.GROUP, (new_value - old_value) * self.media.duration)
 
     @classmethod
     def get_media_stats(cls, user: User) -> List[Dict]:
@@ -645,6 +605,8 @@ class AnimeGenre(db.Model):
     genre = db.Column(db.String(100), nullable=False)
     genre_id = db.Column(db.Integer, nullable=False)
 
+    __table_args__ = (db.Index("ix_anime_genre_media_id_genre", "media_id", "genre"),)
+
     @staticmethod
     def get_available_genres() -> List:
         """ Return the available genres for the anime """
@@ -661,7 +623,7 @@ class AnimeEpisodesPerSeason(db.Model):
     GROUP = MediaType.ANIME
 
     id = db.Column(db.Integer, primary_key=True)
-    media_id = db.Column(db.Integer, db.ForeignKey('anime.id'), nullable=False)
+    media_id = db.Column(db.Integer, db.ForeignKey('anime.id'), nullable=False, index=True)
     season = db.Column(db.Integer, nullable=False)
     episodes = db.Column(db.Integer, nullable=False)
 
@@ -672,7 +634,7 @@ class AnimeNetwork(db.Model):
     GROUP = MediaType.ANIME
 
     id = db.Column(db.Integer, primary_key=True)
-    media_id = db.Column(db.Integer, db.ForeignKey('anime.id'), nullable=False)
+    media_id = db.Column(db.Integer, db.ForeignKey('anime.id'), nullable=False, index=True)
     network = db.Column(db.String(150), nullable=False)
 
 
@@ -682,7 +644,7 @@ class AnimeActors(db.Model):
     GROUP = MediaType.ANIME
 
     id = db.Column(db.Integer, primary_key=True)
-    media_id = db.Column(db.Integer, db.ForeignKey("anime.id"), nullable=False)
+    media_id = db.Column(db.Integer, db.ForeignKey("anime.id"), nullable=False, index=True)
     name = db.Column(db.String(150))
 
 
@@ -694,9 +656,11 @@ class AnimeLabels(MediaLabelMixin, db.Model):
 
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
-    media_id = db.Column(db.Integer, db.ForeignKey("anime.id"), nullable=False)
+    media_id = db.Column(db.Integer, db.ForeignKey("anime.id"), nullable=False, index=True)
     label = db.Column(db.String(64), nullable=False)
 
+    __table_args__ = (db.Index("ix_anime_labels_user_id_label", "user_id", "label", "media_id"),)
+
     # --- Relationships -----------------------------------------------------------
     media = db.relationship("Anime", lazy=False)
 
@@ -708,7 +672,8 @@ class AnimeLabels(MediaLabelMixin, db.Model):
             media_dict = {c.name: getattr(self, c.name) for c in self.__table__.columns}
 
         # Add more info
-        media_dict["media_cover"] = self.media.media_cover
+        media_dict["media_cover"] = self.media.media_thumb
+        media_dict["media_cover_sources"] = self.media.media_thumb_sources
         media_dict["media_name"] = self.media.name
 
         return media_dict
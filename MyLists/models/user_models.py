@@ -1,4 +1,5 @@
 from __future__ import annotations
+import json
 import secrets
 from datetime import datetime, timedelta
 from enum import Enum
@@ -8,8 +9,7 @@ import jwt
 import pytz
 from flask import url_for, current_app, abort
 from flask_bcrypt import check_password_hash
-from sqlalchemy import desc, func, Integer, case, select, asc
-from sqlalchemy.ext.hybrid import hybrid_property
+from sqlalchemy import desc, func, select, asc, insert, event
 from MyLists import db
 from MyLists.api.auth import current_user
 from MyLists.utils.enums import RoleType, MediaType, Status
@@ -111,6 +111,14 @@ class User(db.Model):
     time_spent_games = db.Column(db.Integer, nullable=False, default=0)
     time_spent_books = db.Column(db.Integer, nullable=False, default=0)
 
+    # Levels computed from the time spent (see <update_levels>)
+    profile_level = db.Column(db.Integer, nullable=False, default=0, index=True)
+    series_level = db.Column(db.Integer, nullable=False, default=0)
+    anime_level = db.Column(db.Integer, nullable=False, default=0)
+    movies_level = db.Column(db.Integer, nullable=False, default=0)
+    games_level = db.Column(db.Integer, nullable=False, default=0)
+    books_level = db.Column(db.Integer, nullable=False, default=0)
+
     profile_views = db.Column(db.Integer, nullable=False, default=0)
     series_views = db.Column(db.Integer, nullable=False, default=0)
     anime_views = db.Column(db.Integer, nullable=False, default=0)
@@ -169,36 +177,26 @@ class User(db.Model):
         """ Return the number of followers of the user """
         return self.followers.count()
 
-    @hybrid_property
-    def profile_level(self) -> int:
-        """ Return the user's profile level """
-
-        # Calculate <total_time>
-        total_time = self.time_spent_series + self.time_spent_movies
-
-        if self.add_anime: total_time += self.time_spent_anime
-        if self.add_books: total_time += self.time_spent_books
-        if self.add_games: total_time += self.time_spent_games
+    def update_levels(self):
+        """ Compute and store the <profile_level> and the level of each media from the time spent. Called before each
+        insert/update of the user (see <_update_user_levels>) """
 
-        return int(get_level(total_time))
-
-    # noinspection PyMethodParameters
-    @profile_level.expression
-    def profile_level(cls) -> int:
-        """ Return the user's profile level as an SQLAlchemy query for the <Hall of Fame> endpoint """
+        for media_type in MediaType:
+            time_spent = getattr(self, f"time_spent_{media_type.value}") or 0
+            setattr(self, f"{media_type.value}_level", int(f"{get_level(time_spent):.2f}".split(".")[0]))
 
         # Calculate <total_time>
-        total_time = cls.time_spent_series + cls.time_spent_movies
-        total_time = case(*[(cls.add_anime, total_time + cls.time_spent_anime)], else_=total_time)
-        total_time = case(*[(cls.add_books, total_time + cls.time_spent_books)], else_=total_time)
-        total_time = case(*[(cls.add_games, total_time + cls.time_spent_games)], else_=total_time)
+        total_time = (self.time_spent_series or 0) + (self.time_spent_movies or 0)
 
-        profile_level = func.cast(((func.power(400 + 80 * total_time, 0.5)) - 20) / 40, Integer)
+        if self.add_anime: total_time += self.time_spent_anime or 0
+        if self.add_books: total_time += self.time_spent_books or 0
+        if self.add_games: total_time += self.time_spent_games or 0
 
-        return profile_level
+        self.profile_level = int(get_level(total_time))
 
-    def to_dict(self) -> Dict:
-        """ Serialize the <user> class. It does not include the <email> and <password> fields """
+    def to_dict(self, followers_count: int = None) -> Dict:
+        """ Serialize the <user> class. It does not include the <email> and <password> fields. The
+        <followers_count> can be given when already known (it is counted otherwise) """
 
         excluded_attrs = ("email", "password")
         user_dict = {c.name: getattr(self, c.name) for c in self.__table__.columns if c.name not in excluded_attrs}
@@ -209,9 +207,8 @@ class User(db.Model):
             "registered_on": self.registered_on.strftime("%d %b %Y"),
             "profile_image": self.profile_image,
             "back_image": self.back_image,
-            "profile_level": self.profile_level,
             "profile_border": self.profile_border,
-            "followers_count": self.followers_count,
+            "followers_count": self.followers_count if followers_count is None else followers_count,
         })
 
         return user_dict
@@ -521,6 +518,13 @@ class User(db.Model):
         return User.query.filter_by(id=user_id).first()
 
 
+@event.listens_for(User, "before_insert")
+@event.listens_for(User, "before_update")
+def _update_user_levels(mapper, connection, user: User):
+    """ Keep the stored levels of the <user> up to date with its time spent and its <add_*> flags """
+    user.update_levels()
+
+
 class UserLastUpdate(db.Model):
     """ UserLastUpdate SQL model """
 
@@ -640,9 +644,17 @@ class Notifications(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey("user.id"))
     media_type = db.Column(db.String(50))
     media_id = db.Column(db.Integer)
+    season = db.Column(db.Integer)
+    episode = db.Column(db.Integer)
+    release_date = db.Column(db.Date)
     payload_json = db.Column(db.Text)
     timestamp = db.Column(db.DateTime, index=True, default=datetime.utcnow)
 
+    __table_args__ = (
+        db.Index("ix_notifications_media_user", "media_type", "media_id", "user_id", "timestamp"),
+        db.Index("ix_notifications_user_id_timestamp", "user_id", "timestamp"),
+    )
+
     @classmethod
     def seek(cls, user_id: int, media_type: str, media_id: int):
         """ Seek if a notification exists for a user concerning a <media_type> and a <media_id> """
@@ -652,6 +664,140 @@ class Notifications(db.Model):
 
         return data
 
+    @classmethod
+    def get_latest(cls, media_type: str, media_ids: List[int]) -> Dict:
+        """ Get the (season, episode) of the latest notification per (user_id, media_id) of the <media_ids> in one
+        query (batched <seek>) """
+
+        rank = func.row_number().over(partition_by=(cls.user_id, cls.media_id), order_by=desc(cls.timestamp))
+        ranked = (select(cls.user_id, cls.media_id, cls.season, cls.episode, rank.label("rank"))
+                  .where(cls.media_type == media_type, cls.media_id.in_(media_ids)).subquery())
+
+        latest = db.session.execute(select(ranked.c.user_id, ranked.c.media_id, ranked.c.season, ranked.c.episode)
+                                    .where(ranked.c.rank == 1))
+
+        return {(user_id, media_id): (season, episode) for user_id, media_id, season, episode in latest}
+
+    @classmethod
+    def bulk_add(cls, media_type: str, notifications: List[Dict]):
+        """ Insert the release <notifications> in one statement. Each one has a <user_id>, <media_id>, <name>,
+        <release_date> and for TV a <season> and <episode>. The caller is in charge of the commit """
+
+        if not notifications:
+            return
+
+        rows = []
+        for notif in notifications:
+            payload = {"name": notif["name"], "release_date": notif["release_date"].strftime("%b %d %Y")}
+            if notif.get("season") is not None:
+                payload.update(season=f"{notif['season']:02d}", episode=f"{notif['episode']:02d}")
+
+            rows.append(dict(user_id=notif["user_id"], media_type=media_type, media_id=notif["media_id"],
+                             season=notif.get("season"), episode=notif.get("episode"),
+                             release_date=notif["release_date"], payload_json=json.dumps(payload),
+                             timestamp=datetime.utcnow()))
+
+        db.session.execute(insert(cls), rows)
+
+
+class TimeSpentLedger(db.Model):
+    """ Append-only ledger of the time spent deltas [min] per user and media type. The sum of the deltas of a user
+    must match its <time_spent_*> columns """
+
+    GROUP = "User"
+
+    # Accepted difference [min] between the ledger and the <time_spent_*> columns (the deltas are floats)
+    TOLERANCE = 1
+
+    # The deltas older than this are folded into one row per user and media type
+    COMPACT_AFTER_DAYS = 30
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
+    media_type = db.Column(db.Enum(MediaType), nullable=False)
+    delta = db.Column(db.Float, nullable=False)
+    timestamp = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (db.Index("ix_time_spent_ledger_user_id_media_type", "user_id", "media_type"),)
+
+    @classmethod
+    def record(cls, user: User, media_type: MediaType, delta: float):
+        """ Add <delta> to the time spent of the <user> for <media_type> and append it to the ledger. The caller is in
+        charge of the commit """
+
+        if not delta:
+            return
+
+        time_spent = f"time_spent_{media_type.value}"
+        setattr(user, time_spent, getattr(user, time_spent) + delta)
+        db.session.add(cls(user_id=user.id, media_type=media_type, delta=delta))
+
+    @classmethod
+    def record_duration_change(cls, media_type: MediaType, media_id: int, delta: float):
+        """ Book the change of the duration [min] of a media by <delta> for all the users having it in their list:
+        each of them watched it <total> times. The caller is in charge of the commit """
+
+        if not delta:
+            return
+
+        media_list = get_models_group(media_type)[1]
+        totals = dict(db.session.query(media_list.user_id, func.sum(media_list.total))
+                      .filter(media_list.media_id == media_id, media_list.total > 0)
+                      .group_by(media_list.user_id).all())
+        if not totals:
+            return
+
+        deltas = {user_id: delta * total for user_id, total in totals.items()}
+        time_spent = getattr(User, f"time_spent_{media_type.value}")
+        User.query.filter(User.id.in_(deltas)).update({time_spent: time_spent + db.case(deltas, value=User.id)},
+                                                      synchronize_session=False)
+        db.session.add_all([cls(user_id=user_id, media_type=media_type, delta=user_delta)
+                            for user_id, user_delta in deltas.items()])
+
+    @classmethod
+    def get_totals(cls, user_ids: List[int] = None) -> Dict:
+        """ Sum of the deltas per (user_id, media_type) """
+
+        query = db.session.query(cls.user_id, cls.media_type, func.sum(cls.delta)).group_by(cls.user_id, cls.media_type)
+        if user_ids is not None:
+            query = query.filter(cls.user_id.in_(user_ids))
+
+        return {(user_id, media_type): total for user_id, media_type, total in query}
+
+    @classmethod
+    def get_mismatched_users(cls) -> List[int]:
+        """ IDs of the users whose <time_spent_*> columns disagree with the ledger """
+
+        totals = cls.get_totals()
+        time_spent = [getattr(User, f"time_spent_{media_type.value}") for media_type in MediaType]
+
+        mismatched = []
+        for user_id, *times in db.session.query(User.id, *time_spent):
+            if any(abs((time or 0) - totals.get((user_id, media_type), 0)) > cls.TOLERANCE
+                   for media_type, time in zip(MediaType, times)):
+                mismatched.append(user_id)
+
+        return mismatched
+
+    @classmethod
+    def compact(cls) -> int:
+        """ Fold the old deltas into one row per user and media type (the totals are unchanged). Return the number of
+        folded rows. The caller is in charge of the commit """
+
+        before = datetime.utcnow() - timedelta(days=cls.COMPACT_AFTER_DAYS)
+
+        old_rows = cls.timestamp < before
+        totals = (db.session.query(cls.user_id, cls.media_type, func.sum(cls.delta), func.count(cls.id))
+                  .filter(old_rows).group_by(cls.user_id, cls.media_type).all())
+        if all(count == 1 for *_, count in totals):
+            return 0
+
+        folded = cls.query.filter(old_rows).delete(synchronize_session=False)
+        db.session.add_all([cls(user_id=user_id, media_type=media_type, delta=total, timestamp=before)
+                            for user_id, media_type, total, _ in totals if total])
+
+        return folded
+
 
 def get_coming_next(media_type: MediaType) -> List[Dict]:
     """ Fetch the media that are coming next for the current user (<coming_next> endpoint) """
@@ -1,13 +1,16 @@
 import json
-from datetime import datetime
+import os
+import socket
+from datetime import datetime, timedelta
 from pathlib import Path
-from typing import Dict, List
+from typing import Dict, List, Set
 from flask import url_for, current_app
 from sqlalchemy import desc, asc, func
 from MyLists import db
 from MyLists.api.auth import current_user
+from MyLists.utils.covers import variant_name, cover_static_path, is_stored, COVER_FORMATS, STORE_DIR
 from MyLists.utils.enums import Status, MediaType
-from MyLists.utils.utils import safe_div, get_models_group
+from MyLists.utils.utils import safe_div, get_models_group, upsert_increment
 
 
 class MediaMixin:
@@ -15,6 +18,7 @@ class MediaMixin:
 
     GROUP = None
     SIMILAR_GENRES = 12
+    ORPHANS_CHUNK_SIZE = 500
 
     @property
     def actors_list(self) -> List:
@@ -34,8 +38,46 @@ class MediaMixin:
     @property
     def media_cover(self) -> str:
         """ Get the media cover """
+        return self.resolve_cover()
+
+    @property
+    def media_thumb(self) -> str:
+        """ Get the media cover thumbnail (lists and grids) """
+        return self.resolve_cover("thumb")
+
+    @property
+    def media_cover_sources(self) -> List[Dict]:
+        """ Get the other formats of the media cover """
+        return self.cover_sources()
+
+    @property
+    def media_thumb_sources(self) -> List[Dict]:
+        """ Get the other formats of the media cover thumbnail """
+        return self.cover_sources("thumb")
+
+    def resolve_cover(self, size: str = "full") -> str:
+        """ Get the URL of the JPEG cover of the <size>. Fallback on the original JPEG for the covers without
+        variants (processed before the variants existed) """
+
+        image_cover = variant_name(self.image_cover, size) if self.cover_formats else self.image_cover
+        return url_for("static", filename=cover_static_path(image_cover, f"{self.GROUP.value}_covers"))
+
+    def cover_sources(self, size: str = "full") -> List[Dict]:
+        """ Get the (type, src) of the other formats of the cover of the <size> by order of preference, for the
+        <source> elements of a <picture> (the JPEG being the <img>). The formats available are recorded by the cover
+        pipeline when the variants are written """
+
+        if not self.cover_formats:
+            return []
+
         covers = f"{self.GROUP.value}_covers"
-        return url_for("static", filename=f"covers/{covers}/{self.image_cover}")
+        sources = []
+        for fmt in self.cover_formats.split(","):
+            if fmt != "jpg":
+                static_path = cover_static_path(variant_name(self.image_cover, size, fmt), covers)
+                sources.append({"type": COVER_FORMATS[fmt][0], "src": url_for("static", filename=static_path)})
+
+        return sources
 
     def get_similar_genres(self) -> List[Dict]:
         """ Get similar genre compared to the media in <media_details> """
@@ -54,7 +96,8 @@ class MediaMixin:
                       .order_by(desc("genre_c"))
                       .limit(self.SIMILAR_GENRES).all())
 
-        return [{"media_id" : m[0].id, "media_name": m[0].name, "media_cover": m[0].media_cover} for m in sim_genres]
+        return [{"media_id" : m[0].id, "media_name": m[0].name, "media_cover": m[0].media_thumb,
+                 "media_cover_sources": m[0].media_thumb_sources} for m in sim_genres]
 
     def in_follows_lists(self) -> List[Dict]:
         """ Verify whether the <media> is included in the list of users followed by the <current_user> """
@@ -91,6 +134,52 @@ class MediaMixin:
 
         return user_data
 
+    @classmethod
+    def remove_non_list_media(cls) -> Dict[str, int]:
+        """ Remove all the media that are not present in a User list and their related records. The orphan IDs are
+        computed once, then each table is purged with one bulk DELETE per chunk of IDs. Return the number of deleted
+        rows per table. The caller is in charge of the commit """
+
+        media_list = get_models_group(cls.GROUP)[1]
+        related_models = [model for model in get_models_group(cls.GROUP)
+                          if model not in (cls, media_list) and hasattr(model, "media_id")
+                          and not issubclass(model, MediaLabelMixin)]
+
+        orphans_ids = db.session.scalars(
+            db.select(cls.id).where(~db.exists().where(media_list.media_id == cls.id))
+        ).all()
+
+        counts = {cls.__tablename__: 0}
+        for start in range(0, len(orphans_ids), cls.ORPHANS_CHUNK_SIZE):
+            chunk = orphans_ids[start:start + cls.ORPHANS_CHUNK_SIZE]
+
+            # Release the stored covers of the orphans
+            stored_covers = (db.session.query(cls.image_cover, func.count(cls.id))
+                             .filter(cls.id.in_(chunk), cls.image_cover.like(f"{STORE_DIR}/%"))
+                             .group_by(cls.image_cover).all())
+            for image_cover, count in stored_covers:
+                CoverStore.release(image_cover, count)
+
+            # Delete related records
+            deletes = [(model.__tablename__, db.delete(model).where(model.media_id.in_(chunk)))
+                       for model in related_models]
+            deletes.append((UserLastUpdate.__tablename__, db.delete(UserLastUpdate)
+                            .where(UserLastUpdate.media_type == cls.GROUP, UserLastUpdate.media_id.in_(chunk))))
+            deletes.append((Notifications.__tablename__, db.delete(Notifications)
+                            .where(Notifications.media_type == f"{cls.GROUP.value}list",
+                                   Notifications.media_id.in_(chunk))))
+
+            for table, statement in deletes:
+                result = db.session.execute(statement, execution_options={"synchronize_session": False})
+                counts[table] = counts.get(table, 0) + result.rowcount
+
+            # Delete media
+            result = db.session.execute(db.delete(cls).where(cls.id.in_(chunk)),
+                                        execution_options={"synchronize_session": False})
+            counts[cls.__tablename__] += result.rowcount
+
+        return counts
+
 
 class MediaListMixin:
     """ MediaListMixin SQLAlchemy model for: <SeriesList>, <AnimeList>, <MoviesList>, <GamesList>, and <BooksList> """
@@ -213,7 +302,8 @@ class MediaListMixin:
         favorites_list = [{
             "media_name": favorite.media.name,
             "media_id": favorite.media_id,
-            "media_cover": favorite.media.media_cover
+            "media_cover": favorite.media.media_thumb,
+            "media_cover_sources": favorite.media.media_thumb_sources,
         } for favorite in favorites_query[:limit]]
 
         return {"favorites": favorites_list, "total_favorites": len(favorites_query)}
@@ -358,6 +448,8 @@ class Ranks(db.Model):
     name = db.Column(db.String(50), nullable=False)
     type = db.Column(db.String(50))
 
+    __table_args__ = (db.Index("ix_ranks_type_level", "type", "level"),)
+
     @property
     def image(self) -> str:
         return url_for("static", filename=f"img/media_levels/{self.image_id}.png")
@@ -481,5 +573,200 @@ class MyListsStats(db.Model):
         return mylists_data
 
 
+class GlobalStatsCounter(db.Model):
+    """ Materialized counters of the global stats per media type, e.g. (<genre>, "Drama") -> number of list entries.
+    Maintained incrementally when the list entries change (see <GlobalStats.track_entries>) """
+
+    id = db.Column(db.Integer, primary_key=True)
+    media_type = db.Column(db.Enum(MediaType), nullable=False)
+    kind = db.Column(db.String(20), nullable=False)
+    key = db.Column(db.String(150), nullable=False)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        db.UniqueConstraint("media_type", "kind", "key"),
+        db.Index("ix_global_stats_counter_top", "media_type", "kind", "count"),
+    )
+
+    @classmethod
+    def increment(cls, media_type: MediaType, deltas: Dict):
+        """ Add the <deltas> to the counters of <media_type> ({(kind, key): delta}). The missing counters are created
+        by the positive deltas. The caller is in charge of the commit """
+
+        for (kind, key), delta in deltas.items():
+            if delta > 0:
+                upsert_increment(cls, {"media_type": media_type, "kind": kind, "key": key}, "count", delta)
+            elif delta < 0:
+                (cls.query.filter_by(media_type=media_type, kind=kind, key=key)
+                 .update({"count": cls.count + delta}, synchronize_session=False))
+
+    @classmethod
+    def get_top(cls, media_type: MediaType, kind: str, limit: int = 5) -> List:
+        """ Get the <limit> highest (key, count) of the <kind> counters of <media_type> """
+
+        return (db.session.query(cls.key, cls.count)
+                .filter(cls.media_type == media_type, cls.kind == kind, cls.count > 0)
+                .order_by(cls.count.desc()).limit(limit).all())
+
+
+class SyncCheckpoint(db.Model):
+    """ Last synchronization timestamp of an external change feed (e.g. TMDB changes) and the IDs of the feed which
+    failed to refresh, retried on the next sync """
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(50), nullable=False, unique=True)
+    last_synced = db.Column(db.DateTime, nullable=False)
+    failed_ids = db.Column(db.Text)
+
+    @classmethod
+    def get_last_synced(cls, name: str, default: datetime) -> datetime:
+        """ Return the last synchronization timestamp of the <name> feed or <default> if never synced """
+
+        checkpoint = cls.query.filter_by(name=name).first()
+        return checkpoint.last_synced if checkpoint else default
+
+    @classmethod
+    def get_failed_ids(cls, name: str) -> Set[int]:
+        """ Return the IDs of the <name> feed to retry """
+
+        failed_ids = db.session.query(cls.failed_ids).filter_by(name=name).scalar()
+        return set(json.loads(failed_ids)) if failed_ids else set()
+
+    @classmethod
+    def set_last_synced(cls, name: str, last_synced: datetime | None, failed_ids: Set[int] = None):
+        """ Set the last synchronization timestamp of the <name> feed (unchanged if None) and the IDs to retry on the
+        next sync. The caller is in charge of the commit """
+
+        checkpoint = cls.query.filter_by(name=name).first()
+        if checkpoint is None:
+            if last_synced is None:
+                return
+            checkpoint = cls(name=name)
+            db.session.add(checkpoint)
+
+        if last_synced is not None:
+            checkpoint.last_synced = last_synced
+        checkpoint.failed_ids = json.dumps(sorted(failed_ids)) if failed_ids else None
+
+
+class TaskRun(db.Model):
+    """ A run of a scheduled task (see <TaskRunner>) """
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(50), nullable=False, index=True)
+    status = db.Column(db.String(20), nullable=False, default="running")
+    started_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    ended_at = db.Column(db.DateTime)
+    host = db.Column(db.String(100), default=socket.gethostname)
+    pid = db.Column(db.Integer, default=os.getpid)
+
+    # --- Relationships ----------------------------------------------------------------
+    steps = db.relationship("TaskStepLog", backref="run", order_by="TaskStepLog.id", lazy="select")
+
+    @classmethod
+    def get_last(cls, name: str):
+        """ Get the last run of the <name> task """
+        return cls.query.filter_by(name=name).order_by(cls.id.desc()).first()
+
+    def is_alive(self) -> bool:
+        """ Check if the process of the run is still alive. The runs of another host are considered alive """
+
+        if self.pid is None or self.host != socket.gethostname():
+            return True
+
+        try:
+            os.kill(self.pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+
+        return True
+
+    def is_resumable(self, window: timedelta) -> bool:
+        """ Check if the run started less than <window> ago and failed, or was interrupted (crash, kill, deploy): still
+        <running> while its process is dead """
+
+        if self.started_at < datetime.utcnow() - window:
+            return False
+
+        return self.status == "failed" or (self.status == "running" and not self.is_alive())
+
+    def succeeded_steps(self) -> List[str]:
+        """ Names of the steps of the run that already succeeded """
+        return [step.step for step in self.steps if step.status == "success"]
+
+
+class TaskStepLog(db.Model):
+    """ Log of a step of a scheduled task run: timing, rows touched, API calls and error """
+
+    id = db.Column(db.Integer, primary_key=True)
+    run_id = db.Column(db.Integer, db.ForeignKey("task_run.id"), nullable=False, index=True)
+    step = db.Column(db.String(50), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default="running")
+    started_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    ended_at = db.Column(db.DateTime)
+    duration = db.Column(db.Float)
+    rows = db.Column(db.Integer)
+    api_calls = db.Column(db.Integer)
+    error = db.Column(db.Text)
+
+
+class CoverStore(db.Model):
+    """ Reference count of the covers of the content-addressed store (shared by all the media types) """
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False, unique=True)
+    ref_count = db.Column(db.Integer, nullable=False, default=0)
+
+    @classmethod
+    def acquire(cls, image_cover: str):
+        """ Add a reference to a stored cover. The caller is in charge of the commit """
+
+        if not is_stored(image_cover):
+            return
+
+        upsert_increment(cls, {"name": image_cover}, "ref_count", 1)
+
+    @classmethod
+    def release(cls, image_cover: str, count: int = 1):
+        """ Remove <count> references to a stored cover. The caller is in charge of the commit """
+
+        if not is_stored(image_cover):
+            return
+
+        (cls.query.filter(cls.name == image_cover, cls.ref_count > 0)
+         .update({"ref_count": db.case((cls.ref_count > count, cls.ref_count - count), else_=0)}))
+
+    @staticmethod
+    def count_references() -> Dict[str, int]:
+        """ Count the references to the stored covers from the <image_cover> of all the media (read only) """
+
+        counts = {}
+        for media_type in MediaType:
+            media_class = get_models_group(media_type)[0]
+            query = (db.session.query(media_class.image_cover, func.count(media_class.id))
+                     .filter(media_class.image_cover.like(f"{STORE_DIR}/%")).group_by(media_class.image_cover))
+            for image_cover, count in query:
+                counts[image_cover] = counts.get(image_cover, 0) + count
+
+        return counts
+
+    @classmethod
+    def reconcile(cls, counts: Dict[str, int] = None) -> Dict[str, int]:
+        """ Set the reference counts to the <counts> (recomputed from all the media if None) and return them """
+
+        if counts is None:
+            counts = cls.count_references()
+
+        stored = {cover.name: cover for cover in cls.query.all()}
+        for name, cover in stored.items():
+            cover.ref_count = counts.get(name, 0)
+        db.session.add_all([cls(name=name, ref_count=count) for name, count in counts.items() if name not in stored])
+        db.session.commit()
+
+        return counts
+
+
 # Avoid circular imports
-from MyLists.models.user_models import User, followers, UserLastUpdate
+from MyLists.models.user_models import User, followers, UserLastUpdate, Notifications
@@ -0,0 +1,83 @@
+from __future__ import annotations
+from typing import List, Tuple, Dict
+from flask import current_app
+from sqlalchemy import select, func, text
+from sqlalchemy.sql import Select
+from MyLists import db
+from MyLists.models.user_models import User
+from MyLists.models.utils_models import Ranks
+from MyLists.utils.enums import MediaType
+from MyLists.utils.utils import get_models_group
+
+
+def _get_hot_queries() -> List[Tuple[str, Select]]:
+    """ Return the (name, query) of the hot queries on the list, genre, related and label tables of each media, and
+    on the users and ranks """
+
+    queries = []
+    for media_type in MediaType:
+        media, media_list, genre, *mores, label = get_models_group(media_type)
+
+        queries += [
+            (f"{media_list.__tablename__} by user and media",
+             select(media_list.id).where(media_list.user_id == 1, media_list.media_id == 1)),
+            (f"{media_list.__tablename__} count per status",
+             select(media_list.status, func.count()).where(media_list.user_id == 1).group_by(media_list.status)),
+            (f"{media_list.__tablename__} by media",
+             select(media_list.user_id).where(media_list.media_id == 1)),
+            (f"{genre.__tablename__} by media",
+             select(genre.genre).where(genre.media_id == 1)),
+            (f"{genre.__tablename__} joined on the user list",
+             select(genre.genre, func.count()).join(media_list, media_list.media_id == genre.media_id)
+             .where(media_list.user_id == 1).group_by(genre.genre)),
+            (f"{label.__tablename__} names of the user",
+             select(label.label).where(label.user_id == 1).group_by(label.label)),
+            (f"{label.__tablename__} by user and media",
+             select(label.label).where(label.user_id == 1, label.media_id == 1)),
+            (f"{label.__tablename__} by media",
+             select(label.id).where(label.media_id == 1)),
+        ]
+        queries += [(f"{more.__tablename__} by media", select(more.id).where(more.media_id == 1)) for more in mores]
+
+    queries += [
+        ("user leaderboard", select(User.id).order_by(User.profile_level.desc()).limit(10)),
+        ("ranks by level", select(Ranks.image_id).where(Ranks.type == "media_rank\n", Ranks.level.in_([1, 2]))),
+    ]
+
+    return queries
+
+
+def _explain(query: Select) -> List[str]:
+    """ Return the lines of the query plan of <query> (<EXPLAIN QUERY PLAN> on SQLite, <EXPLAIN> otherwise) """
+
+    sql = str(query.compile(dialect=db.engine.dialect, compile_kwargs={"literal_binds": True}))
+
+    if db.engine.dialect.name == "sqlite":
+        return [row[-1] for row in db.session.execute(text(f"EXPLAIN QUERY PLAN {sql}")).all()]
+    return [row[0] for row in db.session.execute(text(f"EXPLAIN {sql}")).all()]
+
+
+def _is_full_scan(plan_line: str) -> bool:
+    """ Check if a line of a query plan is a full table scan """
+    return (plan_line.startswith("SCAN") and "INDEX" not in plan_line) or "Seq Scan" in plan_line
+
+
+def audit_indexes() -> Dict[str, List[str]]:
+    """ Explain the hot queries and log their plans. Return the full scans found, by query name """
+
+    current_app.logger.info("###############################################################################")
+    current_app.logger.info("[SYSTEM] - Starting the index audit -")
+
+    full_scans = {}
+    for name, query in _get_hot_queries():
+        plan = _explain(query)
+        scans = [line for line in plan if _is_full_scan(line)]
+        if scans:
+            full_scans[name] = scans
+        current_app.logger.info(f"{'[FULL SCAN] ' if scans else ''}{name}: {' | '.join(plan)}")
+
+    current_app.logger.info(f"Queries with a full scan: {len(full_scans)}")
+    current_app.logger.info("[SYSTEM] - Finished the index audit -")
+    current_app.logger.info("###############################################################################")
+
+    return full_scans
@@ -1,20 +1,81 @@
-from datetime import datetime
+from __future__ import annotations
+from datetime import datetime, timedelta
 from flask import current_app
 from MyLists import db
-from MyLists.classes.API_data import ApiData, ApiTV, ApiMovies
+from sqlalchemy import update
+from MyLists.classes.API_data import ApiData, ApiTMDB, ApiTV, ApiMovies, ApiGames
+from MyLists.classes.Cover_pipeline import cover_pipeline
+from MyLists.classes.Global_stats import GlobalStats
+from MyLists.classes.Search_index import SearchIndex
 from MyLists.models.games_models import Games
-from MyLists.models.movies_models import Movies
-from MyLists.models.tv_models import (Series, Anime, SeriesList, AnimeList, SeriesEpisodesPerSeason,
-                                      AnimeEpisodesPerSeason)
+from MyLists.models.movies_models import Movies, MoviesList
+from MyLists.models.tv_models import Series, Anime, SeriesEpisodesPerSeason, AnimeEpisodesPerSeason
+from MyLists.models.user_models import TimeSpentLedger
+from MyLists.models.utils_models import SyncCheckpoint
+from MyLists.scheduled_tasks.refresh_engine import RefreshEngine
+from MyLists.scheduled_tasks.task_runner import TaskStepError
 from MyLists.utils.enums import MediaType
-from typing import Tuple, List, Dict
+from MyLists.utils.utils import get_models_group
+from typing import Tuple, Dict, Set, Type
 
 
-def refresh_element_data(api_id: int, media_type: MediaType):
-    """ Refresh a media using appropriate API """
+TV_CHANGES_FEED = "tmdb_tv_changes"
+MOVIES_CHANGES_FEED = "tmdb_movie_changes"
+
+
+def fetch_element_data(api_id: int, media_type: MediaType) -> Dict:
+    """ Fetch the refreshed data of a media using the appropriate API (no DB access) """
 
     ApiModel = ApiData.get_API_class(media_type)
-    data = ApiModel(API_id=api_id).update_media_data()
+    return ApiModel(API_id=api_id).update_media_data()
+
+
+def _submit_cover_job(api_id: int, media_type: MediaType, cover_job: Dict | None):
+    """ Queue the cover job of a refreshed media in the cover pipeline, once the caller commits """
+
+    if not cover_job:
+        return
+
+    media_class = get_models_group(media_type)[0]
+    media_id = db.session.query(media_class.id).filter_by(api_id=api_id).scalar()
+    if media_id is not None:
+        cover_pipeline.submit_after_commit(media_type, media_id, **cover_job)
+
+
+def _update_movie(api_id: int, media_data: Dict):
+    """ Update a movie, its entries are counted again in the global stats if its director changed """
+
+    movie = db.session.query(Movies.id, Movies.director_name).filter_by(api_id=api_id).first()
+    director_changed = movie is not None and media_data.get("director_name", movie.director_name) != movie.director_name
+
+    stats = GlobalStats()
+    if director_changed:
+        stats.track_entries(MediaType.MOVIES, -1, MoviesList.media_id == movie.id)
+
+    Movies.query.filter_by(api_id=api_id).update(media_data)
+
+    if director_changed:
+        stats.track_entries(MediaType.MOVIES, 1, MoviesList.media_id == movie.id)
+
+
+def _track_duration_change(api_id: int, media_type: MediaType, media_data: Dict):
+    """ Book in the time spent of the users the change of the duration of a media, before it is updated """
+
+    media_class = get_models_group(media_type)[0]
+    media = db.session.query(media_class.id, media_class.duration).filter_by(api_id=api_id).first()
+    new_duration = media_data.get("duration")
+    if media is None or new_duration is None or media.duration is None:
+        return
+
+    TimeSpentLedger.record_duration_change(media_type, media.id, new_duration - media.duration)
+
+
+def apply_element_data(api_id: int, media_type: MediaType, data: Dict) -> bool:
+    """ Apply the refreshed <data> of a media to the database session. The caller is in charge of the commit """
+
+    # The time spent of the users follows the new duration
+    if media_type in (MediaType.SERIES, MediaType.ANIME, MediaType.MOVIES):
+        _track_duration_change(api_id, media_type, data["media_data"])
 
     # Update main details for each media
     if media_type == MediaType.SERIES:
@@ -22,192 +83,177 @@ def refresh_element_data(api_id: int, media_type: MediaType):
     elif media_type == MediaType.ANIME:
         Anime.query.filter_by(api_id=api_id).update(data["media_data"])
     elif media_type == MediaType.MOVIES:
-        Movies.query.filter_by(api_id=api_id).update(data["media_data"])
+        _update_movie(api_id, data["media_data"])
     elif media_type == MediaType.GAMES:
         Games.query.filter_by(api_id=api_id).update(data["media_data"])
 
-    # Commit changes
-    db.session.commit()
+    # Queue the new cover, the current one is kept until processed
+    _submit_cover_job(api_id, media_type, data.get("cover_job"))
+
+    # Index the refreshed names again
+    media_class = get_models_group(media_type)[0]
+    media_id = db.session.query(media_class.id).filter_by(api_id=api_id).scalar()
+    if media_id is not None:
+        SearchIndex.index_media(media_type, [media_id])
 
     # Check episodes/seasons
     if media_type in (MediaType.SERIES, MediaType.ANIME):
-        if media_type == MediaType.SERIES:
-            media = Series.query.filter_by(api_id=api_id).first()
-            old_seas_eps = [n.episodes for n in SeriesEpisodesPerSeason.query.filter_by(media_id=media.id).all()]
-        elif media_type == MediaType.ANIME:
-            media = Anime.query.filter_by(api_id=api_id).first()
-            old_seas_eps = [n.episodes for n in AnimeEpisodesPerSeason.query.filter_by(media_id=media.id).all()]
-        else:
+        if media_id is None:
             return False
 
+        eps_per_season = SeriesEpisodesPerSeason if media_type == MediaType.SERIES else AnimeEpisodesPerSeason
+
+        old_seas_eps = [n.episodes for n in eps_per_season.query.filter_by(media_id=media_id).all()]
         new_seas_eps = [d["episodes"] for d in data["seasons_data"]]
 
         if new_seas_eps != old_seas_eps:
-            if media_type == MediaType.SERIES:
-                users_list = SeriesList.query.filter_by(media_id=media.id).all()
-
-                for user in users_list:
-                    episodes_watched = user.total
-
-                    count = 0
-                    for i in range(0, len(data["seasons_data"])):
-                        count += data["seasons_data"][i]["episodes"]
-                        if count == episodes_watched:
-                            user.last_episode_watched = data["seasons_data"][i]["episodes"]
-                            user.current_season = data['seasons_data'][i]['season']
-                            break
-                        elif count > episodes_watched:
-                            user.last_episode_watched = data["seasons_data"][i]["episodes"] - (count - episodes_watched)
-                            user.current_season = data["seasons_data"][i]["season"]
-                            break
-                        elif count < episodes_watched:
-                            try:
-                                data['seasons_data'][i + 1]["season"]
-                            except IndexError:
-                                user.last_episode_watched = data["seasons_data"][i]["episodes"]
-                                user.current_season = data["seasons_data"][i]["season"]
-                                break
-
-                SeriesEpisodesPerSeason.query.filter_by(media_id=media.id).delete()
-                db.session.commit()
-
-                for seas in data["seasons_data"]:
-                    # noinspection PyArgumentList
-                    season = SeriesEpisodesPerSeason(
-                        media_id=media.id,
-                        season=seas["season"],
-                        episodes=seas["episodes"]
-                    )
-                    db.session.add(season)
-                db.session.commit()
-            elif media_type == MediaType.ANIME:
-                users_list = AnimeList.query.filter_by(media_id=media.id).all()
-
-                for user in users_list:
-                    episodes_watched = user.total
-
-                    count = 0
-                    for i in range(0, len(data["seasons_data"])):
-                        count += data["seasons_data"][i]["episodes"]
-                        if count == episodes_watched:
-                            user.last_episode_watched = data["seasons_data"][i]["episodes"]
-                            user.current_season = data["seasons_data"][i]["season"]
-                            break
-                        elif count > episodes_watched:
-                            user.last_episode_watched = data["seasons_data"][i]["episodes"] - (count - episodes_watched)
-                            user.current_season = data["seasons_data"][i]['season']
-                            break
-                        elif count < episodes_watched:
-                            try:
-                                data["seasons_data"][i + 1]["season"]
-                            except IndexError:
-                                user.last_episode_watched = data["seasons_data"][i]["episodes"]
-                                user.current_season = data["seasons_data"][i]["season"]
-                                break
-
-                AnimeEpisodesPerSeason.query.filter_by(media_id=media.id).delete()
-                db.session.commit()
-
-                for seas in data["seasons_data"]:
-                    # noinspection PyArgumentList
-                    season = AnimeEpisodesPerSeason(
-                        media_id=media.id,
-                        season=seas["season"],
-                        episodes=seas["episodes"]
-                    )
-                    db.session.add(season)
-                db.session.commit()
+            media_class.remap_list_positions(media_id, data["seasons_data"])
+
+            eps_per_season.query.filter_by(media_id=media_id).delete()
+            db.session.add_all([eps_per_season(media_id=media_id, season=seas["season"], episodes=seas["episodes"])
+                                for seas in data["seasons_data"]])
 
     return True
 
 
-def _fetch_all_api_ids() -> Tuple[List[int], List[int], List[int], List[int]]:
+def refresh_element_data(api_id: int, media_type: MediaType) -> bool:
+    """ Refresh a media using appropriate API """
+
+    data = fetch_element_data(api_id, media_type)
+    response = apply_element_data(api_id, media_type, data)
+
+    # Commit changes
+    db.session.commit()
+
+    return response
+
+
+def _fetch_all_api_ids() -> Tuple[Set[int], Set[int], Set[int], Set[int]]:
     """ The api id from the database """
 
     # Fetch all API ids
-    all_series_api_id = [m[0] for m in db.session.query(Series.api_id).filter(Series.lock_status != True)]
-    all_anime_api_id = [m[0] for m in db.session.query(Anime.api_id).filter(Anime.lock_status != True)]
-    all_movies_api_id = [m[0] for m in db.session.query(Movies.api_id).filter(Movies.lock_status != True)]
+    all_series_api_id = {m[0] for m in db.session.query(Series.api_id).filter(Series.lock_status != True)}
+    all_anime_api_id = {m[0] for m in db.session.query(Anime.api_id).filter(Anime.lock_status != True)}
+    all_movies_api_id = {m[0] for m in db.session.query(Movies.api_id).filter(Movies.lock_status != True)}
 
     all_games = Games.query.all()
-    all_games_api_id = []
+    all_games_api_id = set()
     for game in all_games:
         try:
             if datetime.utcfromtimestamp(int(game.release_date)) > datetime.now():
-                all_games_api_id.append(game.api_id)
+                all_games_api_id.add(game.api_id)
         except:
-            all_games_api_id.append(game.api_id)
+            all_games_api_id.add(game.api_id)
 
     return all_series_api_id, all_anime_api_id, all_movies_api_id, all_games_api_id
 
 
-def _refresh_tv(tv_ids: List[int], all_id_tv_changes: Dict, media_type: MediaType):
-    """ Refresh the series/anime local data using TMDB API """
-
-    # Refresh Series/Anime
-    for result in all_id_tv_changes["results"]:
-        tmdb_id = result["id"]
-        if tmdb_id in tv_ids:
-            try:
-                refresh_element_data(tmdb_id, media_type)
-                current_app.logger.info(f"[INFO] - Refreshed the series/anime with TMDB ID = [{tmdb_id}]")
-            except Exception as e:
-                current_app.logger.info(f"[ERROR] - While refreshing the series/anime with ID = [{tmdb_id}]: {e}")
+def _fetch_changed_ids(feed_name: str, api_class: Type[ApiTMDB], sync_time: datetime) -> Set[int] | None:
+    """ Fetch all the IDs changed since the last checkpoint of the <feed_name> TMDB feed. Return None on error so the
+    checkpoint is not moved and the next run catches up """
 
+    start_date = SyncCheckpoint.get_last_synced(feed_name, default=sync_time - timedelta(days=1))
 
-def _refresh_movies(movies_ids: List[int]):
-    """ Refresh the movies local data using TMDB API """
-
-    # From TMDB API, Fetch all changed Movies IDs
     try:
-        all_id_movies_changes = ApiMovies().get_changed_data()
+        changed_ids = api_class().get_changed_ids(start_date, sync_time)
     except Exception as e:
-        all_id_movies_changes = {"results": []}
-        current_app.logger.error(f"[ERROR] - Requesting the changed IDs for the movies from the TMDB API: {e}")
+        current_app.logger.error(f"[ERROR] - Requesting the changed IDs of the <{feed_name}> feed from the TMDB API: "
+                                 f"{e}")
+        return None
+
+    current_app.logger.info(f"[INFO] - {len(changed_ids)} changed IDs in the <{feed_name}> feed since {start_date}")
+
+    return changed_ids
 
-    # Refresh movies
-    for result in all_id_movies_changes["results"]:
-        tmdb_id = result["id"]
-        if tmdb_id in movies_ids:
-            try:
-                refresh_element_data(tmdb_id, MediaType.MOVIES)
-                current_app.logger.info(f"[INFO] - Refreshed the movie with TMDB ID: [{tmdb_id}]")
-            except Exception as e:
-                current_app.logger.info(f"[ERROR] - While refreshing the movies with TMDB ID = [{tmdb_id}]: {e}")
 
+def _refresh_games(games_ids: Set[int]) -> Dict:
+    """ Refresh the games using multi-ID IGDB queries and bulk update the <Games> rows by primary key """
+
+    refreshed, errors = 0, 0
+    games_ids = list(games_ids)
+    for i in range(0, len(games_ids), ApiGames.BULK_LIMIT):
+        chunk = games_ids[i:i + ApiGames.BULK_LIMIT]
+
+        try:
+            all_games_data = ApiGames.bulk_update_media_data(chunk)
+        except Exception as e:
+            current_app.logger.error(f"[ERROR] - While fetching a batch of {len(chunk)} games from the IGDB API: {e}")
+            errors += len(chunk)
+            continue
 
-def _refresh_games(games_ids: List[int]):
-    """ Refresh the games local data using the IGDB API """
+        # Map the API IDs to the primary keys to update by primary key
+        ids_map = dict(db.session.query(Games.api_id, Games.id).filter(Games.api_id.in_(all_games_data.keys())))
+        games_rows = [{**data["media_data"], "id": ids_map[api_id]}
+                      for api_id, data in all_games_data.items() if api_id in ids_map]
 
-    # Refresh Games
-    for api_id in games_ids:
         try:
-            refresh_element_data(api_id, MediaType.GAMES)
-            current_app.logger.info(f"[INFO] - Refreshed the game with IGDB ID: [{api_id}]")
+            if games_rows:
+                db.session.execute(update(Games), games_rows)
+                SearchIndex.index_media(MediaType.GAMES, [row["id"] for row in games_rows])
+            for api_id, data in all_games_data.items():
+                _submit_cover_job(api_id, MediaType.GAMES, data.get("cover_job"))
+            db.session.commit()
+            refreshed += len(games_rows)
+            errors += len(chunk) - len(games_rows)
         except Exception as e:
-            current_app.logger.info(f"[ERROR] - While refreshing games with IGDB ID = [{api_id}]: {e}")
+            current_app.logger.error(f"[ERROR] - While updating a batch of {len(games_rows)} games: {e}")
+            db.session.rollback()
+            errors += len(chunk)
+
+    return dict(refreshed=refreshed, errors=errors)
 
 
-def automatic_media_refresh():
-    """ Automatically refresh the media using the appropriate API """
+def automatic_media_refresh() -> int:
+    """ Automatically refresh the media changed since the last run using the appropriate API. Return the number
+    of media refreshed. Raise a <TaskStepError> if a feed or some media could not be refreshed """
 
     current_app.logger.info("###############################################################################")
     current_app.logger.info("[SYSTEM] - Starting automatic media refresh -")
 
+    sync_time = datetime.utcnow()
+
     # Fetch all IDs
     series_ids, anime_ids, movies_ids, games_ids = _fetch_all_api_ids()
 
-    # From TMDB API, Fetch all changed TV IDs
-    try:
-        all_id_tv_changes = ApiTV().get_changed_data()
-    except Exception as e:
-        all_id_tv_changes = {"results": []}
-        current_app.logger.error(f"[ERROR] - Requesting the changed IDs for the series/anime from the TMDB API: {e}")
+    # From TMDB API, fetch all changed IDs since the last checkpoints
+    tv_changes = _fetch_changed_ids(TV_CHANGES_FEED, ApiTV, sync_time)
+    movies_changes = _fetch_changed_ids(MOVIES_CHANGES_FEED, ApiMovies, sync_time)
+
+    # Retry the IDs which failed on the previous runs
+    tv_ids = (tv_changes or set()) | SyncCheckpoint.get_failed_ids(TV_CHANGES_FEED)
+    movies_ids_to_refresh = (movies_changes or set()) | SyncCheckpoint.get_failed_ids(MOVIES_CHANGES_FEED)
+
+    jobs = [(api_id, MediaType.SERIES) for api_id in series_ids & tv_ids]
+    jobs += [(api_id, MediaType.ANIME) for api_id in anime_ids & tv_ids]
+    jobs += [(api_id, MediaType.MOVIES) for api_id in movies_ids & movies_ids_to_refresh]
 
-    _refresh_tv(series_ids, all_id_tv_changes, MediaType.SERIES)
-    _refresh_tv(anime_ids, all_id_tv_changes, MediaType.ANIME)
-    _refresh_movies(movies_ids)
-    _refresh_games(games_ids)
+    # Fetch concurrently and write in batches
+    engine = RefreshEngine(fetch_element_data, apply_element_data)
+    results = engine.run(jobs)
 
+    # Games are fetched in bulk from the IGDB API
+    games_results = _refresh_games(games_ids)
+    results = {key: results[key] + games_results[key] for key in results}
+
+    # Move the checkpoints of the successfully fetched feeds, the failed IDs are kept to be retried on the next run
+    tv_failed = {api_id for api_id, media_type in engine.failed if media_type != MediaType.MOVIES}
+    movies_failed = {api_id for api_id, media_type in engine.failed if media_type == MediaType.MOVIES}
+    SyncCheckpoint.set_last_synced(TV_CHANGES_FEED, sync_time if tv_changes is not None else None, tv_failed)
+    SyncCheckpoint.set_last_synced(MOVIES_CHANGES_FEED, sync_time if movies_changes is not None else None,
+                                   movies_failed)
+    db.session.commit()
+
+    # Wait for the queued covers
+    cover_pipeline.join()
+
+    current_app.logger.info(f"Total media refreshed: {results['refreshed']} - Errors: {results['errors']}")
     current_app.logger.info("[SYSTEM] - Finished Automatic media refresh -")
-    current_app.logger.info('###############################################################################')
\ No newline at end of file
+    current_app.logger.info('###############################################################################')
+
+    failed_feeds = [feed for feed, changes in ((TV_CHANGES_FEED, tv_changes), (MOVIES_CHANGES_FEED, movies_changes))
+                    if changes is None]
+    if results["errors"] or failed_feeds:
+        raise TaskStepError(f"{results['errors']} media could not be refreshed, failed feeds: {failed_feeds}",
+                            results["refreshed"])
+
+    return results["refreshed"]
@@ -0,0 +1,114 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, List, Tuple
+from flask import current_app
+from MyLists import db
+from MyLists.utils.enums import MediaType
+
+
+class RefreshEngine:
+    """ Concurrent media refresh engine. The API fetches run in a bounded thread pool per provider (the rate budgets
+    are enforced by the shared rate limiter of the HTTP client) while all the DB writes go through the calling thread,
+    which commits them in batches """
+
+    PROVIDERS = {
+        MediaType.SERIES: "tmdb",
+        MediaType.ANIME: "tmdb",
+        MediaType.MOVIES: "tmdb",
+        MediaType.GAMES: "igdb",
+        MediaType.BOOKS: "google_books",
+    }
+
+    def __init__(self, fetch_func: Callable, write_func: Callable, batch_size: int = None):
+        self.app = current_app._get_current_object()
+        self.fetch_func = fetch_func
+        self.write_func = write_func
+        self.batch_size = batch_size or current_app.config["REFRESH_BATCH_SIZE"]
+
+        self.workers = current_app.config["REFRESH_WORKERS"]
+
+        self._pending: List[Tuple[int, MediaType, Dict]] = []
+        self.refreshed = 0
+        self.errors = 0
+        self.failed: List[Tuple[int, MediaType]] = []
+
+    def _fail(self, api_id: int, media_type: MediaType, step: str, error: Exception):
+        """ Log and record a media which could not be refreshed """
+
+        current_app.logger.error(f"[ERROR] - While {step} the {media_type.value} with API ID = [{api_id}]: {error}")
+        self.errors += 1
+        self.failed.append((api_id, media_type))
+
+    def _fetch(self, api_id: int, media_type: MediaType) -> Dict:
+        """ Fetch the data of one media inside its own app context (run in a worker thread) """
+
+        with self.app.app_context():
+            return self.fetch_func(api_id, media_type)
+
+    def _write(self, api_id: int, media_type: MediaType, data: Dict):
+        """ Apply the fetched data to the session and commit when the batch is full """
+
+        try:
+            self.write_func(api_id, media_type, data)
+            self._pending.append((api_id, media_type, data))
+            current_app.logger.info(f"[INFO] - Refreshed the {media_type.value} with API ID = [{api_id}]")
+        except Exception as e:
+            self._fail(api_id, media_type, "refreshing", e)
+            db.session.rollback()
+            self._replay_pending()
+
+        if len(self._pending) >= self.batch_size:
+            self._commit()
+
+    def _commit(self):
+        """ Commit the current batch, replaying it item by item if the commit fails """
+
+        try:
+            db.session.commit()
+            self.refreshed += len(self._pending)
+            self._pending = []
+        except Exception as e:
+            current_app.logger.error(f"[ERROR] - While committing a batch of refreshed media: {e}")
+            db.session.rollback()
+            self._replay_pending()
+
+    def _replay_pending(self):
+        """ Re-apply the media of a rolled back batch, each one in its own transaction """
+
+        pending, self._pending = self._pending, []
+        for api_id, media_type, data in pending:
+            try:
+                self.write_func(api_id, media_type, data)
+                db.session.commit()
+                self.refreshed += 1
+            except Exception as e:
+                self._fail(api_id, media_type, "refreshing", e)
+                db.session.rollback()
+
+    def run(self, jobs: List[Tuple[int, MediaType]]) -> Dict:
+        """ Refresh all the <jobs> (<api_id>, <media_type>) and return the number of refreshed media and errors. The
+        jobs which failed are kept in <failed> """
+
+        # One bounded pool of workers per provider
+        executors = {provider: ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"refresh-{provider}")
+                     for provider, workers in self.workers.items()}
+
+        try:
+            futures = {executors[self.PROVIDERS[media_type]].submit(self._fetch, api_id, media_type):
+                       (api_id, media_type) for api_id, media_type in jobs}
+
+            for future in as_completed(futures):
+                api_id, media_type = futures[future]
+                try:
+                    data = future.result()
+                except Exception as e:
+                    self._fail(api_id, media_type, "fetching", e)
+                    continue
+
+                self._write(api_id, media_type, data)
+
+            self._commit()
+        finally:
+            for executor in executors.values():
+                executor.shutdown(wait=True, cancel_futures=True)
+
+        return dict(refreshed=self.refreshed, errors=self.errors)
@@ -1,120 +1,115 @@
 import os
+import time
 from pathlib import Path
+from typing import Dict, Iterable, Set
 from flask import current_app
-from MyLists.models.books_models import Books
-from MyLists.models.games_models import Games
-from MyLists.models.movies_models import Movies
-from MyLists.models.tv_models import Series, Anime
+from MyLists import db
+from MyLists.classes.Cover_pipeline import CoverPipeline
+from MyLists.models.utils_models import CoverStore
+from MyLists.utils.covers import cover_stem, is_stored
+from MyLists.utils.enums import MediaType
+from MyLists.utils.utils import get_models_group
 
 
-def _remove_old_series_covers():
-    """ Remove all the series old covers on disk if they are not present in the database """
-
-    path_series_covers = Path(current_app.root_path, "static/covers/series_covers/")
-
-    images_in_db = [media.image_cover for media in Series.query.all()]
-
-    # Filter out images that need to be removed
-    images_to_remove = [file for file in os.listdir(path_series_covers) if file not in images_in_db]
-
-    # Delete old series covers and log info
-    count = 0
-    for image in images_to_remove:
-        file_path = path_series_covers / image
-        try:
-            os.remove(file_path)
-            current_app.logger.info(f"Removed old series cover with name ID: {image}")
-            count += 1
-        except Exception as e:
-            current_app.logger.error(f"Error occurred while deleting this old series cover {image}: {e}")
-    current_app.logger.info(f'Total old series old covers deleted: {count}')
-
-def _remove_old_anime_covers():
-    """ Remove all the anime old covers on disk if they are not present in the database """
-
-    path_anime_covers = Path(current_app.root_path, "static/covers/anime_covers/")
-
-    images_in_db = [media.image_cover for media in Anime.query.all()]
-
-    # Filter out images that need to be removed
-    images_to_remove = [file for file in os.listdir(path_anime_covers) if file not in images_in_db]
-
-    # Delete old anime covers and log info
-    count = 0
-    for image in images_to_remove:
-        file_path = path_anime_covers / image
-        try:
-            os.remove(file_path)
-            current_app.logger.info(f"Removed old anime cover with name ID: {image}")
-            count += 1
-        except Exception as e:
-            current_app.logger.error(f"Error occurred while deleting this old anime cover {image}: {e}")
-    current_app.logger.info(f'Total old anime old covers deleted: {count}')
-
-def _remove_old_movies_covers():
-    """ Remove all the movies old covers on disk if they are not present in the database """
-
-    path_movies_covers = Path(current_app.root_path, "static/covers/movies_covers/")
-
-    images_in_db = [media.image_cover for media in Movies.query.all()]
-
-    # Filter out images that need to be removed
-    images_to_remove = [file for file in os.listdir(path_movies_covers) if file not in images_in_db]
-
-    # Delete old movies covers and log info
-    count = 0
-    for image in images_to_remove:
-        file_path = path_movies_covers / image
-        try:
-            os.remove(file_path)
-            current_app.logger.info(f"Removed old movie cover with name ID: {image}")
-            count += 1
-        except Exception as e:
-            current_app.logger.error(f"Error occurred while deleting this old movie cover {image}: {e}")
-    current_app.logger.info(f'Total old movies old covers deleted: {count}')
-
-def _remove_old_books_covers():
-    """ Remove all the books old covers on disk if they are not present in the database """
-
-    path_books_covers = Path(current_app.root_path, "static/covers/books_covers/")
-
-    images_in_db = [media.image_cover for media in Books.query.all()]
-
-    # Filter out images that need to be removed
-    images_to_remove = [file for file in os.listdir(path_books_covers) if file not in images_in_db]
-
-    # Delete old books covers and log info
-    count = 0
-    for image in images_to_remove:
-        file_path = path_books_covers / image
-        try:
-            os.remove(file_path)
-            current_app.logger.info(f"Removed old book cover with name ID: {image}")
-            count += 1
-        except Exception as e:
-            current_app.logger.error(f"Error occurred while deleting this old book cover {image}: {e}")
-    current_app.logger.info(f'Total old books old covers deleted: {count}')
-
-def _remove_old_games_covers():
-    """ Remove all the games old covers on disk if they are not present in the database """
-
-    path_games_covers = Path(current_app.root_path, "static/covers/games_covers/")
-
-    images_in_db = [media.image_cover for media in Games.query.all()]
-
-    # Filter out images that need to be removed
-    images_to_remove = [file for file in os.listdir(path_games_covers) if file not in images_in_db]
+# Stored covers written less than a day ago are never removed
+STORE_GRACE_PERIOD = 24 * 3600
 
-    # Delete old games covers and log info
-    count = 0
-    for image in images_to_remove:
-        file_path = path_games_covers / image
-        try:
-            os.remove(file_path)
-            current_app.logger.info(f"Removed old game cover with name ID: {image}")
-            count += 1
-        except Exception as e:
-            current_app.logger.error(f"Error occurred while deleting this old game cover {image}: {e}")
-    current_app.logger.info(f'Total old games old covers deleted: {count}')
+# Number of files deleted between two log lines
+DELETE_BATCH_SIZE = 500
 
 
+def _collect_garbage(directory: Path, referenced: Set[str], min_mtime: float = None, dry_run: bool = False) -> Dict:
+    """ Remove the files of <directory> whose cover stem is not in <referenced> (and older than <min_mtime> if given).
+    Return a report with the number of files scanned, removed and the bytes freed """
+
+    report = dict(directory=str(directory), scanned=0, removed=0, bytes=0, errors=0)
+    if not directory.exists():
+        return report
+
+    batch = []
+
+    def _flush():
+        """ Delete the current batch of files and log the progress """
+
+        if not batch:
+            return
+
+        for path, size in batch:
+            try:
+                if not dry_run:
+                    os.remove(path)
+                report["removed"] += 1
+                report["bytes"] += size
+            except OSError as e:
+                report["errors"] += 1
+                current_app.logger.error(f"[ERROR] - While deleting the old cover {path}: {e}")
+        batch.clear()
+
+        current_app.logger.info(f"{directory}: {report['removed']} files {'to delete' if dry_run else 'deleted'} "
+                                f"so far ({report['scanned']} scanned)")
+
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if not entry.is_file():
+                continue
+
+            report["scanned"] += 1
+            if cover_stem(entry.name) in referenced:
+                continue
+
+            stat = entry.stat()
+            if min_mtime is not None and stat.st_mtime > min_mtime:
+                continue
+
+            batch.append((entry.path, stat.st_size))
+            if len(batch) >= DELETE_BATCH_SIZE:
+                _flush()
+
+    _flush()
+
+    return report
+
+
+def _referenced_covers(image_covers: Iterable[str]) -> Set[str]:
+    """ Stems of the covers referenced in the <*_covers> directory (the stored ones are handled with the store). The
+    placeholder is always kept """
+
+    referenced = {cover_stem(image_cover) for image_cover in image_covers if image_cover and not is_stored(image_cover)}
+    referenced.add(cover_stem(CoverPipeline.PLACEHOLDER))
+
+    return referenced
+
+
+def remove_old_covers(media_type: MediaType, dry_run: bool = False) -> Dict:
+    """ Remove the old covers of <media_type> on disk if they are not present in the database """
+
+    media_class = get_models_group(media_type)[0]
+
+    # Stream only the <image_cover> column
+    image_covers = db.session.execute(db.select(media_class.image_cover).execution_options(yield_per=5000)).scalars()
+    referenced = _referenced_covers(image_covers)
+
+    directory = Path(current_app.static_folder, "covers", f"{media_type.value}_covers")
+
+    return _collect_garbage(directory, referenced, dry_run=dry_run)
+
+
+def remove_unreferenced_store_covers(dry_run: bool = False) -> Dict:
+    """ Reconcile the reference counts of the content-addressed covers store and remove its unreferenced covers (and
+    their variants). The recently written covers are kept, a job may be about to reference them. With <dry_run>, the
+    database is left untouched too """
+
+    counts = CoverStore.count_references()
+    if not dry_run:
+        CoverStore.reconcile(counts)
+
+    referenced = {cover_stem(name.split("/", 1)[1]) for name, count in counts.items() if count > 0}
+
+    report = _collect_garbage(CoverPipeline.store_path(), referenced, time.time() - STORE_GRACE_PERIOD, dry_run)
+
+    # Forget the covers without any reference
+    if not dry_run:
+        CoverStore.query.filter_by(ref_count=0).delete()
+        db.session.commit()
+
+    return report
@@ -3,98 +3,128 @@ import json
 import logging
 import os
 from datetime import datetime, timedelta
+from typing import List
+import click
 import dotenv
-import requests
 from flask import current_app
 from sqlalchemy import func
 from MyLists import db
 from MyLists.classes.Global_stats import GlobalStats
+from MyLists.classes.Search_index import SearchIndex
 from MyLists.models.books_models import BooksList, Books
 from MyLists.models.games_models import GamesList, Games
 from MyLists.models.movies_models import MoviesList, Movies
 from MyLists.models.tv_models import SeriesList, AnimeList, Anime, Series
-from MyLists.models.user_models import User
-from MyLists.models.utils_models import MyListsStats
+from MyLists.models.user_models import User, TimeSpentLedger
+from MyLists.models.utils_models import MyListsStats, GlobalStatsCounter
+from MyLists.scheduled_tasks.index_audit import audit_indexes
 from MyLists.scheduled_tasks.media_refresher import automatic_media_refresh
-from MyLists.scheduled_tasks.remove_old_covers import (_remove_old_series_covers, _remove_old_anime_covers,
-                                                       _remove_old_movies_covers, _remove_old_books_covers,
-                                                       _remove_old_games_covers)
-from MyLists.utils.utils import get_models_type
+from MyLists.scheduled_tasks.remove_old_covers import remove_old_covers, remove_unreferenced_store_covers
+from MyLists.scheduled_tasks.task_runner import TaskRunner, TaskStepError
+from MyLists.utils.enums import MediaType
+from MyLists.utils.http_client import http_client
+from MyLists.utils.utils import get_models_type, get_models_group
 
 
-def remove_non_list_media():
-    """ Remove all media that are not present in a User list from the database and the disk """
+def remove_non_list_media() -> int:
+    """ Remove all media that are not present in a User list from the database and the disk. Return the number of
+    media removed """
 
     current_app.logger.info("###############################################################################")
     current_app.logger.info("[SYSTEM] - Starting automatic media remover -")
 
-    Series.remove_series()
-    Anime.remove_anime()
-    Movies.remove_movies()
-    Games.remove_games()
-    Books.remove_books()
-
-    # Commit changes
-    db.session.commit()
+    total_removed, failed = 0, []
+    for media_type in MediaType:
+        media_class = get_models_group(media_type)[0]
+        try:
+            counts = media_class.remove_non_list_media()
+            counts["search_index"] = SearchIndex.prune(media_type)
+            db.session.commit()
+            removed = counts.pop(media_class.__tablename__)
+            total_removed += removed
+            current_app.logger.info(f"Total {media_type.value} removed: {removed} (related records: {counts})")
+        except Exception as e:
+            db.session.rollback()
+            failed.append(media_type.value)
+            current_app.logger.error(f"[ERROR] - While removing the {media_type.value} and related records: {e}")
 
     current_app.logger.info("[SYSTEM] - Finished Automatic media remover -")
     current_app.logger.info("###############################################################################")
 
+    if failed:
+        raise TaskStepError(f"Removing the {', '.join(failed)} failed", total_removed)
+
+    return total_removed
 
-def remove_all_old_covers():
-    """ Remove all the old covers on disk if they are not present in the database """
+
+def remove_all_old_covers(dry_run: bool = False) -> int:
+    """ Remove all the old covers on disk if they are not present in the database. Return the number of files
+    removed """
 
     current_app.logger.info("###############################################################################")
-    current_app.logger.info("[SYSTEM] - Starting automatic covers remover -")
+    current_app.logger.info(f"[SYSTEM] - Starting automatic covers remover{' (dry run)' if dry_run else ''} -")
+
+    reports = [remove_old_covers(media_type, dry_run) for media_type in MediaType]
+    reports.append(remove_unreferenced_store_covers(dry_run))
 
-    _remove_old_series_covers()
-    _remove_old_anime_covers()
-    _remove_old_movies_covers()
-    _remove_old_books_covers()
-    _remove_old_games_covers()
+    for report in reports:
+        current_app.logger.info(f"{report['directory']}: {report['removed']}/{report['scanned']} files "
+                                f"{'to delete' if dry_run else 'deleted'} ({report['bytes'] / 1e6:.1f} MB), "
+                                f"errors: {report['errors']}")
 
     current_app.logger.info("[SYSTEM] - Finished automatic covers remover")
     current_app.logger.info('###############################################################################')
 
+    total_removed = sum(report["removed"] for report in reports)
+    total_errors = sum(report["errors"] for report in reports)
+    if total_errors:
+        raise TaskStepError(f"{total_errors} covers could not be removed", total_removed)
+
+    return total_removed
+
 
-def add_new_releasing_media():
-    """ Remove all the old covers on disk if they are not present in the database """
+def add_new_releasing_media() -> int:
+    """ Notify the users of the media releasing in a week or less. Return the number of notifications added """
 
     current_app.logger.info("###############################################################################")
     current_app.logger.info("[SYSTEM] - Starting checking new releasing media -")
 
-    Series.get_new_releasing_series()
-    Anime.get_new_releasing_anime()
-    Movies.get_new_releasing_movies()
-    Games.get_new_releasing_games()
+    count_added, failed = 0, []
+    for media_type, add_notifications in ((MediaType.SERIES, Series.get_new_releasing_series),
+                                          (MediaType.ANIME, Anime.get_new_releasing_anime),
+                                          (MediaType.MOVIES, Movies.get_new_releasing_movies),
+                                          (MediaType.GAMES, Games.get_new_releasing_games)):
+        try:
+            count_added += add_notifications()
+        except Exception as e:
+            db.session.rollback()
+            failed.append(media_type.value)
+            current_app.logger.error(f"[ERROR] - While checking the new releasing {media_type.value}: {e}")
 
+    current_app.logger.info(f"Number of notifications added: {count_added}")
     current_app.logger.info("[SYSTEM] - Finished checking new releasing media -")
     current_app.logger.info("###############################################################################")
 
+    if failed:
+        raise TaskStepError(f"Checking the new releasing {', '.join(failed)} failed", count_added)
+
+    return count_added
 
-def automatic_movies_locking():
-    """ Automatically lock the movies that are more than about 6 months old """
+
+def automatic_movies_locking() -> int:
+    """ Automatically lock the movies that are more than about 6 months old. Return the number of movies locked """
 
     current_app.logger.info("###############################################################################")
     current_app.logger.info("[SYSTEM] - Starting automatic movies locking -")
 
-    all_movies = Movies.query.filter(Movies.lock_status != True).all()
-    count_locked = 0
-    count_not_locked = 0
+    # <release_date> is stored as an ISO string "YYYY-MM-DD": well-formed dates compare like the dates themselves
+    cutoff_date = (datetime.utcnow() - timedelta(days=180)).strftime("%Y-%m-%d")
+    unlocked = Movies.lock_status.is_not(True)
 
-    now_date = (datetime.utcnow() - timedelta(days=180))
-    for movie in all_movies:
-        try:
-            release_date = datetime.strptime(movie.release_date, "%Y-%m-%d")
-            if release_date < now_date and movie.image_cover != "default.jpg":
-                movie.lock_status = True
-                count_locked += 1
-            else:
-                movie.lock_status = False
-                count_not_locked += 1
-        except:
-            movie.lock_status = False
-            count_not_locked += 1
+    count_locked = (Movies.query.filter(unlocked, Movies.release_date.like("____-__-__"),
+                                        Movies.release_date < cutoff_date, Movies.image_cover != "default.jpg")
+                    .update({"lock_status": True}, synchronize_session=False))
+    count_not_locked = Movies.query.filter(unlocked).update({"lock_status": False}, synchronize_session=False)
 
     db.session.commit()
 
@@ -103,6 +133,8 @@ def automatic_movies_locking():
     current_app.logger.info("[SYSTEM] - Finished automatic movies locking -")
     current_app.logger.info("###############################################################################")
 
+    return count_locked
+
 
 def update_IGDB_API():
     """ Refresh the IGDB API token """
@@ -111,7 +143,7 @@ def update_IGDB_API():
     current_app.logger.info("[SYSTEM] - Starting fetching new IGDB API key -")
 
     try:
-        r = requests.post(f"https://id.twitch.tv/oauth2/token?client_id={current_app.config['CLIENT_IGDB']}&"
+        r = http_client.post(f"https://id.twitch.tv/oauth2/token?client_id={current_app.config['CLIENT_IGDB']}&"
                           f"client_secret={current_app.config['SECRET_IGDB']}&grant_type=client_credentials")
         response = json.loads(r.text)
 
@@ -137,87 +169,115 @@ def update_IGDB_API():
     current_app.logger.info("###############################################################################")
 
 
-def compute_media_time_spent():
-    """ Compute the total time watched/played/read for each media for each user """
+def compute_media_time_spent(user_ids: List[int] = None):
+    """ Recompute from the lists the total time watched/played/read for each media for each user (or only the
+    <user_ids>) and record the corrections in the time spent ledger """
 
     current_app.logger.info("###############################################################################")
     current_app.logger.info("[SYSTEM] - Starting to compute the total time spent for each user -")
 
-    all_media = get_models_type("Media")
-    all_media_list = get_models_type("List")
+    users = User.query if user_ids is None else User.query.filter(User.id.in_(user_ids))
+    users = users.all()
+    ledger_totals = TimeSpentLedger.get_totals(user_ids)
 
-    for media, media_list in zip(all_media, all_media_list):
+    for media, media_list in zip(get_models_type("Media"), get_models_type("List")):
         if media_list in (SeriesList, AnimeList, MoviesList):
-            query = (db.session.query(User, media.duration, media_list.total, func.sum(media.duration * media_list.total))
-                     .join(media, media.id == media_list.media_id)
-                     .join(User, User.id == media_list.user_id)
-                     .group_by(media_list.user_id).all())
+            time_spent = func.sum(media.duration * media_list.total)
         elif media_list == GamesList:
-            query = (db.session.query(User, media_list.playtime, media_list.score, func.sum(media_list.playtime))
-                     .join(media, media.id == media_list.media_id)
-                     .join(User, User.id == media_list.user_id)
-                     .group_by(media_list.user_id).all())
+            time_spent = func.sum(media_list.playtime)
         elif media_list == BooksList:
-            query = (db.session.query(User, media_list.total, media_list.score,
-                                     func.sum(BooksList.TIME_PER_PAGE * media_list.total))
-                     .join(media, media.id == media_list.media_id)
-                     .join(User, User.id == media_list.user_id)
-                     .group_by(media_list.user_id).all())
+            time_spent = func.sum(BooksList.TIME_PER_PAGE * media_list.total)
         else:
             return
 
-        for q in query:
-            setattr(q[0], f"time_spent_{media.GROUP.value}", q[3])
+        query = (db.session.query(media_list.user_id, time_spent)
+                 .join(media, media.id == media_list.media_id).group_by(media_list.user_id))
+        if user_ids is not None:
+            query = query.filter(media_list.user_id.in_(user_ids))
+        times = dict(query.all())
+
+        # Set the new time spent and book the difference with the ledger
+        for user in users:
+            new_time = times.get(user.id) or 0
+            setattr(user, f"time_spent_{media.GROUP.value}", new_time)
+
+            correction = new_time - ledger_totals.get((user.id, media.GROUP), 0)
+            if correction:
+                db.session.add(TimeSpentLedger(user_id=user.id, media_type=media.GROUP, delta=correction))
 
     # Commit changes
     db.session.commit()
 
+    current_app.logger.info(f"Time spent computed for {len(users)} users")
     current_app.logger.info("[SYSTEM] - Finished computing the total time spent for each user -")
     current_app.logger.info("###############################################################################")
 
 
+def check_media_time_spent() -> int:
+    """ Check the time spent of the users against the time spent ledger and only recompute the users disagreeing.
+    Return the number of users recomputed """
+
+    current_app.logger.info("###############################################################################")
+    current_app.logger.info("[SYSTEM] - Starting to check the time spent ledger -")
+
+    folded = TimeSpentLedger.compact()
+    db.session.commit()
+    current_app.logger.info(f"Old time spent deltas folded: {folded}")
+
+    mismatched = TimeSpentLedger.get_mismatched_users()
+    current_app.logger.info(f"Users with a time spent disagreeing with the ledger: {len(mismatched)}")
+    if mismatched:
+        compute_media_time_spent(mismatched)
+
+    current_app.logger.info("[SYSTEM] - Finished checking the time spent ledger -")
+    current_app.logger.info("###############################################################################")
+
+    return len(mismatched)
+
+
 def update_Mylists_stats():
-    """ Update the MyLists global stats """
+    """ Save a snapshot of the MyLists global stats """
 
     # Get global stats
     stats = GlobalStats()
 
-    total_time = User.get_total_time_spent()
-    media_top = stats.get_top_media()
-    media_genres = stats.get_top_genres()
-    media_actors = stats.get_top_actors()
-    media_authors = stats.get_top_authors()
-    media_developers = stats.get_top_developers()
-    media_directors = stats.get_top_directors()
-    media_dropped = stats.get_top_dropped()
-    media_eps_seas = stats.get_total_eps_seasons()
-    total_movies = stats.get_total_movies()
-
-    total_pages = stats.get_total_book_pages()
-    nb_users, nb_media = stats.get_nb_media_and_users()
-
-    stats = MyListsStats(
-        nb_users=nb_users,
-        nb_media=json.dumps(nb_media),
-        total_time=json.dumps(total_time),
-        top_media=json.dumps(media_top),
-        top_genres=json.dumps(media_genres),
-        top_actors=json.dumps(media_actors),
-        top_directors=json.dumps(media_directors),
-        top_dropped=json.dumps(media_dropped),
-        total_episodes=json.dumps(media_eps_seas),
-        total_seasons=json.dumps(media_eps_seas),
-        total_movies=json.dumps(total_movies),
-        top_authors=json.dumps(media_authors),
-        top_developers=json.dumps(media_developers),
-        total_pages=total_pages,
-    )
+    # First run: fill the stats counters from the lists
+    if GlobalStatsCounter.query.first() is None:
+        stats.rebuild_counters()
+
+    all_stats = stats.get_all_stats()
+    stats = MyListsStats(**{key: json.dumps(value) if isinstance(value, dict) else value
+                            for key, value in all_stats.items()})
 
     # Add and commit changes
     db.session.add(stats)
     db.session.commit()
 
 
+def purge_http_cache() -> int:
+    """ Remove the long expired API responses from the cache. Return the number of responses removed """
+
+    count_removed = http_client.purge_cache()
+    current_app.logger.info(f"Removed {count_removed} expired API responses from the cache")
+
+    return count_removed
+
+
+def get_nightly_runner() -> TaskRunner:
+    """ Return the runner of the nightly scheduled tasks. The covers GC and the stats snapshot are independent and
+    run in parallel """
+
+    return TaskRunner("scheduled_tasks", [
+        [("remove_non_list_media", remove_non_list_media)],
+        [("automatic_media_refresh", automatic_media_refresh)],
+        [("add_new_releasing_media", add_new_releasing_media)],
+        [("automatic_movies_locking", automatic_movies_locking)],
+        [("check_media_time_spent", check_media_time_spent)],
+        [("remove_all_old_covers", remove_all_old_covers), ("update_Mylists_stats", update_Mylists_stats)],
+        [("purge_http_cache", purge_http_cache)],
+    ])
+
+
 # ---------------------------------------------------------------------------------------------------------------
 
 
@@ -225,19 +285,67 @@ def add_cli_commands():
     """ Register the command for the Flask CLI """
 
     @current_app.cli.command()
-    def scheduled_tasks():
+    @click.option("--step", type=click.Choice(get_nightly_runner().step_names), help="Only run this step.")
+    @click.option("--restart", is_flag=True, help="Start a new run instead of resuming the last failed one.")
+    def scheduled_tasks(step: str, restart: bool):
         """ Run all the necessary scheduled jobs """
 
         # Set logger to INFO
         current_app.logger.setLevel(logging.INFO)
 
-        remove_non_list_media()
-        remove_all_old_covers()
-        automatic_media_refresh()
-        add_new_releasing_media()
-        automatic_movies_locking()
+        get_nightly_runner().run(only=step, restart=restart)
+
+    @current_app.cli.command()
+    @click.option("--dry-run", is_flag=True, help="Only report the covers that would be deleted.")
+    def remove_covers(dry_run: bool):
+        """ Remove the old covers on disk """
+
+        # Set logger to INFO
+        current_app.logger.setLevel(logging.INFO)
+
+        try:
+            remove_all_old_covers(dry_run)
+        except TaskStepError as e:
+            raise click.ClickException(str(e))
+
+    @current_app.cli.command()
+    def compute_time_spent():
+        """ Recompute the time spent of all the users from their lists """
+
+        # Set logger to INFO
+        current_app.logger.setLevel(logging.INFO)
+
         compute_media_time_spent()
+
+    @current_app.cli.command()
+    def rebuild_stats():
+        """ Recompute the global stats counters from the lists """
+
+        # Set logger to INFO
+        current_app.logger.setLevel(logging.INFO)
+
+        GlobalStats().rebuild_counters()
         update_Mylists_stats()
+        current_app.logger.info("[SYSTEM] - Global stats counters rebuilt -")
+
+    @current_app.cli.command()
+    def rebuild_search_index():
+        """ Index again all the media in the full-text search index """
+
+        # Set logger to INFO
+        current_app.logger.setLevel(logging.INFO)
+
+        current_app.logger.info(f"[SYSTEM] - Search index rebuilt: {SearchIndex.rebuild()} media indexed -")
+
+    @current_app.cli.command()
+    def index_audit():
+        """ Explain the hot queries and flag the full table scans """
+
+        # Set logger to INFO
+        current_app.logger.setLevel(logging.INFO)
+
+        if audit_indexes():
+            raise SystemExit(1)
 
     @current_app.cli.command()
     def update_igdb_key():
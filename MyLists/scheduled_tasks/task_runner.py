@@ -0,0 +1,152 @@
+import os
+import socket
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Callable, List, Optional, Tuple
+from flask import current_app
+from MyLists import db
+from MyLists.models.utils_models import TaskRun, TaskStepLog
+from MyLists.utils.http_client import http_client
+
+
+# A step is a (name, function) pair, the function may return the number of rows it touched
+Step = Tuple[str, Callable]
+
+
+class TaskStepError(Exception):
+    """ Raised by a step which failed in part, once it did all it could (e.g. one media type out of five). <rows> is
+    the number of rows it touched anyway """
+
+    def __init__(self, message: str, rows: int = None):
+        super().__init__(message)
+        self.rows = rows
+
+
+class TaskRunner:
+    """ Run the steps of a scheduled task and persist a log of each step (timing, rows touched, API calls, error).
+    The steps are given by groups: the groups run in order and the steps of a group, independent, run in parallel.
+    A step fails by raising (<TaskStepError> if it failed in part). A recent failed or interrupted run is resumed from
+    the steps that did not succeed """
+
+    def __init__(self, name: str, groups: List[List[Step]]):
+        self.app = current_app._get_current_object()
+        self.name = name
+        self.groups = groups
+
+    @property
+    def step_names(self) -> List[str]:
+        """ Names of all the steps of the task """
+        return [name for group in self.groups for name, _ in group]
+
+    def run(self, only: str = None, restart: bool = False) -> TaskRun:
+        """ Run all the steps (or <only> this one) and return the run. The last run, if failed or interrupted less
+        than <TASK_RESUME_WINDOW> hours ago, is resumed unless <restart> """
+
+        done = []
+        if only is not None:
+            groups = [[step for group in self.groups for step in group if step[0] == only]]
+            run = self._start_run(f"{self.name}.{only}")
+        else:
+            groups = self.groups
+            last_run = TaskRun.get_last(self.name)
+            window = timedelta(hours=current_app.config["TASK_RESUME_WINDOW"])
+            if last_run is not None and last_run.is_resumable(window) and not restart:
+                run, done = last_run, last_run.succeeded_steps()
+                self._take_over(run)
+                current_app.logger.info(f"[SYSTEM] - Resuming the run [{run.id}] of <{self.name}>, already done: "
+                                        f"{done} -")
+            else:
+                run = self._start_run(self.name)
+
+        # The run stays "running" until all its groups ran, so an interrupted run can be resumed
+        succeeded = True
+        for group in groups:
+            steps = [step for step in group if step[0] not in done]
+            if steps and not self._run_group(run, steps):
+                succeeded = False
+                break
+
+        run.status = "success" if succeeded else "failed"
+        run.ended_at = datetime.utcnow()
+        db.session.commit()
+
+        current_app.logger.info(f"[SYSTEM] - Run [{run.id}] of <{run.name}> finished: {run.status} -")
+
+        return run
+
+    @staticmethod
+    def _take_over(run: TaskRun):
+        """ Resume a run in the current process, the steps left running by an interrupted process are failed """
+
+        for step in run.steps:
+            if step.status == "running":
+                step.status, step.error = "failed", "Interrupted"
+
+        run.status, run.ended_at = "running", None
+        run.host, run.pid = socket.gethostname(), os.getpid()
+        db.session.commit()
+
+    @staticmethod
+    def _start_run(name: str) -> TaskRun:
+        """ Create and commit a new run """
+
+        run = TaskRun(name=name)
+        db.session.add(run)
+        db.session.commit()
+
+        return run
+
+    def _run_group(self, run: TaskRun, steps: List[Step]) -> bool:
+        """ Run the <steps> of a group (in parallel if more than one), log them and return True if all succeeded """
+
+        logs = [TaskStepLog(run_id=run.id, step=name) for name, _ in steps]
+        db.session.add_all(logs)
+        db.session.commit()
+
+        if len(steps) == 1:
+            results = [self._run_step(*steps[0])]
+        else:
+            with ThreadPoolExecutor(max_workers=len(steps)) as executor:
+                results = list(executor.map(lambda step: self._run_step_in_context(*step), steps))
+
+        for log, (rows, api_calls, duration, error) in zip(logs, results):
+            log.status = "failed" if error else "success"
+            log.ended_at = datetime.utcnow()
+            log.duration = duration
+            log.rows = rows
+            log.api_calls = api_calls
+            log.error = error
+            current_app.logger.info(f"[SYSTEM] - Step <{log.step}>: {log.status} in {duration:.1f} s, rows: {rows}, "
+                                    f"API calls: {api_calls} -")
+        db.session.commit()
+
+        return all(error is None for *_, error in results)
+
+    def _run_step_in_context(self, name: str, func: Callable) -> Tuple:
+        """ Run a step in its own app context and DB session (worker thread) """
+
+        with self.app.app_context():
+            return self._run_step(name, func)
+
+    def _run_step(self, name: str, func: Callable) -> Tuple[Optional[int], int, float, Optional[str]]:
+        """ Run a step and return its (rows, api_calls, duration, error). The API calls are counted on the shared
+        HTTP client, so they are approximate for the steps running in parallel """
+
+        api_calls = http_client.network_calls
+        start = time.perf_counter()
+
+        rows, error = None, None
+        try:
+            rows = func()
+        except TaskStepError as e:
+            db.session.rollback()
+            rows, error = e.rows, str(e)
+            current_app.logger.error(f"[ERROR] - Step <{name}> of the task <{self.name}>: {e}")
+        except Exception as e:
+            db.session.rollback()
+            error = f"{type(e).__name__}: {e}"
+            current_app.logger.error(f"[ERROR] - Step <{name}> of the task <{self.name}>: {e}")
+
+        return (rows if isinstance(rows, int) else None, http_client.network_calls - api_calls,
+                time.perf_counter() - start, error)
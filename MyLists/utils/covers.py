@@ -0,0 +1,65 @@
+import hashlib
+from functools import lru_cache
+from typing import List, Union
+from PIL import Image
+
+
+# Directory of the content-addressed covers store (in <static/covers>)
+STORE_DIR = "store"
+
+# Cover sizes (the <full> JPEG is the file stored in <image_cover>)
+COVER_SIZES = {"full": (300, 450), "thumb": (150, 225)}
+
+# Cover formats by order of preference with their MIME type and encoding options
+COVER_FORMATS = {
+    "avif": ("image/avif", dict(format="AVIF", quality=60)),
+    "webp": ("image/webp", dict(format="WEBP", quality=80, method=4)),
+    "jpg": ("image/jpeg", dict(format="JPEG", quality=90)),
+}
+
+
+@lru_cache()
+def encodable_formats() -> List[str]:
+    """ Cover formats that the installed Pillow can encode (AVIF needs a plugin) """
+
+    Image.init()
+    return [fmt for fmt, (_, options) in COVER_FORMATS.items() if options["format"] in Image.SAVE]
+
+
+def variant_name(image_cover: str, size: str = "full", fmt: str = "jpg") -> str:
+    """ Name of the <size>/<fmt> variant of a cover, e.g. <abc.jpg> -> <abc_thumb.webp> """
+
+    stem = image_cover.rsplit(".", 1)[0]
+    suffix = "" if size == "full" else f"_{size}"
+
+    return f"{stem}{suffix}.{fmt}"
+
+
+def cover_stem(filename: str) -> str:
+    """ Name of the original cover a variant file belongs to, without extension """
+
+    stem = filename.rsplit(".", 1)[0]
+    for size in COVER_SIZES:
+        if stem.endswith(f"_{size}"):
+            return stem[:-len(size) - 1]
+
+    return stem
+
+
+def store_key(source: Union[str, bytes]) -> str:
+    """ Key of a cover in the content-addressed store: hash of its source URL (or of its bytes) """
+
+    if isinstance(source, str):
+        source = source.encode("utf-8")
+
+    return hashlib.sha256(source).hexdigest()[:32]
+
+
+def is_stored(image_cover: str) -> bool:
+    """ Check if an <image_cover> is in the content-addressed store (instead of a <*_covers> directory) """
+    return image_cover.startswith(f"{STORE_DIR}/")
+
+
+def cover_static_path(image_cover: str, covers_dir: str) -> str:
+    """ Path of a cover in the static folder, in the store or in its <covers_dir> (e.g. <series_covers>) """
+    return f"covers/{image_cover}" if is_stored(image_cover) else f"covers/{covers_dir}/{image_cover}"
@@ -0,0 +1,225 @@
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Any, Callable, Optional
+from urllib.parse import urlsplit
+import requests
+from flask import current_app, has_app_context
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from MyLists.utils.rate_limiter import RateLimiter
+from MyLists.utils.response_cache import ResponseCache
+
+
+class HttpClient:
+    """ Per-process registry of pooled, keep-alive <requests.Session> objects (one per remote host). Used by all the
+    <ApiData> subclasses so the TCP+TLS handshakes to TMDB/IGDB/Google/Jikan are done once per worker """
+
+    DEFAULTS = dict(
+        HTTP_POOL_CONNECTIONS=10,
+        HTTP_POOL_MAXSIZE=20,
+        HTTP_TIMEOUT=10,
+        HTTP_MAX_RETRIES=2,
+        HTTP_CACHE_ENABLED=False,
+        HTTP_CACHE_PATH=None,
+        HTTP_CACHE_TTLS={},
+        RATE_LIMIT_PATH=None,
+    )
+
+    def __init__(self):
+        self._sessions: Dict[str, requests.Session] = {}
+        self._cache: Optional[ResponseCache] = None
+        self._limiter: Optional[RateLimiter] = None
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+
+        # Number of requests really sent over the network by this process (cache hits excluded)
+        self.network_calls = 0
+
+    def _get_option(self, name: str) -> Any:
+        """ Get an option from the app config, or the default one when used outside an app context """
+
+        if has_app_context():
+            return current_app.config.get(name, self.DEFAULTS[name])
+        return self.DEFAULTS[name]
+
+    def _create_session(self) -> requests.Session:
+        """ Create a new session with its own connection pool and a retry policy for idempotent requests """
+
+        retries = Retry(
+            total=self._get_option("HTTP_MAX_RETRIES"),
+            backoff_factor=0.3,
+            status_forcelist=(502, 503, 504),
+            allowed_methods=frozenset(["GET", "HEAD"]),
+            raise_on_status=False,
+        )
+
+        adapter = HTTPAdapter(
+            pool_connections=self._get_option("HTTP_POOL_CONNECTIONS"),
+            pool_maxsize=self._get_option("HTTP_POOL_MAXSIZE"),
+            max_retries=retries,
+        )
+
+        session = requests.Session()
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+
+        return session
+
+    def session(self, url: str) -> requests.Session:
+        """ Return the session associated with the host of the <url>, create it if necessary """
+
+        with self._lock:
+            # Sockets must not be shared with a forked process (e.g. gunicorn workers)
+            if os.getpid() != self._pid:
+                self._sessions = {}
+                self._pid = os.getpid()
+
+            host = urlsplit(url).netloc
+            session = self._sessions.get(host)
+            if session is None:
+                session = self._create_session()
+                self._sessions[host] = session
+
+        return session
+
+    def _get_cache(self) -> Optional[ResponseCache]:
+        """ Return the on-disk response cache or None if disabled """
+
+        if not self._get_option("HTTP_CACHE_ENABLED") or not self._get_option("HTTP_CACHE_PATH"):
+            return None
+
+        with self._lock:
+            path = self._get_option("HTTP_CACHE_PATH")
+            if self._cache is None or self._cache.path != path:
+                self._cache = ResponseCache(path)
+
+        return self._cache
+
+    def _send(self, method: str, url: str, rate_limit: str = None, **kwargs) -> requests.Response:
+        """ Send the request over the network, after taking a token from the <rate_limit> provider budget """
+
+        path = self._get_option("RATE_LIMIT_PATH")
+        if rate_limit and path:
+            with self._lock:
+                if self._limiter is None or self._limiter.path != path:
+                    self._limiter = RateLimiter(path)
+            self._limiter.acquire(rate_limit)
+
+        with self._lock:
+            self.network_calls += 1
+
+        return self.session(url).request(method, url, **kwargs)
+
+    def _cached_request(self, response_cache: ResponseCache, endpoint: str, method: str, url: str,
+                        rate_limit: str = None, revalidate: bool = False, **kwargs) -> requests.Response:
+        """ Serve a fresh response from the cache (unless <revalidate>), otherwise revalidate (ETag/Last-Modified) or
+        fetch and store it """
+
+        ttl = self._get_option("HTTP_CACHE_TTLS")[endpoint]
+        key = response_cache.make_key(method, url, kwargs.get("params"), kwargs.get("data"), kwargs.get("json"))
+
+        try:
+            entry = response_cache.get(key)
+        except sqlite3.Error as e:
+            current_app.logger.error(f"[ERROR] - Reading the API response cache: {e}")
+            return self._send(method, url, rate_limit, **kwargs)
+
+        if entry and entry["expires"] > time.time() and not revalidate:
+            return response_cache.to_response(entry, url)
+
+        # Conditional request to revalidate the expired entry
+        if entry and (entry["etag"] or entry["last_modified"]):
+            headers = dict(kwargs.get("headers") or {})
+            if entry["etag"]:
+                headers["If-None-Match"] = entry["etag"]
+            if entry["last_modified"]:
+                headers["If-Modified-Since"] = entry["last_modified"]
+            kwargs["headers"] = headers
+
+        response = self._send(method, url, rate_limit, **kwargs)
+
+        try:
+            if entry and response.status_code == 304:
+                response_cache.touch(key, ttl)
+                return response_cache.to_response(entry, url)
+            if response.status_code == 200:
+                response_cache.set(key, response, ttl)
+        except sqlite3.Error as e:
+            current_app.logger.error(f"[ERROR] - Writing the API response cache: {e}")
+
+        return response
+
+    def request(self, method: str, url: str, cache: str = None, rate_limit: str = None, revalidate: bool = False,
+                **kwargs) -> requests.Response:
+        """ Make a request using the pooled session of the host, with a default timeout. <cache> is the name of the
+        endpoint in <HTTP_CACHE_TTLS> to cache the response on disk, <revalidate> ignores a fresh cached response to
+        always ask the API (conditional request). <rate_limit> is the provider in <RATE_LIMITS> whose shared budget
+        is used (only for the requests really sent, not the cache hits) """
+
+        kwargs.setdefault("timeout", self._get_option("HTTP_TIMEOUT"))
+
+        response_cache = self._get_cache() if cache else None
+        if response_cache is None:
+            return self._send(method, url, rate_limit, **kwargs)
+
+        return self._cached_request(response_cache, cache, method, url, rate_limit, revalidate, **kwargs)
+
+    def cached_call(self, endpoint: str, func: Callable, *args) -> Any:
+        """ Cache the JSON result of a non-HTTP lookup (e.g. the HLTB scraping API) for the TTL of <endpoint> """
+
+        response_cache = self._get_cache()
+        if response_cache is None:
+            return func(*args)
+
+        key = response_cache.make_key(endpoint, func.__qualname__, args)
+        try:
+            value = response_cache.get_value(key)
+        except sqlite3.Error as e:
+            current_app.logger.error(f"[ERROR] - Reading the API response cache: {e}")
+            return func(*args)
+
+        if value is None:
+            value = func(*args)
+            try:
+                response_cache.set_value(key, value, self._get_option("HTTP_CACHE_TTLS")[endpoint])
+            except sqlite3.Error as e:
+                current_app.logger.error(f"[ERROR] - Writing the API response cache: {e}")
+
+        return value
+
+    def purge_cache(self, older_than: float = 7 * 24 * 3600) -> int:
+        """ Remove the cached responses expired for more than <older_than> seconds """
+
+        response_cache = self._get_cache()
+        return response_cache.purge(older_than) if response_cache else 0
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        """ GET request using the pooled session """
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        """ POST request using the pooled session """
+        return self.request("POST", url, **kwargs)
+
+    def download(self, url: str, path: str, **kwargs):
+        """ Stream a remote file to the local <path> (replacement of <urlretrieve>) """
+
+        with self.get(url, stream=True, **kwargs) as response:
+            response.raise_for_status()
+            with open(path, "wb") as fp:
+                for chunk in response.iter_content(chunk_size=64 * 1024):
+                    fp.write(chunk)
+
+    def close(self):
+        """ Close all the sessions of the current process """
+
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions = {}
+
+
+# Globally accessible HTTP client
+http_client = HttpClient()
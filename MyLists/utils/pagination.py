@@ -0,0 +1,128 @@
+from __future__ import annotations
+import base64
+import json
+import math
+from datetime import datetime
+from typing import Any, List, Optional, Tuple
+from flask import abort, request
+from sqlalchemy import and_, or_, false, DateTime
+from sqlalchemy.orm import Query
+from sqlalchemy.sql import operators
+from MyLists import cache
+
+
+# Time (in seconds) a <cached> total is kept
+TOTAL_CACHE_TIMEOUT = 300
+
+
+class Page:
+    """ A page of results, from an offset pagination (<page>, <pages>) or a keyset pagination (<next_cursor>) """
+
+    def __init__(self, items: List, total: int = None, page: int = None, pages: int = None,
+                 next_cursor: str = None):
+        self.items = items
+        self.total = total
+        self.page = page
+        self.pages = pages
+        self.next_cursor = next_cursor
+
+
+def _split_sort_key(sort_key: Any) -> Tuple[Any, bool]:
+    """ Split a sort key (<column.asc()>, <column.desc()> or <column>) into its (column, descending) """
+
+    if getattr(sort_key, "modifier", None) in (operators.asc_op, operators.desc_op):
+        return sort_key.element, sort_key.modifier == operators.desc_op
+    return sort_key, False
+
+
+def encode_cursor(values: List) -> str:
+    """ Encode the sort key values of the last item of a page into an opaque cursor """
+    return base64.urlsafe_b64encode(json.dumps(values, default=str).encode()).decode()
+
+
+def decode_cursor(cursor: str, columns: List) -> List:
+    """ Decode a cursor into the sort key values of the <columns> """
+
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if not isinstance(values, list) or len(values) != len(columns):
+            raise ValueError
+        return [datetime.fromisoformat(value) if value is not None and isinstance(column.type, DateTime) else value
+                for column, value in zip(columns, values)]
+    except (ValueError, TypeError):
+        return abort(400, "Invalid cursor.")
+
+
+def paginate_keyset(query: Query, sort_keys: List, per_page: int, cursor: str = None) -> Tuple[List, Optional[str]]:
+    """ Return the items of <query> following the <cursor> (first page if empty) and the cursor of the next page
+    (None on the last page). The items are sought with a WHERE on the <sort_keys> instead of an OFFSET, the last
+    sort key must be unique (the id). NULLs are ordered as the smallest values on every database """
+
+    keys = [_split_sort_key(sort_key) for sort_key in sort_keys]
+    columns = [column for column, _ in keys]
+    ordering = [column.desc().nulls_last() if is_desc else column.asc().nulls_first() for column, is_desc in keys]
+
+    query = query.order_by(None).order_by(*ordering)
+
+    if cursor:
+        values = decode_cursor(cursor, columns)
+
+        # (k1, k2, ..., kn) after (v1, v2, ..., vn): k1 after v1, or k1 = v1 and k2 after v2, etc.
+        conditions, equals = [], []
+        for (column, is_desc), value in zip(keys, values):
+            if is_desc:
+                after = false() if value is None else or_(column < value, column.is_(None))
+            else:
+                after = column.is_not(None) if value is None else column > value
+            conditions.append(and_(*equals, after))
+            equals.append(column.is_(None) if value is None else column == value)
+
+        query = query.filter(or_(*conditions))
+
+    rows = query.add_columns(*columns).limit(per_page + 1).all()
+
+    next_cursor = None
+    if len(rows) > per_page:
+        next_cursor = encode_cursor(list(rows[per_page - 1][-len(columns):]))
+
+    # Remove the sort keys added to the rows (single entity queries return the entities)
+    width = len(rows[0]) - len(columns) if rows else 1
+    items = [row[0] if width == 1 else tuple(row[:width]) for row in rows[:per_page]]
+
+    return items, next_cursor
+
+
+def get_total(query: Query, mode: str = "exact", cache_key: str = None) -> Optional[int]:
+    """ Count the results of <query>. <mode> is "exact" (always counted), "cached" (counted once and kept for
+    <TOTAL_CACHE_TIMEOUT> seconds under <cache_key>) or "none" (not counted) """
+
+    if mode == "none":
+        return None
+
+    if mode == "cached" and cache_key:
+        total = cache.get(f"total:{cache_key}")
+        if total is None:
+            total = query.order_by(None).count()
+            cache.set(f"total:{cache_key}", total, timeout=TOTAL_CACHE_TIMEOUT)
+        return total
+
+    return query.order_by(None).count()
+
+
+def paginate(query: Query, sort_keys: List, per_page: int, cache_key: str = None) -> Page:
+    """ Paginate <query> from the request args: with a <cursor> arg (empty for the first page) the keyset
+    pagination is used, its total depends on the <total> arg (see <get_total>, "cached" by default). Otherwise,
+    the offset pagination with the <page> arg is used """
+
+    cursor = request.args.get("cursor")
+
+    if cursor is None:
+        results = (query.order_by(None).order_by(*sort_keys)
+                   .paginate(page=request.args.get("page", 1, type=int), per_page=per_page, error_out=True))
+        return Page(results.items, total=results.total, page=results.page, pages=results.pages)
+
+    items, next_cursor = paginate_keyset(query, sort_keys, per_page, cursor)
+    total = get_total(query, request.args.get("total", "cached", type=str), cache_key)
+    pages = math.ceil(total / per_page) if total is not None else None
+
+    return Page(items, total=total, pages=pages, next_cursor=next_cursor)
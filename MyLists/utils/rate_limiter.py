@@ -0,0 +1,74 @@
+import time
+from typing import Optional
+from flask import current_app, has_request_context
+from MyLists.utils.sqlite_store import SQLiteStore
+
+
+class RateLimitExceeded(Exception):
+    """ Raised in non-blocking mode when the rate budget of a provider is exhausted """
+
+    def __init__(self, provider: str, retry_after: float):
+        super().__init__(f"Rate limit of the <{provider}> provider exceeded, retry in {retry_after:.2f}s")
+        self.provider = provider
+        self.retry_after = retry_after
+
+
+class RateLimiter(SQLiteStore):
+    """ Token bucket per provider (TMDB, IGDB, Jikan, ...) whose state lives in a local SQLite file so the budget is
+    shared between all the gunicorn workers and the CLI jobs of the box """
+
+    SCHEMA = ("CREATE TABLE IF NOT EXISTS buckets ("
+              "provider TEXT PRIMARY KEY, "
+              "tokens REAL NOT NULL, "
+              "updated REAL NOT NULL)")
+
+    def _try_acquire(self, provider: str, calls: int, period: float) -> float:
+        """ Try to take one token from the bucket of <provider>. Return 0 on success, otherwise the time to wait for
+        the next token """
+
+        rate = calls / period
+        connection = self.connection
+
+        # Lock the database for writing, the refill and the take are atomic between processes
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            now = time.time()
+            row = connection.execute("SELECT tokens, updated FROM buckets WHERE provider = ?", (provider,)).fetchone()
+            tokens = calls if row is None else min(calls, row[0] + (now - row[1]) * rate)
+
+            wait_time = 0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait_time = (1 - tokens) / rate
+
+            connection.execute("INSERT OR REPLACE INTO buckets (provider, tokens, updated) VALUES (?, ?, ?)",
+                               (provider, tokens, now))
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+
+        return wait_time
+
+    def acquire(self, provider: str, blocking: Optional[bool] = None):
+        """ Take one token for <provider>. In blocking mode (default outside of a request, e.g. batch jobs) sleep until
+        it is available. In non-blocking mode (default for the interactive endpoints) wait at most
+        <RATE_LIMIT_MAX_WAIT> seconds, then raise <RateLimitExceeded> """
+
+        calls, period = current_app.config["RATE_LIMITS"][provider]
+        if blocking is None:
+            blocking = not has_request_context()
+
+        max_wait = current_app.config["RATE_LIMIT_MAX_WAIT"]
+        waited = 0
+        while True:
+            wait_time = self._try_acquire(provider, calls, period)
+            if wait_time == 0:
+                return
+
+            if not blocking and waited + wait_time > max_wait:
+                raise RateLimitExceeded(provider, wait_time)
+
+            time.sleep(wait_time)
+            waited += wait_time
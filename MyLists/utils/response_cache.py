@@ -0,0 +1,89 @@
+import hashlib
+import json
+import time
+from typing import Any, Dict, Optional
+import requests
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+from MyLists.utils.sqlite_store import SQLiteStore
+
+
+class ResponseCache(SQLiteStore):
+    """ Persistent on-disk cache (SQLite) of the third-party API responses. Entries are kept after their expiration so
+    they can be revalidated with their ETag/Last-Modified headers instead of being downloaded again """
+
+    SCHEMA = ("CREATE TABLE IF NOT EXISTS responses ("
+              "key TEXT PRIMARY KEY, "
+              "status INTEGER NOT NULL, "
+              "headers TEXT NOT NULL, "
+              "content BLOB NOT NULL, "
+              "etag TEXT, "
+              "last_modified TEXT, "
+              "expires REAL NOT NULL)")
+
+    @staticmethod
+    def make_key(*parts: Any) -> str:
+        """ Create a cache key from the request parts (method, url, params, body, ...) """
+
+        raw = json.dumps(parts, sort_keys=True, default=str)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict]:
+        """ Return the cached entry of <key> (expired or not) or None """
+
+        row = self.connection.execute("SELECT status, headers, content, etag, last_modified, expires FROM responses "
+                                      "WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+
+        return dict(status=row[0], headers=json.loads(row[1]), content=row[2], etag=row[3], last_modified=row[4],
+                    expires=row[5])
+
+    def set(self, key: str, response: requests.Response, ttl: float):
+        """ Store the <response> under <key> for <ttl> seconds """
+
+        self.connection.execute(
+            "INSERT OR REPLACE INTO responses (key, status, headers, content, etag, last_modified, expires) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (key, response.status_code, json.dumps(dict(response.headers)), response.content,
+             response.headers.get("ETag"), response.headers.get("Last-Modified"), time.time() + ttl),
+        )
+
+    def touch(self, key: str, ttl: float):
+        """ Extend the expiration of a revalidated entry (HTTP 304) """
+        self.connection.execute("UPDATE responses SET expires = ? WHERE key = ?", (time.time() + ttl, key))
+
+    def get_value(self, key: str) -> Any:
+        """ Return a fresh cached JSON value (for the non-HTTP lookups like HLTB) or None """
+
+        entry = self.get(key)
+        if entry is None or entry["expires"] < time.time():
+            return None
+        return json.loads(entry["content"])
+
+    def set_value(self, key: str, value: Any, ttl: float):
+        """ Store a JSON value under <key> for <ttl> seconds """
+
+        self.connection.execute(
+            "INSERT OR REPLACE INTO responses (key, status, headers, content, expires) VALUES (?, 200, '{}', ?, ?)",
+            (key, json.dumps(value).encode("utf-8"), time.time() + ttl),
+        )
+
+    def purge(self, older_than: float) -> int:
+        """ Remove the entries expired for more than <older_than> seconds and return their number """
+
+        cursor = self.connection.execute("DELETE FROM responses WHERE expires < ?", (time.time() - older_than,))
+        return cursor.rowcount
+
+    @staticmethod
+    def to_response(entry: Dict, url: str) -> requests.Response:
+        """ Rebuild a <requests.Response> from a cached entry """
+
+        response = requests.Response()
+        response.status_code = entry["status"]
+        response.headers = CaseInsensitiveDict(entry["headers"])
+        response._content = entry["content"]
+        response.encoding = get_encoding_from_headers(response.headers)
+        response.url = url
+
+        return response
@@ -0,0 +1,48 @@
+import threading
+from typing import Any, Callable, Dict, Hashable
+
+
+class _Call:
+    """ In-flight call shared between the leader and the waiting callers """
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """ Coalesce the concurrent calls with the same key: the first caller runs the function, the others wait for it
+    and share its result (or its exception) """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+
+    def do(self, key: Hashable, func: Callable, *args, **kwargs) -> Any:
+        """ Run <func> once for all the concurrent callers of <key> and return its result """
+
+        with self._lock:
+            call = self._calls.get(key)
+            is_leader = call is None
+            if is_leader:
+                call = _Call()
+                self._calls[key] = call
+
+        if not is_leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func(*args, **kwargs)
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+
+        return call.result
@@ -0,0 +1,29 @@
+import os
+import sqlite3
+import threading
+
+
+class SQLiteStore:
+    """ Small local SQLite file shared by all the workers of the box (one connection per thread and per process) """
+
+    SCHEMA: str = ""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        """ Return the connection of the current thread, create it (and the schema) if necessary """
+
+        connection = getattr(self._local, "connection", None)
+        if connection is None or self._local.pid != os.getpid():
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(self.SCHEMA)
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+
+        return connection
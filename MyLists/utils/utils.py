@@ -7,6 +7,7 @@ from enum import Enum
 from typing import Dict, List, Type, Any, Union
 import pytz
 from flask import current_app
+from sqlalchemy.dialects import postgresql, sqlite
 from MyLists import db
 
 
@@ -62,6 +63,17 @@ def get_models_type(model_type: str) -> List[db.Model]:
     return models
 
 
+def upsert_increment(model: db.Model, keys: Dict, column: str, delta: int):
+    """ Add <delta> to the <column> of the <model> row matching the unique <keys>, or insert it with <column> =
+    <delta>, in one atomic <INSERT ... ON CONFLICT DO UPDATE> (safe between concurrent writers) """
+
+    insert = postgresql.insert if db.session.get_bind().dialect.name == "postgresql" else sqlite.insert
+
+    statement = (insert(model).values(**keys, **{column: delta})
+                 .on_conflict_do_update(index_elements=list(keys), set_={column: getattr(model, column) + delta}))
+    db.session.execute(statement)
+
+
 def get_level(total_time: float):
     """ Function that returns the level based on time in [minutes] """
     return (((400 + 80 * total_time) ** 0.5) - 20) / 40
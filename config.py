@@ -45,6 +45,32 @@ class Config:
     SECRET_IGDB = os.environ.get("SECRET_IGDB") or None
     IGDB_API_KEY = os.environ.get("IGDB_API_KEY") or None
 
+    # Outgoing HTTP client options (pooled sessions used for the third-party APIs)
+    HTTP_POOL_CONNECTIONS = int(os.environ.get("HTTP_POOL_CONNECTIONS") or "10")
+    HTTP_POOL_MAXSIZE = int(os.environ.get("HTTP_POOL_MAXSIZE") or "20")
+    HTTP_TIMEOUT = float(os.environ.get("HTTP_TIMEOUT") or "10")
+    HTTP_MAX_RETRIES = int(os.environ.get("HTTP_MAX_RETRIES") or "2")
+
+    # On-disk cache of the third-party API responses: endpoint -> TTL in seconds
+    HTTP_CACHE_ENABLED = as_bool(os.environ.get("HTTP_CACHE_ENABLED") or "yes")
+    HTTP_CACHE_PATH = os.environ.get("HTTP_CACHE_PATH") or os.path.join(basedir, "instance", "api_cache.db")
+    HTTP_CACHE_TTLS = {"search": 3600, "details": 3600, "jikan": 7 * 24 * 3600, "hltb": 7 * 24 * 3600}
+
+    # Rate limits shared by all the workers: provider -> (max calls, period in seconds)
+    RATE_LIMITS = {"tmdb": (40, 1), "igdb": (4, 1), "jikan": (1, 4), "google_books": (2, 1)}
+    RATE_LIMIT_PATH = os.environ.get("RATE_LIMIT_PATH") or os.path.join(basedir, "instance", "rate_limits.db")
+    RATE_LIMIT_MAX_WAIT = float(os.environ.get("RATE_LIMIT_MAX_WAIT") or "1")
+
+    # Cover pipeline: number of processes downloading and resizing the covers
+    COVER_WORKERS = int(os.environ.get("COVER_WORKERS") or "2")
+
+    # Media refresh engine: provider -> concurrent workers
+    REFRESH_WORKERS = {"tmdb": 8, "igdb": 4, "google_books": 2}
+    REFRESH_BATCH_SIZE = int(os.environ.get("REFRESH_BATCH_SIZE") or "50")
+
+    # Scheduled tasks: a failed (or crashed) run is resumed if it started less than this number of hours ago
+    TASK_RESUME_WINDOW = int(os.environ.get("TASK_RESUME_WINDOW") or "20")
+
     # Caching type
     CACHE_TYPE = os.environ.get("CACHE_TYPE") or "simple"
 
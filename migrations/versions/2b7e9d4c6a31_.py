@@ -0,0 +1,53 @@
+"""empty message
+
+Revision ID: 2b7e9d4c6a31
+Revises: 9c2d5e7a4b18
+Create Date: 2026-10-17 04:12:09.618237
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "2b7e9d4c6a31"
+down_revision = "9c2d5e7a4b18"
+branch_labels = None
+depends_on = None
+
+
+# Full-text search documents of each media type: (name, original name, people)
+SEARCH_DOCUMENTS = {
+    "series": ("m.original_name", ["SELECT group_concat(network, ' ') FROM series_network WHERE media_id = m.id",
+                                   "SELECT group_concat(name, ' ') FROM series_actors WHERE media_id = m.id"]),
+    "anime": ("m.original_name", ["SELECT group_concat(network, ' ') FROM anime_network WHERE media_id = m.id",
+                                  "SELECT group_concat(name, ' ') FROM anime_actors WHERE media_id = m.id"]),
+    "movies": ("m.original_name", ["SELECT m.director_name",
+                                   "SELECT group_concat(name, ' ') FROM movies_actors WHERE media_id = m.id"]),
+    "books": ("''", ["SELECT group_concat(name, ' ') FROM books_authors WHERE media_id = m.id"]),
+    "games": ("''", ["SELECT group_concat(name, ' ') FROM games_platforms WHERE media_id = m.id",
+                     "SELECT group_concat(name, ' ') FROM games_companies WHERE media_id = m.id"]),
+}
+
+
+def upgrade():
+    # SQLite FTS5 only, the other databases use the ILIKE search
+    if op.get_bind().dialect.name != "sqlite":
+        return
+
+    for media, (original_name, people) in SEARCH_DOCUMENTS.items():
+        op.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS {media}_search USING "
+                   f"fts5(name, original_name, people, tokenize='unicode61 remove_diacritics 2')")
+
+        people_doc = " || ' ' || ".join(f"coalesce(({query}), '')" for query in people)
+        op.execute(f"DELETE FROM {media}_search")
+        op.execute(f"INSERT INTO {media}_search (rowid, name, original_name, people) "
+                   f"SELECT m.id, m.name, {original_name}, {people_doc} FROM {media} m")
+
+
+def downgrade():
+    if op.get_bind().dialect.name != "sqlite":
+        return
+
+    for media in SEARCH_DOCUMENTS:
+        op.execute(f"DROP TABLE IF EXISTS {media}_search")
@@ -0,0 +1,30 @@
+"""empty message
+
+Revision ID: 3f1c2a7d9b10
+Revises: e2813654671e
+Create Date: 2026-10-16 20:12:31.518204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "3f1c2a7d9b10"
+down_revision = "e2813654671e"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('sync_checkpoint',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=50), nullable=False),
+    sa.Column('last_synced', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('name')
+    )
+
+
+def downgrade():
+    op.drop_table('sync_checkpoint')
@@ -0,0 +1,26 @@
+"""empty message
+
+Revision ID: 4d9b2f6e1a83
+Revises: f3a8c1e5d692
+Create Date: 2026-10-17 09:14:07.826531
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "4d9b2f6e1a83"
+down_revision = "f3a8c1e5d692"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('sync_checkpoint', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('failed_ids', sa.Text(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('sync_checkpoint', schema=None) as batch_op:
+        batch_op.drop_column('failed_ids')
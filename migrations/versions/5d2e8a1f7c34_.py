@@ -0,0 +1,48 @@
+"""empty message
+
+Revision ID: 5d2e8a1f7c34
+Revises: c51d7e93a6f2
+Create Date: 2026-10-16 23:58:41.127904
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = "5d2e8a1f7c34"
+down_revision = "c51d7e93a6f2"
+branch_labels = None
+depends_on = None
+
+
+# The <mediatype> enum type already exists (<user_last_update>)
+MEDIA_TYPES = ("SERIES", "ANIME", "MOVIES", "BOOKS", "GAMES")
+
+
+def upgrade():
+    op.create_table('time_spent_ledger',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('media_type', postgresql.ENUM(*MEDIA_TYPES, name='mediatype', create_type=False), nullable=False),
+    sa.Column('delta', sa.Float(), nullable=False),
+    sa.Column('timestamp', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('time_spent_ledger', schema=None) as batch_op:
+        batch_op.create_index('ix_time_spent_ledger_user_id_media_type', ['user_id', 'media_type'], unique=False)
+
+    # Open the ledger with the current time spent of each user
+    for media_type in MEDIA_TYPES:
+        column = f"time_spent_{media_type.lower()}"
+        op.execute(f"INSERT INTO time_spent_ledger (user_id, media_type, delta, timestamp) "
+                   f"SELECT id, '{media_type}', {column}, CURRENT_TIMESTAMP FROM \"user\" WHERE {column} != 0")
+
+
+def downgrade():
+    with op.batch_alter_table('time_spent_ledger', schema=None) as batch_op:
+        batch_op.drop_index('ix_time_spent_ledger_user_id_media_type')
+
+    op.drop_table('time_spent_ledger')
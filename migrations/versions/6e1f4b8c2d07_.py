@@ -0,0 +1,57 @@
+"""empty message
+
+Revision ID: 6e1f4b8c2d07
+Revises: d84b1f6e2a93
+Create Date: 2026-10-17 02:48:12.903514
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "6e1f4b8c2d07"
+down_revision = "d84b1f6e2a93"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('task_run',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=50), nullable=False),
+    sa.Column('status', sa.String(length=20), nullable=False),
+    sa.Column('started_at', sa.DateTime(), nullable=False),
+    sa.Column('ended_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('task_run', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_task_run_name'), ['name'], unique=False)
+
+    op.create_table('task_step_log',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('run_id', sa.Integer(), nullable=False),
+    sa.Column('step', sa.String(length=50), nullable=False),
+    sa.Column('status', sa.String(length=20), nullable=False),
+    sa.Column('started_at', sa.DateTime(), nullable=False),
+    sa.Column('ended_at', sa.DateTime(), nullable=True),
+    sa.Column('duration', sa.Float(), nullable=True),
+    sa.Column('rows', sa.Integer(), nullable=True),
+    sa.Column('api_calls', sa.Integer(), nullable=True),
+    sa.Column('error', sa.Text(), nullable=True),
+    sa.ForeignKeyConstraint(['run_id'], ['task_run.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('task_step_log', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_task_step_log_run_id'), ['run_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('task_step_log', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_task_step_log_run_id'))
+
+    op.drop_table('task_step_log')
+    with op.batch_alter_table('task_run', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_task_run_name'))
+
+    op.drop_table('task_run')
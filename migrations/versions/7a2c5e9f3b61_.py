@@ -0,0 +1,62 @@
+"""empty message
+
+Revision ID: 7a2c5e9f3b61
+Revises: 4d9b2f6e1a83
+Create Date: 2026-10-17 09:48:22.514093
+
+"""
+import os
+from alembic import op
+import sqlalchemy as sa
+from flask import current_app
+
+
+# revision identifiers, used by Alembic.
+revision = "7a2c5e9f3b61"
+down_revision = "4d9b2f6e1a83"
+branch_labels = None
+depends_on = None
+
+
+MEDIA_TYPES = ("series", "anime", "movies", "games", "books")
+COVER_FORMATS = ("avif", "webp", "jpg")
+COVER_SIZES = ("full", "thumb")
+
+
+def variant_formats(path: str) -> str:
+    """ Same as <MyLists.classes.Cover_pipeline._variant_formats> """
+
+    stem = path.rsplit(".", 1)[0]
+    return ",".join(fmt for fmt in COVER_FORMATS
+                    if all(os.path.exists(f"{stem}{'' if size == 'full' else f'_{size}'}.{fmt}")
+                           for size in COVER_SIZES))
+
+
+def upgrade():
+    for media_type in MEDIA_TYPES:
+        with op.batch_alter_table(media_type, schema=None) as batch_op:
+            batch_op.add_column(sa.Column('cover_formats', sa.String(length=30), nullable=True))
+
+    # Record the variants already written
+    connection = op.get_bind()
+    covers_dir = os.path.join(current_app.static_folder, "covers")
+    for media_type in MEDIA_TYPES:
+        image_covers = connection.execute(sa.text(f"SELECT DISTINCT image_cover FROM {media_type}")).scalars().all()
+
+        rows = []
+        for image_cover in image_covers:
+            directory = covers_dir if image_cover.startswith("store/") else os.path.join(covers_dir,
+                                                                                          f"{media_type}_covers")
+            cover_formats = variant_formats(os.path.join(directory, image_cover))
+            if cover_formats:
+                rows.append({"image_cover": image_cover, "cover_formats": cover_formats})
+
+        if rows:
+            connection.execute(sa.text(f"UPDATE {media_type} SET cover_formats = :cover_formats "
+                                       f"WHERE image_cover = :image_cover"), rows)
+
+
+def downgrade():
+    for media_type in reversed(MEDIA_TYPES):
+        with op.batch_alter_table(media_type, schema=None) as batch_op:
+            batch_op.drop_column('cover_formats')
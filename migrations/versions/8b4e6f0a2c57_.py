@@ -0,0 +1,71 @@
+"""empty message
+
+Revision ID: 8b4e6f0a2c57
+Revises: 3f1c2a7d9b10
+Create Date: 2026-10-16 21:03:47.209114
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "8b4e6f0a2c57"
+down_revision = "3f1c2a7d9b10"
+branch_labels = None
+depends_on = None
+
+
+# media table -> (user_last_update media type, notifications media type, details tables)
+MEDIA_TABLES = {
+    "series": ("SERIES", "serieslist", ["series_genre", "series_actors", "series_network",
+                                        "series_episodes_per_season"]),
+    "anime": ("ANIME", "animelist", ["anime_genre", "anime_actors", "anime_network", "anime_episodes_per_season"]),
+    "movies": ("MOVIES", "movieslist", ["movies_genre", "movies_actors"]),
+    "games": ("GAMES", "gameslist", ["games_genre", "games_companies", "games_platforms"]),
+    "books": ("BOOKS", "bookslist", ["books_genre", "books_authors"]),
+}
+
+
+def _merge_duplicates(conn, table: str, update_type: str, notif_type: str, details_tables: list):
+    """ Merge the media imported several times with the same <api_id> into the oldest one """
+
+    duplicates = conn.execute(sa.text(f"SELECT api_id, MIN(id) FROM {table} WHERE api_id IS NOT NULL "
+                                      f"GROUP BY api_id HAVING COUNT(*) > 1")).fetchall()
+
+    for api_id, keep_id in duplicates:
+        params = dict(api_id=api_id, keep_id=keep_id)
+        dup_ids = f"(SELECT id FROM {table} WHERE api_id = :api_id AND id != :keep_id)"
+
+        # Users lists and labels: drop the entries the user already has on the kept media, then re-point the others
+        conn.execute(sa.text(f"DELETE FROM {table}_list WHERE media_id IN {dup_ids} AND user_id IN "
+                             f"(SELECT user_id FROM {table}_list WHERE media_id = :keep_id)"), params)
+        conn.execute(sa.text(f"UPDATE {table}_list SET media_id = :keep_id WHERE media_id IN {dup_ids}"), params)
+        conn.execute(sa.text(f"DELETE FROM {table}_labels WHERE media_id IN {dup_ids} AND EXISTS (SELECT 1 FROM "
+                             f"{table}_labels AS l WHERE l.media_id = :keep_id AND l.user_id = {table}_labels.user_id "
+                             f"AND l.label = {table}_labels.label)"), params)
+        conn.execute(sa.text(f"UPDATE {table}_labels SET media_id = :keep_id WHERE media_id IN {dup_ids}"), params)
+
+        # History and notifications
+        conn.execute(sa.text(f"UPDATE user_last_update SET media_id = :keep_id WHERE media_type = :update_type "
+                             f"AND media_id IN {dup_ids}"), dict(params, update_type=update_type))
+        conn.execute(sa.text(f"UPDATE notifications SET media_id = :keep_id WHERE media_type = :notif_type "
+                             f"AND media_id IN {dup_ids}"), dict(params, notif_type=notif_type))
+
+        # Details of the duplicates, then the duplicates themselves
+        for details_table in details_tables:
+            conn.execute(sa.text(f"DELETE FROM {details_table} WHERE media_id IN {dup_ids}"), params)
+        conn.execute(sa.text(f"DELETE FROM {table} WHERE api_id = :api_id AND id != :keep_id"), params)
+
+
+def upgrade():
+    conn = op.get_bind()
+
+    for table, (update_type, notif_type, details_tables) in MEDIA_TABLES.items():
+        _merge_duplicates(conn, table, update_type, notif_type, details_tables)
+        op.create_index(f"ix_{table}_api_id", table, ["api_id"], unique=True)
+
+
+def downgrade():
+    for table in reversed(list(MEDIA_TABLES)):
+        op.drop_index(f"ix_{table}_api_id", table_name=table)
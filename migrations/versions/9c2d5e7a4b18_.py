@@ -0,0 +1,200 @@
+"""empty message
+
+Revision ID: 9c2d5e7a4b18
+Revises: 6e1f4b8c2d07
+Create Date: 2026-10-17 03:31:45.276180
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "9c2d5e7a4b18"
+down_revision = "6e1f4b8c2d07"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('series_list', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_series_list_media_id'), ['media_id'], unique=False)
+        batch_op.create_index('ix_series_list_user_id_media_id', ['user_id', 'media_id'], unique=False)
+        batch_op.create_index('ix_series_list_user_id_status', ['user_id', 'status'], unique=False)
+
+    with op.batch_alter_table('series_genre', schema=None) as batch_op:
+        batch_op.create_index('ix_series_genre_media_id_genre', ['media_id', 'genre'], unique=False)
+
+    with op.batch_alter_table('series_episodes_per_season', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_series_episodes_per_season_media_id'), ['media_id'], unique=False)
+
+    with op.batch_alter_table('series_network', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_series_network_media_id'), ['media_id'], unique=False)
+
+    with op.batch_alter_table('series_actors', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_series_actors_media_id'), ['media_id'], unique=False)
+
+    with op.batch_alter_table('series_labels', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_series_labels_media_id'), ['media_id'], unique=False)
+        batch_op.create_index('ix_series_labels_user_id_label', ['user_id', 'label', 'media_id'], unique=False)
+
+    with op.batch_alter_table('anime_list', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_anime_list_media_id'), ['media_id'], unique=False)
+        batch_op.create_index('ix_anime_list_user_id_media_id', ['user_id', 'media_id'], unique=False)
+        batch_op.create_index('ix_anime_list_user_id_status', ['user_id', 'status'], unique=False)
+
+    with op.batch_alter_table('anime_genre', schema=None) as batch_op:
+        batch_op.create_index('ix_anime_genre_media_id_genre', ['media_id', 'genre'], unique=False)
+
+    with op.batch_alter_table('anime_episodes_per_season', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_anime_episodes_per_season_media_id'), ['media_id'], unique=False)
+
+    with op.batch_alter_table('anime_network', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_anime_network_media_id'), ['media_id'], unique=False)
+
+    with op.batch_alter_table('anime_actors', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_anime_actors_media_id'), ['media_id'], unique=False)
+
+    with op.batch_alter_table('anime_labels', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_anime_labels_media_id'), ['media_id'], unique=False)
+        batch_op.create_index('ix_anime_labels_user_id_label', ['user_id', 'label', 'media_id'], unique=False)
+
+    with op.batch_alter_table('movies_list', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_movies_list_media_id'), ['media_id'], unique=False)
+        batch_op.create_index('ix_movies_list_user_id_media_id', ['user_id', 'media_id'], unique=False)
+        batch_op.create_index('ix_movies_list_user_id_status', ['user_id', 'status'], unique=False)
+
+    with op.batch_alter_table('movies_genre', schema=None) as batch_op:
+        batch_op.create_index('ix_movies_genre_media_id_genre', ['media_id', 'genre'], unique=False)
+
+    with op.batch_alter_table('movies_actors', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_movies_actors_media_id'), ['media_id'], unique=False)
+
+    with op.batch_alter_table('movies_labels', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_movies_labels_media_id'), ['media_id'], unique=False)
+        batch_op.create_index('ix_movies_labels_user_id_label', ['user_id', 'label', 'media_id'], unique=False)
+
+    with op.batch_alter_table('books_list', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_books_list_media_id'), ['media_id'], unique=False)
+        batch_op.create_index('ix_books_list_user_id_media_id', ['user_id', 'media_id'], unique=False)
+        batch_op.create_index('ix_books_list_user_id_status', ['user_id', 'status'], unique=False)
+
+    with op.batch_alter_table('books_genre', schema=None) as batch_op:
+        batch_op.create_index('ix_books_genre_media_id_genre', ['media_id', 'genre'], unique=False)
+
+    with op.batch_alter_table('books_authors', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_books_authors_media_id'), ['media_id'], unique=False)
+
+    with op.batch_alter_table('books_labels', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_books_labels_media_id'), ['media_id'], unique=False)
+        batch_op.create_index('ix_books_labels_user_id_label', ['user_id', 'label', 'media_id'], unique=False)
+
+    with op.batch_alter_table('games_list', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_games_list_media_id'), ['media_id'], unique=False)
+        batch_op.create_index('ix_games_list_user_id_media_id', ['user_id', 'media_id'], unique=False)
+        batch_op.create_index('ix_games_list_user_id_status', ['user_id', 'status'], unique=False)
+
+    with op.batch_alter_table('games_genre', schema=None) as batch_op:
+        batch_op.create_index('ix_games_genre_media_id_genre', ['media_id', 'genre'], unique=False)
+
+    with op.batch_alter_table('games_platforms', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_games_platforms_media_id'), ['media_id'], unique=False)
+
+    with op.batch_alter_table('games_companies', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_games_companies_media_id'), ['media_id'], unique=False)
+
+    with op.batch_alter_table('games_labels', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_games_labels_media_id'), ['media_id'], unique=False)
+        batch_op.create_index('ix_games_labels_user_id_label', ['user_id', 'label', 'media_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('games_labels', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_games_labels_media_id'))
+        batch_op.drop_index('ix_games_labels_user_id_label')
+
+    with op.batch_alter_table('games_companies', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_games_companies_media_id'))
+
+    with op.batch_alter_table('games_platforms', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_games_platforms_media_id'))
+
+    with op.batch_alter_table('games_genre', schema=None) as batch_op:
+        batch_op.drop_index('ix_games_genre_media_id_genre')
+
+    with op.batch_alter_table('games_list', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_games_list_media_id'))
+        batch_op.drop_index('ix_games_list_user_id_media_id')
+        batch_op.drop_index('ix_games_list_user_id_status')
+
+    with op.batch_alter_table('books_labels', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_books_labels_media_id'))
+        batch_op.drop_index('ix_books_labels_user_id_label')
+
+    with op.batch_alter_table('books_authors', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_books_authors_media_id'))
+
+    with op.batch_alter_table('books_genre', schema=None) as batch_op:
+        batch_op.drop_index('ix_books_genre_media_id_genre')
+
+    with op.batch_alter_table('books_list', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_books_list_media_id'))
+        batch_op.drop_index('ix_books_list_user_id_media_id')
+        batch_op.drop_index('ix_books_list_user_id_status')
+
+    with op.batch_alter_table('movies_labels', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_movies_labels_media_id'))
+        batch_op.drop_index('ix_movies_labels_user_id_label')
+
+    with op.batch_alter_table('movies_actors', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_movies_actors_media_id'))
+
+    with op.batch_alter_table('movies_genre', schema=None) as batch_op:
+        batch_op.drop_index('ix_movies_genre_media_id_genre')
+
+    with op.batch_alter_table('movies_list', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_movies_list_media_id'))
+        batch_op.drop_index('ix_movies_list_user_id_media_id')
+        batch_op.drop_index('ix_movies_list_user_id_status')
+
+    with op.batch_alter_table('anime_labels', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_anime_labels_media_id'))
+        batch_op.drop_index('ix_anime_labels_user_id_label')
+
+    with op.batch_alter_table('anime_actors', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_anime_actors_media_id'))
+
+    with op.batch_alter_table('anime_network', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_anime_network_media_id'))
+
+    with op.batch_alter_table('anime_episodes_per_season', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_anime_episodes_per_season_media_id'))
+
+    with op.batch_alter_table('anime_genre', schema=None) as batch_op:
+        batch_op.drop_index('ix_anime_genre_media_id_genre')
+
+    with op.batch_alter_table('anime_list', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_anime_list_media_id'))
+        batch_op.drop_index('ix_anime_list_user_id_media_id')
+        batch_op.drop_index('ix_anime_list_user_id_status')
+
+    with op.batch_alter_table('series_labels', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_series_labels_media_id'))
+        batch_op.drop_index('ix_series_labels_user_id_label')
+
+    with op.batch_alter_table('series_actors', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_series_actors_media_id'))
+
+    with op.batch_alter_table('series_network', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_series_network_media_id'))
+
+    with op.batch_alter_table('series_episodes_per_season', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_series_episodes_per_season_media_id'))
+
+    with op.batch_alter_table('series_genre', schema=None) as batch_op:
+        batch_op.drop_index('ix_series_genre_media_id_genre')
+
+    with op.batch_alter_table('series_list', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_series_list_media_id'))
+        batch_op.drop_index('ix_series_list_user_id_media_id')
+        batch_op.drop_index('ix_series_list_user_id_status')
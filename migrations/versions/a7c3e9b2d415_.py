@@ -0,0 +1,74 @@
+"""empty message
+
+Revision ID: a7c3e9b2d415
+Revises: 5d2e8a1f7c34
+Create Date: 2026-10-17 00:21:37.458120
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = "a7c3e9b2d415"
+down_revision = "5d2e8a1f7c34"
+branch_labels = None
+depends_on = None
+
+
+# The <mediatype> enum type already exists (<user_last_update>)
+MEDIA_TYPES = ("SERIES", "ANIME", "MOVIES", "BOOKS", "GAMES")
+
+# (kind, table, key column, media id column, extra condition) of the counted sources, as in
+# <GlobalStats.get_counter_sources>
+COUNTER_SOURCES = {
+    "SERIES": [("genre", "series_genre", "genre", "media_id", ""),
+               ("actor", "series_actors", "name", "media_id", "")],
+    "ANIME": [("genre", "anime_genre", "genre", "media_id", ""),
+              ("actor", "anime_actors", "name", "media_id", "")],
+    "MOVIES": [("genre", "movies_genre", "genre", "media_id", ""),
+               ("actor", "movies_actors", "name", "media_id", ""),
+               ("director", "movies", "director_name", "id", "")],
+    "BOOKS": [("genre", "books_genre", "genre", "media_id", ""),
+              ("author", "books_authors", "name", "media_id", "")],
+    "GAMES": [("genre", "games_genre", "genre", "media_id", ""),
+              ("developer", "games_companies", "name", "media_id", " AND s.developer = TRUE")],
+}
+
+
+def upgrade():
+    op.create_table('global_stats_counter',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('media_type', postgresql.ENUM(*MEDIA_TYPES, name='mediatype', create_type=False), nullable=False),
+    sa.Column('kind', sa.String(length=20), nullable=False),
+    sa.Column('key', sa.String(length=150), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('media_type', 'kind', 'key')
+    )
+    with op.batch_alter_table('global_stats_counter', schema=None) as batch_op:
+        batch_op.create_index('ix_global_stats_counter_top', ['media_type', 'kind', 'count'], unique=False)
+
+    # Fill the counters from the lists (same as <GlobalStats.rebuild_counters>)
+    for media_type, sources in COUNTER_SOURCES.items():
+        media_list = f"{media_type.lower()}_list"
+
+        for kind, table, key, media_id, condition in sources:
+            op.execute(f"INSERT INTO global_stats_counter (media_type, kind, key, count) "
+                       f"SELECT '{media_type}', '{kind}', s.{key}, COUNT(*) FROM {table} s "
+                       f"JOIN {media_list} l ON l.media_id = s.{media_id} "
+                       f"WHERE s.{key} != 'Unknown'{condition} GROUP BY s.{key}")
+
+        # Media in the lists, dropped apart
+        kind = "CASE WHEN l.status = 'DROPPED' THEN 'dropped' ELSE 'media' END"
+        op.execute(f"INSERT INTO global_stats_counter (media_type, kind, key, count) "
+                   f"SELECT '{media_type}', {kind}, CAST(l.media_id AS VARCHAR(150)), COUNT(*) FROM {media_list} l "
+                   f"GROUP BY l.media_id, {kind}")
+
+
+def downgrade():
+    with op.batch_alter_table('global_stats_counter', schema=None) as batch_op:
+        batch_op.drop_index('ix_global_stats_counter_top')
+
+    op.drop_table('global_stats_counter')
@@ -0,0 +1,30 @@
+"""empty message
+
+Revision ID: c51d7e93a6f2
+Revises: 8b4e6f0a2c57
+Create Date: 2026-10-16 22:18:05.664391
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "c51d7e93a6f2"
+down_revision = "8b4e6f0a2c57"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('cover_store',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=100), nullable=False),
+    sa.Column('ref_count', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('name')
+    )
+
+
+def downgrade():
+    op.drop_table('cover_store')
@@ -0,0 +1,28 @@
+"""empty message
+
+Revision ID: c5e1a9d7b248
+Revises: 7a2c5e9f3b61
+Create Date: 2026-10-17 11:02:43.518207
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "c5e1a9d7b248"
+down_revision = "7a2c5e9f3b61"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('task_run', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('host', sa.String(length=100), nullable=True))
+        batch_op.add_column(sa.Column('pid', sa.Integer(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('task_run', schema=None) as batch_op:
+        batch_op.drop_column('pid')
+        batch_op.drop_column('host')
@@ -0,0 +1,64 @@
+"""empty message
+
+Revision ID: d84b1f6e2a93
+Revises: a7c3e9b2d415
+Create Date: 2026-10-17 00:48:12.903417
+
+"""
+import json
+from datetime import datetime
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "d84b1f6e2a93"
+down_revision = "a7c3e9b2d415"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('notifications', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('season', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('episode', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('release_date', sa.Date(), nullable=True))
+        batch_op.create_index('ix_notifications_media_user', ['media_type', 'media_id', 'user_id', 'timestamp'],
+                              unique=False)
+        batch_op.create_index('ix_notifications_user_id_timestamp', ['user_id', 'timestamp'], unique=False)
+
+    # Fill the new columns from the payloads of the release notifications
+    notifications = sa.table('notifications', sa.column('id', sa.Integer), sa.column('season', sa.Integer),
+                             sa.column('episode', sa.Integer), sa.column('release_date', sa.Date),
+                             sa.column('media_type', sa.String), sa.column('payload_json', sa.Text))
+
+    connection = op.get_bind()
+    rows = connection.execute(sa.select(notifications.c.id, notifications.c.payload_json)
+                              .where(notifications.c.media_type.isnot(None))).all()
+
+    updates = []
+    for notif_id, payload_json in rows:
+        try:
+            payload = json.loads(payload_json)
+            release_date = datetime.strptime(payload["release_date"], "%b %d %Y").date()
+        except (TypeError, ValueError, KeyError):
+            continue
+
+        season, episode = payload.get("season"), payload.get("episode")
+        updates.append(dict(notif_id=notif_id, release_date=release_date,
+                            season=int(season) if season is not None else None,
+                            episode=int(episode) if episode is not None else None))
+
+    if updates:
+        connection.execute(notifications.update().where(notifications.c.id == sa.bindparam('notif_id'))
+                           .values(season=sa.bindparam('season'), episode=sa.bindparam('episode'),
+                                   release_date=sa.bindparam('release_date')), updates)
+
+
+def downgrade():
+    with op.batch_alter_table('notifications', schema=None) as batch_op:
+        batch_op.drop_index('ix_notifications_user_id_timestamp')
+        batch_op.drop_index('ix_notifications_media_user')
+        batch_op.drop_column('release_date')
+        batch_op.drop_column('episode')
+        batch_op.drop_column('season')
@@ -0,0 +1,72 @@
+"""empty message
+
+Revision ID: f3a8c1e5d692
+Revises: 2b7e9d4c6a31
+Create Date: 2026-10-17 05:02:51.340716
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "f3a8c1e5d692"
+down_revision = "2b7e9d4c6a31"
+branch_labels = None
+depends_on = None
+
+
+MEDIA_TYPES = ("series", "anime", "movies", "games", "books")
+
+
+def get_level(total_time: float) -> float:
+    """ Same as <MyLists.utils.utils.get_level> """
+    return (((400 + 80 * total_time) ** 0.5) - 20) / 40
+
+
+def upgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('profile_level', sa.Integer(), nullable=False, server_default="0"))
+        for media_type in MEDIA_TYPES:
+            batch_op.add_column(sa.Column(f'{media_type}_level', sa.Integer(), nullable=False, server_default="0"))
+        batch_op.create_index(batch_op.f('ix_user_profile_level'), ['profile_level'], unique=False)
+
+    with op.batch_alter_table('ranks', schema=None) as batch_op:
+        batch_op.create_index('ix_ranks_type_level', ['type', 'level'], unique=False)
+
+    # Backfill the levels from the time spent (see <User.update_levels>)
+    connection = op.get_bind()
+    users = connection.execute(sa.text(
+        "SELECT id, time_spent_series, time_spent_anime, time_spent_movies, time_spent_games, time_spent_books, "
+        "add_anime, add_games, add_books FROM user"
+    )).mappings().all()
+
+    rows = []
+    for user in users:
+        row = {"id": user["id"]}
+        for media_type in MEDIA_TYPES:
+            row[f"{media_type}_level"] = int(f"{get_level(user[f'time_spent_{media_type}'] or 0):.2f}".split(".")[0])
+
+        total_time = (user["time_spent_series"] or 0) + (user["time_spent_movies"] or 0)
+        for media_type in ("anime", "books", "games"):
+            if user[f"add_{media_type}"]:
+                total_time += user[f"time_spent_{media_type}"] or 0
+        row["profile_level"] = int(get_level(total_time))
+        rows.append(row)
+
+    if rows:
+        connection.execute(sa.text(
+            "UPDATE user SET profile_level = :profile_level, series_level = :series_level, anime_level = :anime_level, "
+            "movies_level = :movies_level, games_level = :games_level, books_level = :books_level WHERE id = :id"
+        ), rows)
+
+
+def downgrade():
+    with op.batch_alter_table('ranks', schema=None) as batch_op:
+        batch_op.drop_index('ix_ranks_type_level')
+
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_user_profile_level'))
+        for media_type in reversed(MEDIA_TYPES):
+            batch_op.drop_column(f'{media_type}_level')
+        batch_op.drop_column('profile_level')